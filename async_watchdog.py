@@ -0,0 +1,622 @@
+import asyncio
+from time import time
+
+import ujson as json
+from redis.exceptions import NoScriptError
+
+from config.settings import Watcher
+from config.trading_map import Mapping
+from common.calc import get_unixtime_ms
+from common.metrics import Metrics, start_server
+from common.ticks import TickConflator
+from common.tape import TickTapeWriter
+from common.log import get_logger
+from config.tuning import WatcherKeys, PriceBookConfig, TickBatchConfig, FireConfig, LineConfig, TimeConfig, \
+    WarmStartConfig, IntakeConfig, MetricsConfig, TapeConfig, CandleConfig, TrailConfig
+from database.registry import ConnectionRegistry
+from watchdog import GetPriceProc, NewOrderProc, TimeWatcher, PriceWatcher, LineWatcher, decode_orders
+
+log = get_logger('async_watchdog')
+
+
+class CommandBuffer(object):
+    """
+    BaseDb 의 p= 인자로 sync pipeline 대신 전달하여 redis 명령을 기록만 함
+    기록된 명령은 AsyncBatcher 가 async pipeline 으로 실행
+    """
+    def __init__(self):
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __bool__(self):
+        # (p or self.client) 에서 비어있어도 buffer 를 사용하도록
+        return True
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+
+class AsyncBatcher(object):
+    """
+    같은 event loop 차례에 여러 task 가 제출한 CommandBuffer 를 pipeline 한번으로 실행하고
+    결과를 buffer 별로 나누어 반환
+    """
+    def __init__(self, client, scripts):
+        self.client = client
+        self.scripts = scripts  # lua script (sync Script, EVALSHA 의 sha 와 source)
+        self.pending = []
+        self.flushes = 0
+        self.tasks = set()  # 실행중인 flush task, loop 는 task 를 weak reference 로만 가지고 있음
+
+    async def load_scripts(self):
+        for script in self.scripts:
+            script.sha = await self.client.script_load(script.script)
+
+    async def execute(self, buf):
+        """
+        :return: buffer 의 명령 순서대로 결과, 실패한 명령은 Exception 객체
+        """
+        if not len(buf):
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((buf, future))
+        if len(self.pending) == 1:
+            loop.call_soon(self.start_flush, loop)
+        return await future
+
+    def start_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self.tasks.add(task)
+        task.add_done_callback(self.flushed)
+
+    def flushed(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error('ASYNC_FLUSH_ERROR', error=str(task.exception()))
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        try:
+            await self.run_batch(batch)
+        finally:
+            # 결과를 나누는 중 실패하거나 취소되어도 기다리는 task 가 멈추지 않도록
+            for buf, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError('pipeline flush failed'))
+
+    async def run_batch(self, batch):
+        commands = [command for buf, future in batch for command in buf.commands]
+        try:
+            res = await self.run(commands)
+            missing = [i for i, row in enumerate(res) if isinstance(row, NoScriptError)]
+            if missing:
+                # redis 재시작 등으로 script cache 가 비었으면 다시 등록 후 해당 명령만 재실행
+                await self.load_scripts()
+                for i, row in zip(missing, await self.run([commands[i] for i in missing])):
+                    res[i] = row
+        except Exception as e:
+            for buf, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.flushes += 1
+        start = 0
+        for buf, future in batch:
+            if not future.done():
+                future.set_result(res[start:start + len(buf)])
+            start += len(buf)
+
+    async def run(self, commands):
+        pipe = self.client.pipeline(transaction=False)
+        for name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        return await pipe.execute(raise_on_error=False)
+
+
+class AsyncWatchDog(object):
+    """
+    GetPriceProc, NewOrderProc, TimeWatcher, PriceWatcher, LineWatcher 를 한 process 의 asyncio task 로 실행
+    role 객체의 판단 로직을 그대로 사용하고 ticksize, trigger book, tick 병합 상태는 process 간 전달 없이 공유,
+    redis 기록은 CommandBuffer 에 모아 AsyncBatcher 가 여러 task 의 요청을 pipeline 한번으로 실행
+    (strategy 주문 삭제시 indicator 조회, candle 마감시 indicator 판단 등 조회가 섞인 드문 경로는
+    asyncio.to_thread 에서 sync client 로 실행하여 event loop 를 막지 않음)
+    """
+    def __init__(self):
+        self.get_price = GetPriceProc()
+        self.new_order_proc = NewOrderProc()
+        self.time_proc = TimeWatcher()
+        self.price_watcher = PriceWatcher(0)
+        self.line_watcher = LineWatcher()
+        self.line_watcher.ticksize = self.new_order_proc.ticksize
+        self.conflator = TickConflator()  # get_price 가 쌓고 price_watcher 가 가져감
+        self.metrics = Metrics('asyncio')
+        self.client = None
+        self.batcher = None
+        self.ticks_ready = None
+        self.line_wake = None
+        self.time_wake = None
+
+    def run(self):
+        log.info('ASYNC_WATCHDOG_START')
+        asyncio.run(self.main())
+
+    async def main(self):
+        self.client = ConnectionRegistry.aredis()
+        self.batcher = AsyncBatcher(self.client, [self.price_watcher.fire_script, self.price_watcher.remove_script,
+                                                  self.price_watcher.trail_script])
+        await self.batcher.load_scripts()
+        self.ticks_ready = asyncio.Event()
+        self.line_wake = asyncio.Event()
+        self.time_wake = asyncio.Event()
+        if MetricsConfig.ENABLED:
+            start_server(MetricsConfig.HOST, MetricsConfig.PORT, self.collect_metrics)
+        if TapeConfig.RECORD_PATH:
+            self.get_price.tape = TickTapeWriter(TapeConfig.RECORD_PATH, TapeConfig.MAX_SYMBOLS)
+        await asyncio.to_thread(self.new_order_proc.db_migrate_indicator_list)
+        self.price_watcher.start_candles()
+        try:
+            await asyncio.gather(self.feed(),
+                                 self.loop('get_price', self.get_price_step),
+                                 self.loop('price_watcher', self.price_step),
+                                 self.loop('new_order_proc', self.order_step),
+                                 self.loop('time_proc', self.time_step),
+                                 self.loop('line_watcher', self.line_step),
+                                 self.warm_start())
+        finally:
+            if self.get_price.tape is not None:
+                self.get_price.tape.close()
+            await self.client.close()
+
+    def collect_metrics(self):
+        return [self.metrics.snapshot()] + [role.metrics.snapshot() for role in (
+            self.get_price, self.new_order_proc, self.time_proc, self.price_watcher, self.line_watcher)]
+
+    async def loop(self, name, step):
+        """
+        role 한 단계를 반복 실행, 예외는 출력 후 계속
+        """
+        while True:
+            try:
+                await step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error('ASYNC_TASK_ERROR', _key=name, task=name, error=str(e))
+                self.metrics.inc('watcher_task_errors_total', target=name)
+                await asyncio.sleep(1)
+
+    async def execute(self, buf):
+        res = await self.batcher.execute(buf)
+        for row in res:
+            if isinstance(row, Exception):
+                log.error('ASYNC_PIPELINE_ERROR', error=str(row))
+        return res
+
+    @staticmethod
+    async def wait(event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    async def pop_batch(self, _key, size, timeout):
+        """
+        db_get_price_batch 와 같은 방식으로 list 에서 최대 size 건 조회
+        """
+        first = await self.client.blpop(_key, timeout=timeout)
+        if not first:
+            return []
+        if size <= 1:
+            return [first[1]]
+        p = self.client.pipeline(transaction=True)
+        p.lrange(_key, 0, size - 2)
+        p.ltrim(_key, size - 1, -1)
+        rest, _ = await p.execute()
+        return [first[1]] + rest
+
+    async def feed(self):
+        """
+        BOOK, LINE, TIME change feed 를 하나의 pub/sub 연결로 받아 각 role 의 local 상태에 반영
+        (다시) subscribe 하면 각 role 이 다음 차례에 전체 재동기화
+        """
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(WatcherKeys.BOOK_CHANNEL, WatcherKeys.LINE_CHANNEL, WatcherKeys.TIME_CHANNEL)
+                self.price_watcher.book_synced_at = 0
+                self.line_watcher.reconciled_at = 0
+                self.time_proc.reconciled_at = 0
+                self.line_wake.set()
+                self.time_wake.set()
+                while True:
+                    msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if msg is not None and msg['type'] == 'message':
+                        await self.apply_feed(msg['channel'], json.loads(msg['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error('CHANGE_FEED_ERROR', error=str(e))
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def apply_feed(self, channel, ops):
+        if channel == WatcherKeys.BOOK_CHANNEL:
+            for op in ops:
+                self.price_watcher.book.apply(op)
+                self.price_watcher.trails.apply(op)
+        elif channel == WatcherKeys.LINE_CHANNEL:
+            await self.seed_last_price(self.line_watcher.apply_ops(ops))
+            self.line_wake.set()
+        elif channel == WatcherKeys.TIME_CHANNEL:
+            self.time_proc.apply_ops(ops)
+            self.time_wake.set()
+
+    async def get_price_step(self):
+        rows = await self.pop_batch(Watcher.PRICE_QUEUE, TickBatchConfig.BATCH_SIZE, TickBatchConfig.POP_TIMEOUT)
+        _now = time()
+        for row in rows:
+            tick = json.loads(row)
+            _symbol, price = str(tick['symbol']), float(tick['price'])
+            self.get_price.metrics.inc('watcher_ticks_total', symbol=_symbol)
+            self.get_price.record(_symbol, price, _now)
+            self.conflator.add(_symbol, price, _now)
+        self.get_price.stats['ticks'] += len(rows)
+        if self.conflator.pending:
+            self.get_price.stats['batches'] += 1
+            self.ticks_ready.set()
+        buf = CommandBuffer()
+        self.get_price.set_stats(_now, p=buf)
+        await self.execute(buf)
+
+    async def load_book(self, symbols):
+        watcher = self.price_watcher
+        p = self.client.pipeline(transaction=False)
+        keys = [(symbol, direction) for symbol in symbols for direction in (1, -1)]
+        for symbol, direction in keys:
+            p.zrange(Watcher.WATCHER_LIST.format(symbol, direction), 0, -1, withscores=True)
+        if TrailConfig.ENABLED:
+            watcher.trail_request(symbols, p)
+        rows = await p.execute()
+        for (symbol, direction), items in zip(keys, rows):
+            watcher.book.load(symbol, direction, items)
+        if TrailConfig.ENABLED:
+            watcher.set_trails(symbols, watcher.trail_result(symbols, rows[len(keys):]))
+
+    async def price_step(self):
+        await self.ticks_ready.wait()
+        self.ticks_ready.clear()
+        merged, self.conflator = self.conflator, TickConflator()
+        watcher = self.price_watcher
+        if time() - watcher.book_synced_at > PriceBookConfig.RESYNC_SEC:
+            symbols = list(watcher.book.loaded)
+            await self.flush_trails(limit=None)
+            watcher.book.clear()
+            watcher.trails.clear()
+            watcher.book_synced_at = time()
+            if symbols:
+                await self.load_book(symbols)
+        missing = [_symbol for _symbol in merged.pending if _symbol not in watcher.book.loaded]
+        if missing:
+            await self.load_book(missing)
+
+        _now = time()
+        await self.update_trails(merged.pending.items())
+        requests = []
+        for _symbol, (last, high, low, ts, count) in merged.pending.items():
+            requests.extend(watcher.check_price(_symbol, last, high, low) or [])
+            watcher.stats['lag'] = max(watcher.stats['lag'], _now - ts)
+        decided = time()
+        for last, high, low, ts, count in merged.pending.values():
+            watcher.metrics.observe('watcher_tick_to_decision_seconds', decided - ts)
+        if requests:
+            await self.fire(requests, decided)
+        await self.update_candles([(_symbol, last, high, low, ts, count)
+                                   for _symbol, (last, high, low, ts, count) in merged.pending.items()])
+        watcher.stats['batches'] += 1
+        watcher.stats['symbols'] += len(merged)
+        watcher.metrics.inc('watcher_scanned_symbols_total', len(merged))
+
+        if _now - watcher.stats_at > TickBatchConfig.STATS_SEC:
+            watcher.stats_at = _now
+            watcher.set_book_metrics()
+            buf = CommandBuffer()
+            watcher.db_set_stats(WatcherKeys.INGEST_STATS, {'consumer_batches_0': watcher.stats['batches'],
+                                                            'consumer_symbols_0': watcher.stats['symbols'],
+                                                            'max_lag_ms_0': int(watcher.stats['lag'] * 1000)}, p=buf)
+            watcher.stats['lag'] = 0
+            await self.execute(buf)
+
+    async def update_trails(self, items):
+        """
+        PriceWatcher.update_trails 와 같은 처리
+        """
+        watcher = self.price_watcher
+        if not watcher.trails:
+            return
+        orders, sides = watcher.trail_orders(items)
+        if orders:
+            buf = CommandBuffer()
+            watcher.db_post_orders(orders, p=buf)
+            res = (await self.execute(buf))[0]
+            res = [] if isinstance(res, Exception) else res
+            if res:
+                log.info('POST_RES', _limit=False, members=res)
+            watcher.trail_posted(sides, res)
+        if time() - watcher.trails_flushed_at > TrailConfig.FLUSH_SEC:
+            await self.flush_trails()
+
+    async def flush_trails(self, limit=TrailConfig.MAX_WRITES):
+        """
+        PriceWatcher.flush_trails 와 같은 처리
+        """
+        watcher = self.price_watcher
+        writes = watcher.trail_writes(limit)
+        if not writes:
+            return
+        buf = CommandBuffer()
+        watcher.db_set_trail_stops(writes, p=buf)
+        res = await self.execute(buf)
+        watcher.trail_written(writes, sum(row for row in res if not isinstance(row, Exception)))
+
+    async def update_candles(self, ticks):
+        """
+        PriceWatcher.update_candles 와 같은 처리, 구독 조회와 indicator 판단 (주문 조회, POST_ORDER 등록) 은 thread 에서 실행
+        """
+        watcher = self.price_watcher
+        if watcher.candles is None:
+            return
+        if time() - watcher.candles_synced_at > CandleConfig.SUBSCRIPTION_SEC:
+            watcher.subscribe_candles(await asyncio.to_thread(watcher.db_get_indicator_klines))
+        for _symbol_kline, candles in watcher.close_candles(ticks).items():
+            await asyncio.to_thread(watcher.indicator_watcher.on_candles, _symbol_kline, candles)
+
+    async def fire(self, requests, decided):
+        """
+        PriceWatcher.fire_many 와 같은 처리, 다른 task 의 기록과 같은 pipeline 으로 실행
+        """
+        watcher = self.price_watcher
+        buf = CommandBuffer()
+        if FireConfig.SERVER_SIDE:
+            for _symbol, direction, price in requests:
+                watcher.fire_request(_symbol, direction, price, buf)
+            res = await self.execute(buf)
+            watcher.metrics.observe('watcher_decision_to_post_seconds', time() - decided)
+            watcher.fired(requests, watcher.fire_result([([], []) if isinstance(row, Exception) else row for row in res]))
+            return
+
+        # load 되지 않은 symbol (book 조회 실패) 은 fire script 로 처리
+        orders, sides, unloaded = watcher.crossing_orders(requests)
+        if orders:
+            watcher.db_post_orders(orders, p=buf)
+        for _symbol, direction, price in unloaded:
+            watcher.fire_request(_symbol, direction, price, buf)
+        res = await self.execute(buf)
+        watcher.metrics.observe('watcher_decision_to_post_seconds', time() - decided)
+        if orders and not isinstance(res[0], Exception):
+            if res[0]:
+                log.info('POST_RES', _limit=False, members=res[0])
+            watcher.posted(sides, res[0])
+        if unloaded:
+            watcher.fired(unloaded, watcher.fire_result([([], []) if isinstance(row, Exception) else row
+                                                         for row in res[1 if orders else 0:]]))
+
+    async def pop_orders(self):
+        """
+        db_get_orders 와 같은 방식으로 신규 주문 조회
+        """
+        ids = await self.pop_batch(Watcher.NEW_ORDER, IntakeConfig.BATCH_SIZE, IntakeConfig.POP_TIMEOUT)
+        if not ids:
+            return []
+        ids = list(dict.fromkeys(reversed(ids)))[::-1]
+        orders = []
+        for _id, order_detail in zip(ids, await self.client.hmget(Watcher.ORDER_DETAIL, *ids)):
+            if order_detail is None:
+                log.warning('ORDER_NOT_FOUND', key=Watcher.ORDER_DETAIL, id=_id)
+                continue
+            orders.append((_id, json.loads(order_detail)))
+        return orders
+
+    async def order_step(self):
+        proc = self.new_order_proc
+        orders = await self.pop_orders()
+        if not orders:
+            return
+        started = time()
+        if proc.rebuilding:
+            proc.live_ids.update(_id for _id, order in orders)
+        buf = CommandBuffer()
+        for _id, order in orders:
+            if order['planType'] == 'strategy' and order['active'] not in Mapping.active_code:
+                # 삭제할 indicator 구독을 sync client 로 조회하므로 thread 에서 기록 (buffer 순서는 유지)
+                await asyncio.to_thread(proc.set_order, _id, order, buf)
+            else:
+                proc.set_order(_id, order, p=buf)
+        await self.execute(buf)
+        proc.metrics.inc('watcher_new_orders_total', len(orders))
+        proc.metrics.observe('watcher_new_order_batch_seconds', time() - started)
+
+    async def warm_start(self):
+        """
+        NewOrderProc.warm_start 와 같은 재등록, decode 는 event loop 에서 chunk 단위로 실행
+        재등록 중에도 order_step 이 신규 주문을 처리하며, 처리된 id 는 live_ids 로 제외
+        재시작해줄 WatchDog 이 없으므로 실패하면 WarmStartConfig.RETRY_SEC 후 처음부터 다시 재등록
+        """
+        if not WarmStartConfig.ENABLED:
+            return
+        proc = self.new_order_proc
+        proc.rebuilding = True
+        try:
+            while True:
+                started = time()
+                proc.warm_stats = {'orders': 0, 'skipped': 0, 'expired': 0, 'elapsed': 0, 'done': 0}
+                try:
+                    await self.rebuild_all(started)
+                    break
+                except Exception as e:
+                    log.error('WARM_START_ERROR', error=str(e), retry_sec=WarmStartConfig.RETRY_SEC, **proc.warm_stats)
+                    await asyncio.sleep(WarmStartConfig.RETRY_SEC)
+        finally:
+            proc.rebuilding = False
+            proc.live_ids = set()
+
+        proc.warm_stats['done'] = 1
+        await self.warm_progress(started)
+        log.info('WARM_START_DONE', orders=proc.warm_stats['orders'], elapsed=round(proc.warm_stats['elapsed'], 2))
+
+    async def rebuild_all(self, started):
+        progress_at = started
+        cursor = 0
+        while True:
+            cursor, chunk = await self.client.hscan(Watcher.MTS_ORDER_LIST, cursor, count=WarmStartConfig.SCAN_COUNT)
+            if chunk:
+                await self.rebuild_orders(decode_orders(chunk))
+            if time() - progress_at > WarmStartConfig.PROGRESS_SEC:
+                progress_at = time()
+                await self.warm_progress(started)
+            if not int(cursor):
+                return
+
+    async def warm_progress(self, started):
+        buf = CommandBuffer()
+        self.new_order_proc.warm_progress(started, p=buf)
+        await self.execute(buf)
+
+    async def rebuild_orders(self, orders):
+        proc = self.new_order_proc
+        orders = [(_id, order_info) for _id, order_info in orders if order_info is not None]
+        p = self.client.pipeline(transaction=False)
+        for _id, order_info in orders:
+            p.hexists(Watcher.MTS_ORDER_LIST, _id)
+        exists = await p.execute()
+        # await 이후 live_ids 확인, 같은 차례의 신규 주문 기록은 재등록 뒤에 실행됨
+        targets = [order_info for (_id, order_info), exist in zip(orders, exists) if exist and _id not in proc.live_ids]
+        proc.warm_stats['skipped'] += len(orders) - len(targets)
+        buf = CommandBuffer()
+        expired = proc.write_rebuild(targets, buf)
+        if expired:
+            proc.db_post_orders(expired, once=False, p=buf)
+        # NewOrderProc.rebuild_orders 의 pipeline 처럼 기록 실패는 재등록 실패로 처리
+        for row in await self.execute(buf):
+            if isinstance(row, Exception):
+                raise row
+
+    async def time_step(self):
+        watcher = self.time_proc
+        if time() - watcher.reconciled_at > TimeConfig.RECONCILE_SEC:
+            await self.reconcile_time()
+        wait = (watcher.next_deadline() - get_unixtime_ms()) / 1000
+        await self.wait(self.time_wake, min(max(wait, 0), TimeConfig.MAX_WAIT_SEC))
+
+        _now = get_unixtime_ms()
+        if watcher.deadlines['end'].pop_due(_now):
+            await self.end_time_check(_now)
+        if watcher.deadlines['start'].pop_due(_now):
+            await self.start_time_check(_now)
+        names = watcher.passed_windows(_now)
+        if names:
+            await self.reconcile_time(names)
+
+    async def reconcile_time(self, names=('start', 'end')):
+        p = self.client.pipeline(transaction=False)
+        for name in names:
+            _key = Watcher.START_TIME_MON if name == 'start' else Watcher.END_TIME_MON
+            p.zrange(_key, 0, TimeConfig.WINDOW - 1, withscores=True)
+        for name, rows in zip(names, await p.execute()):
+            self.time_proc.load_window(name, rows)
+        self.time_proc.reconciled_at = time()
+
+    async def end_time_check(self, _now):
+        """
+        BaseDb.db_end_time_check 와 같은 처리
+        """
+        target = await self.client.zrangebyscore(Watcher.END_TIME_MON, '-inf', _now)
+        if not target:
+            return
+        order_list = await self.client.hmget(Watcher.MTS_ORDER_LIST, *target)
+        stale = [_id for _id, order in zip(target, order_list) if order is None]
+        orders = [json.loads(order) for order in order_list if order is not None]
+        buf = CommandBuffer()
+        if orders:
+            self.time_proc.db_post_orders([(order['id'], order['symbol'], 'END') for order in orders], p=buf)
+        if stale:
+            buf.zrem(Watcher.END_TIME_MON, *stale)
+        res = await self.execute(buf)
+        if orders and isinstance(res[0], list) and res[0]:
+            log.info('POST_RES', _limit=False, members=res[0])
+            log.info('END_TIME', ids=target)
+            self.time_proc.metrics.inc('watcher_time_processed_total', len(res[0]), name='end')
+
+    async def start_time_check(self, _now):
+        """
+        BaseDb.db_start_time_check 와 같은 처리
+        """
+        target = await self.client.zrangebyscore(Watcher.START_TIME_MON, '-inf', _now)
+        if not target:
+            return
+        orders = [json.loads(order) for order in await self.client.hmget(Watcher.MTS_ORDER_LIST, *target)
+                  if order is not None]
+        buf = CommandBuffer()
+        for order in orders:
+            if order.get('planType') in self.time_proc.date_ckeck:
+                self.time_proc.db_activate_trendline(order, p=buf)
+            self.time_proc.db_set_order(order, start_waiting_time=None, p=buf)
+        buf.zrem(Watcher.START_TIME_MON, *target)
+        await self.execute(buf)
+        if orders:
+            log.info('START_TIME', ids=target)
+            self.time_proc.metrics.inc('watcher_time_processed_total', len(orders), name='start')
+
+    async def seed_last_price(self, keys):
+        watcher = self.line_watcher
+        if not keys:
+            return
+        p = self.client.pipeline(transaction=False)
+        for symbol, direction, member in watcher.seed_items(keys):
+            p.zscore(Watcher.WATCHER_LIST.format(symbol, direction), member)
+        watcher.seed_last_price(keys, await p.execute())
+
+    async def line_step(self):
+        watcher = self.line_watcher
+        if time() - watcher.reconciled_at > LineConfig.RECONCILE_SEC:
+            queue = {}
+            async for _key, line in self.client.hscan_iter(Watcher.TRENDLINE_QUEUE, count=LineConfig.SCAN_COUNT):
+                queue[_key] = json.loads(line)
+            await self.seed_last_price(watcher.load_queue(queue))
+        deadline = watcher.schedule.peek()
+        wait = LineConfig.MAX_WAIT_SEC if deadline is None else (deadline - get_unixtime_ms()) / 1000
+        await self.wait(self.line_wake, min(max(wait, 0), LineConfig.MAX_WAIT_SEC))
+
+        _now = get_unixtime_ms()
+        started = time()
+        groups, schedule = watcher.line_changes(_now)
+        watcher.metrics.set('watcher_lines', len(watcher.engine))
+        if not schedule:
+            return
+        buf = CommandBuffer()
+        for symbol, direction, row, new in groups:
+            watcher.db_change_score(symbol, direction, row, new, p=buf)
+        res = await self.execute(buf)
+        failed = set()
+        if any(isinstance(row, Exception) for row in res):
+            for symbol, direction, row, new in groups:
+                failed.update(row)
+        else:
+            for symbol, direction, row, new in groups:
+                watcher.commit_scores(row)
+        watcher.reschedule(schedule, _now, failed)
+        watcher.metrics.inc('watcher_line_writes_total', sum(len(row) for _, _, row, _ in groups))
+        watcher.metrics.observe('watcher_line_cycle_seconds', time() - started)
@@ -0,0 +1,273 @@
+"""
+watcher hot path micro benchmark
+calc 함수, PriceWatcher.scan_order, db_scan_increase/decrease, rm_order, db_set_order, LineWatcher.price_update 를
+book 크기, symbol 수 별로 측정하여 JSON 으로 기록 (commit 간 비교용)
+
+python -m bench.hot_paths [--books 1000 10000] [--symbols 10 100] [--ops 2000] [--out result.json]
+python -m bench.hot_paths --redis-url redis://localhost:6379/15   # 실제 redis-server (지정한 db 를 flush 함)
+--redis-url 이 없으면 fakeredis (in-process) 사용
+"""
+import argparse
+import os
+import platform
+import random
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter, time
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from config.settings import Redis, Watcher
+from common.calc import trendline_trigger_calc, round_coin, change_unixtime, get_unixtime_ms
+from common.log import setup_logging
+from database.registry import ConnectionRegistry
+
+TICK = {'tick': 0.5, 'length': 1}
+
+
+def connect(url):
+    """
+    :param url: redis url, None 이면 fakeredis
+    :return: (client, backend 이름)
+    """
+    if url is None:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit('fakeredis 가 없으면 --redis-url 로 redis-server 를 지정해야 함 (pip install fakeredis lupa)')
+        return fakeredis.FakeStrictRedis(decode_responses=True), 'fakeredis'
+
+    import redis
+    client = redis.StrictRedis.from_url(url, decode_responses=True)
+    if int(client.connection_pool.connection_kwargs.get('db', 0)) == int(Redis.REDIS_DB):
+        sys.exit('watcher 가 사용하는 db ({}) 는 benchmark 에 사용할 수 없음'.format(Redis.REDIS_DB))
+    return client, 'redis'
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def symbols_of(n):
+    return ['SYM{}-USDT'.format(i) for i in range(n)]
+
+
+def reserved_order(i, symbol, direction, price):
+    return {'id': 'bench{}'.format(i), 'active': 1, 'status': 'WAITING', 'side': 'BUY', 'tradeType': 'Limit',
+            'indicatorType': 'OPEN', 'symbol': symbol, 'planType': 'reserved', 'indicator': 'reserved',
+            'direction': direction, 'price': price}
+
+
+def fill_book(db, book, symbols):
+    """
+    symbol 별 1000 근처 가격으로 buy (900 이하) / sell (1100 이상) trigger 를 book 건 등록
+    """
+    p = db.client.pipeline(transaction=False)
+    orders = []
+    for i in range(book):
+        direction = 1 if i % 2 else -1
+        price = round_coin(random.uniform(500, 900) if direction == 1 else random.uniform(1100, 1500), TICK['tick'], TICK['length'])
+        order = reserved_order(i, symbols[i % len(symbols)], direction, price)
+        db.db_set_order(order, p=p)
+        orders.append(order)
+        if len(p) >= 1000:
+            p.execute()
+    p.execute()
+    return orders
+
+
+def set_ticksize(client, symbols):
+    p = client.pipeline(transaction=False)
+    for symbol in symbols:
+        p.hset(Watcher.MARKET_DATA_KEY, symbol, json.dumps({'tickSize': TICK['tick']}))
+        p.sadd(Watcher.TICK_SIZE_KEYS, '{}:bench'.format(symbol))
+    p.execute()
+
+
+class ListQueue(object):
+    """
+    scan_order 용 price queue (미리 만든 tick 을 순서대로 반환)
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.i = 0
+
+    def get(self, timeout=None):
+        row = self.rows[self.i]
+        self.i += 1
+        return row
+
+    def qsize(self):
+        return len(self.rows) - self.i
+
+
+def case_calc(ops):
+    now = 1600000000000
+    line = {'tradingStartPrice': 9000.0, 'tradingEndPrice': 11000.0, 'startDate': now - 3600000, 'endDate': now + 3600000}
+    res = {}
+    start = perf_counter()
+    for i in range(ops):
+        trendline_trigger_calc(now + i, **line)
+    res['trendline_trigger_calc'] = perf_counter() - start
+    start = perf_counter()
+    for i in range(ops):
+        round_coin(9876.342 + i, 0.05, 2)
+    res['round_coin'] = perf_counter() - start
+    start = perf_counter()
+    for i in range(ops):
+        change_unixtime('2020-07-06T11:23:49.000Z')
+    res['change_unixtime'] = perf_counter() - start
+    return res
+
+
+def case_set_order(db, book, symbols, ops):
+    start = perf_counter()
+    for i in range(ops):
+        db.db_set_order(reserved_order(i, symbols[i % len(symbols)], 1, 500.0 + i % 400))
+    return perf_counter() - start
+
+
+def case_rm_order(db, book, symbols, ops):
+    orders = fill_book(db, book, symbols)
+    start = perf_counter()
+    for order in orders[:ops]:
+        db.rm_order(order['id'], order['symbol'])
+    return perf_counter() - start
+
+
+def case_scan_miss(db, book, symbols, ops):
+    # trigger 를 넘지 않는 가격 scan (tick 대부분의 경우)
+    fill_book(db, book, symbols)
+    start = perf_counter()
+    for i in range(ops):
+        symbol = symbols[i % len(symbols)]
+        db.db_scan_decrease(symbol, 1000.0)
+        db.db_scan_increase(symbol, 1000.0)
+    return perf_counter() - start
+
+
+def case_scan_hit(db, book, symbols, ops):
+    # 가격이 trigger 를 하나씩 넘는 경우 (post 포함)
+    orders = [order for order in fill_book(db, book, symbols) if order['direction'] == 1]
+    orders.sort(key=lambda order: -order['price'])
+    orders = orders[:ops]
+    start = perf_counter()
+    for order in orders:
+        db.db_scan_decrease(order['symbol'], order['price'])
+    return perf_counter() - start, len(orders)
+
+
+def case_scan_order(book, symbols, ops):
+    from watchdog import PriceWatcher
+    from common.change_feed import ChangeFeed
+    from config.tuning import WatcherKeys
+
+    watcher = PriceWatcher(0)
+    fill_book(watcher, book, symbols)
+    watcher.book_feed = ChangeFeed(watcher.client, WatcherKeys.BOOK_CHANNEL)
+    watcher.book_feed.subscribe()
+    rows = [json.dumps({'symbol': symbols[i % len(symbols)], 'price': 1000.0 + random.uniform(-50, 50)})
+            for i in range(ops + len(symbols))]
+    watcher.price_q = ListQueue(rows)
+    # symbol 별 첫 tick (book load, before_price 설정) 은 측정에서 제외
+    for _ in symbols:
+        watcher.scan_order()
+    start = perf_counter()
+    for _ in range(ops):
+        watcher.scan_order()
+    return perf_counter() - start
+
+
+def case_price_update(client, book, symbols, ops):
+    from watchdog import LineWatcher
+    from common.change_feed import ChangeFeed
+    from config.tuning import WatcherKeys
+
+    set_ticksize(client, symbols)
+    watcher = LineWatcher()
+    now = get_unixtime_ms()
+    p = client.pipeline(transaction=False)
+    for i in range(book):
+        price = random.uniform(500, 1500)
+        watcher.db_set_line_queue('bench{}=OPEN'.format(i), {
+            'startDate': now - 3600000, 'endDate': now + 86400000, 'tradingStartPrice': price,
+            'tradingEndPrice': price * random.uniform(0.8, 1.2), 'symbol': symbols[i % len(symbols)],
+            'currentPrice': 0, 'direction': 1 if i % 2 else -1}, p=p)
+    p.execute()
+    watcher.line_feed = ChangeFeed(client, WatcherKeys.LINE_CHANNEL)
+    watcher.line_feed.subscribe()
+    watcher.price_update()
+    rounds = max(1, ops // max(book, 1))
+    elapsed = 0
+    for _ in range(rounds):
+        # 모든 line 의 가격이 바뀐 것으로 보고 전체 재기록
+        watcher.engine.last_price[:len(watcher.engine)] = float('nan')
+        for _key in watcher.engine.keys:
+            watcher.schedule.push(_key, 0)
+        start = perf_counter()
+        watcher.price_update()
+        elapsed += perf_counter() - start
+    return elapsed, rounds * book
+
+
+def row(case, book, symbols, ops, sec):
+    return {'case': case, 'book': book, 'symbols': symbols, 'ops': ops, 'sec': round(sec, 6),
+            'ops_per_sec': round(ops / sec, 1) if sec else None, 'us_per_op': round(sec / ops * 1e6, 3) if ops else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, nargs='+', default=[1000, 10000], help='등록할 trigger / trendline 수')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--ops', type=int, default=2000, help='case 별 측정 횟수')
+    parser.add_argument('--redis-url', default=None, help='없으면 fakeredis 사용, 지정한 db 는 case 마다 flush')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # 운영과 같은 queue logger 로 hot path 의 log 비용 (level 확인, rate limit, format) 을 측정에 포함, 기록은 devnull 로
+    with redirect_stdout(open(os.devnull, 'w')):
+        setup_logging('bench')
+    client, backend = connect(args.redis_url)
+    ConnectionRegistry.set_redis(client)
+
+    from database.redis_db import BaseDb
+    db = BaseDb()
+    results = []
+    for name, sec in case_calc(args.ops * 10).items():
+        results.append(row(name, None, None, args.ops * 10, sec))
+
+    for book in args.books:
+        for n in args.symbols:
+            symbols = symbols_of(n)
+            cases = [('db_set_order', lambda: (case_set_order(db, book, symbols, args.ops), args.ops)),
+                     ('rm_order', lambda: (case_rm_order(db, book, symbols, min(args.ops, book)), min(args.ops, book))),
+                     ('db_scan_miss', lambda: (case_scan_miss(db, book, symbols, args.ops), args.ops)),
+                     ('db_scan_hit', lambda: case_scan_hit(db, book, symbols, args.ops)),
+                     ('scan_order', lambda: (case_scan_order(book, symbols, args.ops), args.ops)),
+                     ('price_update', lambda: case_price_update(client, book, symbols, args.ops))]
+            for name, func in cases:
+                client.flushdb()
+                sec, ops = func()
+                results.append(row(name, book, n, ops, sec))
+                sys.stderr.write('{} book={} symbols={} {:.4f}s\n'.format(name, book, n, sec))
+    client.flushdb()
+
+    res = json.dumps({'commit': git_commit(), 'backend': backend, 'python': platform.python_version(),
+                      'time': int(time()), 'results': results}, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(res)
+    sys.stdout.write(res + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+GetPriceProc 가 기록한 tick tape (TapeConfig.RECORD_PATH) 를 local redis 의 PRICE_QUEUE 로 다시 넣고
+POST_ORDER 에 기록되는 'id=action' 과 시간을 report 로 남김 (watcher 가 같은 redis 에서 실행중이어야 함)
+
+python -m bench.replay play TAPE [--speed 1 | 10 | 0 (최대 속도)] [--out report.json]
+python -m bench.replay compare a.json b.json
+python -m bench.replay info TAPE
+
+replay 는 POST_ORDER 를 직접 소비하므로 운영 redis 에서 실행하면 안됨 (localhost 가 아니면 --force 필요)
+"""
+import argparse
+import sys
+from threading import Thread, Event
+from time import perf_counter, sleep
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from config.settings import Redis, Watcher
+from common.tape import TickTape
+from database.registry import ConnectionRegistry
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def connect(url, force):
+    import redis
+    client = redis.StrictRedis.from_url(url, decode_responses=True) if url else ConnectionRegistry.redis()
+    host = client.connection_pool.connection_kwargs.get('host', Redis.REDIS_SERVER)
+    if host not in LOCAL_HOSTS and not force:
+        sys.exit('local redis 가 아님 ({}), 확인 후 --force 로 실행'.format(host))
+    return client
+
+
+class PostCollector(Thread):
+    """
+    POST_ORDER 를 소비하며 fire 된 'id=action' 과 시간을 기록
+    """
+    def __init__(self, client, started, progress):
+        super().__init__(daemon=True)
+        self.client = client
+        self.started = started
+        self.progress = progress  # [마지막으로 넣은 tick index, tape ts]
+        self.fired = []
+        self.stop_event = Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            res = self.client.blpop(Watcher.POST_ORDER, timeout=1)
+            if res:
+                index, tape_ts = self.progress
+                self.fired.append({'member': res[1], 'sec': round(perf_counter() - self.started, 6),
+                                   'tick': index, 'tape_ts': tape_ts})
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def play(args):
+    client = connect(args.redis_url, args.force)
+    tape = TickTape(args.tape)
+    total = min(len(tape), args.limit) if args.limit else len(tape)
+    client.delete(Watcher.PRICE_QUEUE)
+
+    progress = [0, None]
+    started = perf_counter()
+    collector = PostCollector(client, started, progress)
+    collector.start()
+
+    def flush(index, tape_ts):
+        p.execute()
+        progress[0], progress[1] = index, tape_ts
+        # watcher 가 소비하는 속도를 넘지 않도록 대기
+        while client.llen(Watcher.PRICE_QUEUE) > args.max_queue:
+            sleep(0.001)
+
+    first_ts = None
+    p = client.pipeline(transaction=False)
+    for i, (_symbol, price, ts) in enumerate(tape.read(0, total)):
+        if first_ts is None:
+            first_ts = ts
+        if args.speed:
+            wait = (ts - first_ts) / args.speed - (perf_counter() - started)
+            if wait > 0:
+                if len(p):
+                    flush(i - 1, last_ts)
+                sleep(wait)
+        p.rpush(Watcher.PRICE_QUEUE, json.dumps({'symbol': _symbol, 'price': price}))
+        last_ts = ts
+        if len(p) >= args.batch:
+            flush(i, ts)
+    if len(p):
+        flush(total - 1, last_ts)
+    pushed = perf_counter() - started
+
+    while client.llen(Watcher.PRICE_QUEUE):
+        sleep(0.001)
+    drained = perf_counter() - started
+    sleep(args.settle)
+    collector.stop()
+    tape.close()
+
+    report = {'tape': args.tape, 'ticks': total, 'speed': args.speed, 'push_sec': round(pushed, 4),
+              'drain_sec': round(drained, 4), 'ticks_per_sec': round(total / drained, 1) if drained else None,
+              'fired_count': len(collector.fired), 'fired': collector.fired}
+    return report
+
+
+def compare(args):
+    with open(args.a) as f:
+        a = json.load(f)
+    with open(args.b) as f:
+        b = json.load(f)
+    members_a = [i['member'] for i in a['fired']]
+    members_b = [i['member'] for i in b['fired']]
+    return {'identical_set': set(members_a) == set(members_b), 'identical_order': members_a == members_b,
+            'only_a': sorted(set(members_a) - set(members_b)), 'only_b': sorted(set(members_b) - set(members_a)),
+            'ticks_per_sec': [a.get('ticks_per_sec'), b.get('ticks_per_sec')],
+            'speedup': round(b['ticks_per_sec'] / a['ticks_per_sec'], 3) if a.get('ticks_per_sec') and b.get('ticks_per_sec') else None}
+
+
+def info(args):
+    tape = TickTape(args.tape)
+    res = {'tape': args.tape, 'ticks': len(tape), 'symbols': len(tape.symbols)}
+    if len(tape):
+        first = next(tape.read(0, 1))
+        last = next(tape.read(len(tape) - 1))
+        res.update({'first_ts': first[2], 'last_ts': last[2], 'duration_sec': round(last[2] - first[2], 3)})
+    tape.close()
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_play = sub.add_parser('play')
+    p_play.add_argument('tape')
+    p_play.add_argument('--speed', type=float, default=0, help='1: 기록 속도, N: N배, 0: 최대 속도')
+    p_play.add_argument('--limit', type=int, default=0, help='앞에서부터 replay 할 tick 수, 0 이면 전체')
+    p_play.add_argument('--batch', type=int, default=500, help='pipeline 한번에 넣을 tick 수')
+    p_play.add_argument('--max-queue', type=int, default=100000, help='PRICE_QUEUE 가 이보다 길면 대기')
+    p_play.add_argument('--settle', type=float, default=2.0, help='queue 소진 후 POST_ORDER 대기 시간 (seconds)')
+    p_play.add_argument('--redis-url', default=None, help='없으면 config.settings 의 redis')
+    p_play.add_argument('--force', action='store_true')
+    p_play.add_argument('--out', default=None)
+    p_compare = sub.add_parser('compare')
+    p_compare.add_argument('a')
+    p_compare.add_argument('b')
+    p_compare.add_argument('--out', default=None)
+    p_info = sub.add_parser('info')
+    p_info.add_argument('tape')
+    p_info.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    res = json.dumps({'play': play, 'compare': compare, 'info': info}[args.command](args), indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(res)
+    sys.stdout.write(res + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+price tick 전달 경로 micro benchmark: multiprocessing.Queue (json string) vs shared memory TickRing
+python -m bench.ring_transport --ticks 200000 --symbols 200 [--rate 50000] [--out result.json]
+"""
+import argparse
+import sys
+from multiprocessing import Process, Queue
+from time import time, sleep
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from common.ring_buffer import TickRing
+
+STOP = '__stop__'
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def pace(i, start, rate):
+    if rate:
+        wait = start + i / rate - time()
+        if wait > 0:
+            sleep(wait)
+
+
+def queue_producer(q, ticks, symbols, rate):
+    start = time()
+    for i in range(ticks):
+        pace(i, start, rate)
+        q.put_nowait(json.dumps({'symbol': symbols[i % len(symbols)], 'price': 100.0 + i % 50, 'ts': time()}))
+    q.put(STOP)
+
+
+def queue_consumer(q, out):
+    latency = []
+    first = None
+    while True:
+        row = q.get()
+        if row == STOP:
+            break
+        tick = json.loads(row)
+        _now = time()
+        first = first or _now
+        latency.append(_now - tick['ts'])
+    out.put((first, time(), latency))
+
+
+def ring_producer(ring, ticks, symbols, rate):
+    start = time()
+    for i in range(ticks):
+        pace(i, start, rate)
+        while not ring.put(symbols[i % len(symbols)], 100.0 + i % 50, time()):
+            sleep(0)
+    while not ring.put(STOP, 0.0, 0.0):
+        sleep(0)
+
+
+def ring_consumer(ring, out):
+    latency = []
+    first = None
+    while True:
+        rows = ring.get_many(20000)
+        if not rows:
+            sleep(0.0005)
+            continue
+        _now = time()
+        first = first or _now
+        done = False
+        for _symbol, price, ts, count in rows:
+            if _symbol == STOP:
+                done = True
+                break
+            latency.append(_now - ts)
+        if done:
+            break
+    out.put((first, time(), latency))
+
+
+def run_case(name, producer, consumer, transport, ticks, symbols, rate):
+    out = Queue()
+    c = Process(target=consumer, args=(transport, out))
+    c.start()
+    start = time()
+    p = Process(target=producer, args=(transport, ticks, symbols, rate))
+    p.start()
+    first, end, latency = out.get()
+    p.join()
+    c.join()
+    latency.sort()
+    return {'transport': name, 'ticks': ticks, 'symbols': len(symbols), 'rate': rate,
+            'ticks_per_sec': round(ticks / (end - start), 1),
+            'latency_ms': {k: round(percentile(latency, q) * 1000, 4)
+                           for k, q in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999), ('max', 1.0))}}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=200000)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=0, help='초당 tick 수, 0 이면 최대 속도')
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    symbols = ['SYM{}-USDT'.format(i) for i in range(args.symbols)]
+    results = [run_case('queue', queue_producer, queue_consumer, Queue(), args.ticks, symbols, args.rate)]
+    ring = TickRing(65536, max(args.symbols + 1, 16))
+    try:
+        results.append(run_case('ring', ring_producer, ring_consumer, ring, args.ticks, symbols, args.rate))
+    finally:
+        ring.close()
+
+    res = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(res)
+    sys.stdout.write(res + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+LineWatcher trigger 가격 계산 benchmark: trendline 별 python loop vs TrendlineEngine
+python -m bench.trendline_engine [--sizes 10000 100000 1000000] [--out result.json]
+"""
+import argparse
+import random
+import sys
+from time import perf_counter
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from common.calc import trendline_trigger_calc, round_coin
+from common.trendline_engine import TrendlineEngine
+
+TICKSIZE = {'SYM{}-USDT'.format(i): {'tick': random.choice([0.5, 0.1, 1.0, 5.0]), 'length': 1} for i in range(200)}
+
+
+def make_lines(n, now):
+    symbols = list(TICKSIZE)
+    lines = {}
+    for i in range(n):
+        start = now - random.randint(1, 86400) * 1000
+        price = random.uniform(100, 50000)
+        lines['order{}=OPEN'.format(i)] = {
+            'startDate': start, 'endDate': start + random.randint(3600, 86400 * 30) * 1000,
+            'tradingStartPrice': price, 'tradingEndPrice': price * random.uniform(0.8, 1.2),
+            'symbol': symbols[i % len(symbols)], 'currentPrice': 0, 'direction': random.choice([1, -1])}
+    return lines
+
+
+def python_loop(raw, now):
+    res = {}
+    for _id, order in raw.items():
+        order = json.loads(order)
+        calc_price = trendline_trigger_calc(now, **order)
+        current_price = round_coin(calc_price, TICKSIZE[order['symbol']]['tick'],
+                                   TICKSIZE[order['symbol']]['length']) + order['direction'] * TICKSIZE[order['symbol']]['tick']
+        if order['currentPrice'] != current_price:
+            res[_id] = current_price
+    return res
+
+
+def timed(func, *args):
+    start = perf_counter()
+    res = func(*args)
+    return perf_counter() - start, res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+
+    now = 1600000000000
+    results = []
+    for n in args.sizes:
+        lines = make_lines(n, now)
+        raw = {_key: json.dumps(line) for _key, line in lines.items()}
+        loop_sec, expected = timed(python_loop, raw, now)
+
+        engine = TrendlineEngine()
+        load_sec, _ = timed(lambda: [engine.add(_key, line, TICKSIZE[line['symbol']]['tick'], 1)
+                                     for _key, line in lines.items()])
+        calc_sec, (rows, prices) = timed(engine.changed, now)
+        engine.commit(rows, prices)
+        noop_sec, (unchanged, _) = timed(engine.changed, now)
+        group_sec, _ = timed(engine.group, rows, prices)
+
+        mismatch = sum(1 for row, price in zip(rows.tolist(), prices.tolist())
+                       if abs(expected[engine.keys[row]] - price) > 1e-6)
+        results.append({'lines': n, 'python_loop_sec': round(loop_sec, 4), 'engine_load_sec': round(load_sec, 4),
+                        'engine_calc_sec': round(calc_sec, 4), 'engine_group_sec': round(group_sec, 4),
+                        'engine_unchanged_cycle_sec': round(noop_sec, 4), 'unchanged_rows': len(unchanged),
+                        'speedup_calc': round(loop_sec / calc_sec, 1), 'mismatch': mismatch})
+    res = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(res)
+    sys.stdout.write(res + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,14 @@ def get_unixtime():
     return int(time.mktime(datetime.now().timetuple())) * 1000
 
 
+def get_unixtime_ms():
+    """
+    현재 시간의 unixtime 반환 (ms 단위까지)
+    :return: 1595203200123
+    """
+    return int(time.time() * 1000)
+
+
 def change_unixtime(date):
     """
     date string을 unixtime으로 반환
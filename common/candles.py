@@ -0,0 +1,224 @@
+import os
+import struct
+from collections import defaultdict
+
+import numpy as np
+
+from common.indicators import Candle
+
+MAGIC = b'ETSCNDL1'
+HEADER = struct.Struct('<8sIIQ')  # magic, capacity, max series, series count
+NAME = struct.Struct('<32s')
+NAME_OFFSET = 64
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+COLUMNS = 6
+
+
+class CandleStore(object):
+    """
+    symbol_kline 별 마감된 candle 의 rolling window (최근 capacity 개) 를 고정 크기 numpy 배열로 보관
+    path 가 주어지면 파일을 np.memmap 으로 사용하므로 process 가 재시작해도 history 를 다시 읽지 않음
+    file: header (64 bytes) + 이름 table (max_series * 32) + meta int64 [count, head] + 만들고 있는 candle + ring
+    ring 은 2 * capacity 길이로 같은 row 를 i, i + capacity 에 두번 기록, 최근 n 개가 항상 연속된 구간이라 복사 없이 view 로 반환
+    """
+    def __init__(self, path=None, capacity=500, max_series=1024):
+        self.path = path
+        self.series_ids = {}
+        if path and os.path.exists(path) and os.path.getsize(path) >= NAME_OFFSET:
+            with open(path, 'rb') as f:
+                magic, capacity, max_series, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('not a candle store: {}'.format(path))
+            self.mm = np.memmap(path, dtype=np.uint8, mode='r+', shape=(self.size(capacity, max_series),))
+        else:
+            count = 0
+            if path:
+                self.mm = np.memmap(path, dtype=np.uint8, mode='w+', shape=(self.size(capacity, max_series),))
+            else:
+                self.mm = np.zeros(self.size(capacity, max_series), dtype=np.uint8)
+            self.mm[:HEADER.size] = np.frombuffer(HEADER.pack(MAGIC, capacity, max_series, 0), dtype=np.uint8)
+        self.capacity = capacity
+        self.max_series = max_series
+        meta_offset = NAME_OFFSET + max_series * NAME.size
+        current_offset = meta_offset + max_series * 2 * 8
+        data_offset = current_offset + max_series * COLUMNS * 8
+        self.names = self.mm[NAME_OFFSET:meta_offset].reshape(max_series, NAME.size)
+        self.meta = self.mm[meta_offset:current_offset].view(np.int64).reshape(max_series, 2)
+        # 아직 마감되지 않은 candle, ts (bucket 시작 시간) 가 0 이면 없음
+        self.current = self.mm[current_offset:data_offset].view(np.float64).reshape(max_series, COLUMNS)
+        self.data = self.mm[data_offset:].view(np.float64).reshape(max_series, 2 * capacity, COLUMNS)
+        for i in range(count):
+            self.series_ids[self.names[i].tobytes().rstrip(b'\x00').decode()] = i
+
+    @staticmethod
+    def size(capacity, max_series):
+        return NAME_OFFSET + max_series * (NAME.size + 2 * 8 + COLUMNS * 8 + 2 * capacity * COLUMNS * 8)
+
+    def __len__(self):
+        return len(self.series_ids)
+
+    def series(self, _symbol_kline):
+        """
+        :return: series id, 가득 차서 추가할 수 없으면 None
+        """
+        sid = self.series_ids.get(_symbol_kline)
+        if sid is None:
+            sid = len(self.series_ids)
+            if sid >= self.max_series:
+                return None
+            self.names[sid] = np.frombuffer(NAME.pack(_symbol_kline.encode()), dtype=np.uint8)
+            self.meta[sid] = 0
+            self.current[sid] = 0
+            self.mm[HEADER.size - 8:HEADER.size] = np.frombuffer(struct.pack('<Q', sid + 1), dtype=np.uint8)
+            self.series_ids[_symbol_kline] = sid
+        return sid
+
+    def append(self, sid, row):
+        """
+        마감된 candle 기록, capacity 를 넘으면 가장 오래된 candle 을 덮어씀
+        :param row: (ts, open, high, low, close, volume)
+        """
+        count, head = self.meta[sid]
+        self.data[sid, head] = row
+        self.data[sid, head + self.capacity] = row
+        self.meta[sid, 0] = min(count + 1, self.capacity)
+        self.meta[sid, 1] = (head + 1) % self.capacity
+
+    def view(self, sid, n=None):
+        """
+        최근 n 개 candle (오래된 순) 의 (n, 6) view, 복사하지 않으므로 다음 append 전까지만 사용
+        column 순서는 TS, OPEN, HIGH, LOW, CLOSE, VOLUME
+        """
+        count, head = self.meta[sid]
+        n = count if n is None else min(n, count)
+        end = head + self.capacity
+        return self.data[sid, end - n:end]
+
+    def last(self, sid):
+        """
+        :return: 가장 최근 마감된 candle row view, 없으면 None
+        """
+        count, head = self.meta[sid]
+        if not count:
+            return None
+        return self.data[sid, head + self.capacity - 1]
+
+    def candles(self, _symbol_kline, n=None):
+        """
+        :return: [Candle, ...] (오래된 순), IndicatorEngine.warm 입력용 복사본
+        """
+        sid = self.series_ids.get(_symbol_kline)
+        if sid is None:
+            return []
+        return [Candle(*row) for row in self.view(sid, n).tolist()]
+
+    def flush(self):
+        if isinstance(self.mm, np.memmap):
+            self.mm.flush()
+
+
+class CandleAggregator(object):
+    """
+    tick 을 구독중인 symbol_kline (symbol, candle size) 별 OHLCV candle 로 집계하고 마감된 candle 을 CandleStore 에 기록
+    candle 은 ts // size 구간 (bucket) 단위, 다음 구간의 tick 이 오거나 close_due 에서 구간이 지나면 마감
+    tick 이 없던 구간은 직전 종가의 거래량 0 candle 로 채움 (indicator 가 빈 구간 없이 갱신되도록)
+    volume 은 거래량이 아닌 수신한 tick 수 (price queue 에 거래량이 없음), 병합된 tick 은 병합된 수만큼 더함
+    """
+    def __init__(self, store, unit_sec=60, fill_gaps=True):
+        self.store = store
+        self.unit_sec = unit_sec
+        self.fill_gaps = fill_gaps
+        self.sizes = {}  # symbol: [(symbol_kline, sid, seconds), ...]
+
+    def subscribe(self, symbol_klines):
+        """
+        집계할 symbol_kline 목록 교체, 빠진 symbol_kline 의 history 는 store 에 남음
+        :param symbol_klines: ['BTC-USDT_15', ...] (candle size 단위는 unit_sec)
+        :return: store 가 가득 차거나 candle size 가 숫자가 아니라 집계하지 못하는 symbol_kline 목록
+        """
+        sizes = defaultdict(list)
+        skipped = []
+        for _symbol_kline in symbol_klines:
+            _symbol, _, size = _symbol_kline.rpartition('_')
+            try:
+                seconds = float(size) * self.unit_sec
+            except ValueError:
+                seconds = 0
+            sid = self.store.series(_symbol_kline) if seconds > 0 and _symbol else None
+            if sid is None:
+                skipped.append(_symbol_kline)
+                continue
+            sizes[_symbol].append((_symbol_kline, sid, seconds))
+        self.sizes = dict(sizes)
+        return skipped
+
+    def update(self, _symbol, last, high, low, ts, volume=1):
+        """
+        :param last, high, low: 병합된 tick 이면 구간의 마지막/최고/최저, 1건이면 모두 같은 가격
+        :param ts: tick 수신 시간 (seconds)
+        :param volume: 병합된 tick 수 (TickConflator count)
+        :return: [(symbol_kline, Candle), ...] 이번 tick 으로 마감된 candle (오래된 순)
+        """
+        closed = []
+        for _symbol_kline, sid, seconds in self.sizes.get(_symbol, ()):
+            bucket = ts - ts % seconds
+            current = self.store.current[sid]
+            if current[TS] and current[TS] < bucket:
+                self.close(_symbol_kline, sid, closed)
+            if not current[TS]:
+                prev = self.store.last(sid)
+                if prev is not None and bucket <= prev[TS]:
+                    continue
+                self.fill(_symbol_kline, sid, seconds, prev, bucket, closed)
+                prev = self.store.last(sid)
+                _open = last
+                if high != low and prev is not None:
+                    # 병합된 tick 은 첫 가격을 알 수 없으므로 직전 종가를 구간 안으로 맞춰 시가로 사용
+                    _open = min(max(float(prev[CLOSE]), low), high)
+                current[:] = (bucket, _open, high, low, last, volume)
+            elif bucket == current[TS]:
+                if high > current[HIGH]:
+                    current[HIGH] = high
+                if low < current[LOW]:
+                    current[LOW] = low
+                current[CLOSE] = last
+                current[VOLUME] += volume
+            # 이미 마감된 구간의 늦은 tick 은 버림
+        return closed
+
+    def close_due(self, _now):
+        """
+        구간이 지난 candle 마감 (tick 이 끊긴 symbol 도 indicator 가 제때 갱신되도록)
+        :return: [(symbol_kline, Candle), ...]
+        """
+        closed = []
+        for rows in self.sizes.values():
+            for _symbol_kline, sid, seconds in rows:
+                start = self.store.current[sid, TS]
+                if start and start + seconds <= _now:
+                    self.close(_symbol_kline, sid, closed)
+        return closed
+
+    def close(self, _symbol_kline, sid, closed):
+        current = self.store.current[sid]
+        row = tuple(current.tolist())
+        self.store.append(sid, row)
+        current[TS] = 0
+        closed.append((_symbol_kline, Candle(*row)))
+
+    def fill(self, _symbol_kline, sid, seconds, prev, bucket, closed):
+        """
+        마지막 마감 candle (prev) 과 bucket 사이의 빈 구간을 직전 종가 candle 로 채움 (최대 capacity 개)
+        """
+        if not self.fill_gaps or prev is None:
+            return
+        missing = int(round((bucket - prev[TS]) / seconds)) - 1
+        if missing <= 0:
+            return
+        price = float(prev[CLOSE])
+        start = bucket - min(missing, self.store.capacity) * seconds
+        while start < bucket:
+            row = (start, price, price, price, price, 0.0)
+            self.store.append(sid, row)
+            closed.append((_symbol_kline, Candle(*row)))
+            start += seconds
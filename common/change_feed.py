@@ -0,0 +1,56 @@
+from time import monotonic
+
+import ujson as json
+
+from common.log import get_logger
+
+log = get_logger('change_feed')
+
+
+class ChangeFeed(object):
+    """
+    redis pub/sub channel 로 전달되는 변경 이벤트 수신
+    메세지 하나는 op list (json) 이며, 연결 오류가 나면 다시 subscribe 하고 stale 을 세워
+    호출측에서 전체 재동기화 하도록 함
+    """
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.pubsub = None
+        self.stale = True
+
+    def subscribe(self):
+        if self.pubsub is not None:
+            try:
+                self.pubsub.close()
+            except Exception:
+                pass
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.channel)
+        self.stale = True
+
+    def drain(self, limit=10000, timeout=0):
+        """
+        대기중인 이벤트를 반환, timeout 이 있으면 첫 메세지까지 최대 timeout 초 대기
+        :param limit: 최대 op 수
+        :param timeout: seconds
+        :return: [op, op, ...]
+        """
+        ops = []
+        if self.pubsub is None:
+            self.subscribe()
+        deadline = monotonic() + timeout
+        try:
+            while len(ops) < limit:
+                # subscribe 응답도 None 으로 반환되므로 deadline 까지 다시 대기
+                msg = self.pubsub.get_message(timeout=0 if ops else max(deadline - monotonic(), 0))
+                if msg is None:
+                    if ops or monotonic() >= deadline:
+                        break
+                    continue
+                if msg['type'] == 'message':
+                    ops.extend(json.loads(msg['data']))
+        except Exception as e:
+            log.error('CHANGE_FEED_ERROR', _key=self.channel, channel=self.channel, error=str(e))
+            self.subscribe()
+        return ops
@@ -1,15 +1,52 @@
-import sys, os, traceback
 import inspect
 from time import sleep
 
+from common.log import get_logger
 from common.msg import MessageHandle
 from config.settings import TryExceptionConfig
 
+log = get_logger('decorator')
+
+
+_message_handle = None
+
+
+def message_handle():
+    """
+    retry_except 에서 사용하는 MessageHandle, process 에서 한번만 생성
+    """
+    global _message_handle
+    if _message_handle is None:
+        _message_handle = MessageHandle()
+    return _message_handle
+
+
+def is_method(func):
+    """
+    첫 인자가 self 인지 decorator 적용시 한번만 확인 (예외마다 inspect 하지 않음)
+    """
+    try:
+        params = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return False
+    return bool(params) and params[0] == 'self'
+
+
+def error_line(exc_tb):
+    """
+    traceback 마지막 frame 의 line 번호, source 를 읽는 traceback.extract_tb 를 쓰지 않음
+    """
+    while exc_tb.tb_next is not None:
+        exc_tb = exc_tb.tb_next
+    return exc_tb.tb_lineno
+
 
 def retry_except(func):
     """
     retry를 몇차례 시도할때 사용하는 decorator
     """
+    method = is_method(func)
+
     def try_except_function(*args, **kwargs):
         name = None
         for i in range(TryExceptionConfig.RETRY_COUNT):
@@ -17,25 +54,19 @@ def retry_except(func):
                 results = func(*args, **kwargs)
                 return results
             except Exception as e:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                _no = traceback.extract_tb(exc_tb)[-1][1]
-                try:
-                    is_method = inspect.getargspec(func)[0][0] == 'self'
-                except:
-                    is_method = False
-
-                if is_method:
+                _no = error_line(e.__traceback__)
+                if method:
                     name = 'Watcher.{}.{}'.format(args[0].__class__.__name__, func.__name__)
                     _args = args[1:]
                 else:
                     name = 'Watcher.{}'.format(func.__name__)
                     _args = args
+                log.error('ERROR', _key=name, name=name, line=_no, error=str(e), args=_args, kwargs=kwargs)
                 error = 'args: {}\nkwargs: {}\nerror: {}\n__name__: {}\nline: {}'
-                error =  error.format(str(_args), str(kwargs), str(e), str(name), _no)
-                print('ERROR:', error)
-                MessageHandle().send_slack(name, '{} No:{}'.format(name, _no), error)
+                error = error.format(str(_args), str(kwargs), str(e), str(name), _no)
+                message_handle().send_slack(name, '{} No:{}'.format(name, _no), error)
                 sleep(TryExceptionConfig.SLEEP)
-                MessageHandle().send_slack(name, 'Retry:{} failed'.format(TryExceptionConfig.RETRY_COUNT), str(error))
+                message_handle().send_slack(name, 'Retry:{} failed'.format(TryExceptionConfig.RETRY_COUNT), str(error))
         return False
     return try_except_function
 
@@ -43,28 +74,23 @@ def retry_except(func):
 def except_console(func):
     """
     에러 방생 시 console log만 남길때 사용하는 decorator
+    args 는 log writer thread 에서 문자열로 바꾸고, 같은 함수의 에러는 LogConfig 의 rate limit 적용
     """
+    method = is_method(func)
+
     def try_except_function(*args, **kwargs):
         try:
             results = func(*args, **kwargs)
             return results
         except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            _no = traceback.extract_tb(exc_tb)[-1][1]
-            try:
-                is_method = inspect.getargspec(func)[0][0] == 'self'
-            except:
-                is_method = False
-
-            if is_method:
+            if method:
                 _args = args[1:]
                 name = 'Watcher.{}.{}'.format(args[0].__class__.__name__, func.__name__)
             else:
                 _args = args
                 name = 'Watcher.{}'.format(func.__name__)
-            error = 'args: {}\nkwargs: {}\nerror: {}\n__name__: {}\nline: {}'
-            error = error.format(str(_args), str(kwargs), str(e), str(name), _no)
-            print('ERROR:', error)
+            log.error('ERROR', _key=name, name=name, line=error_line(e.__traceback__), error=str(e),
+                      args=_args, kwargs=kwargs)
 
             # MessageHandle().send_slack(name, '{} No:{}'.format(name, _no), error)
         return False
@@ -0,0 +1,22 @@
+from multiprocessing import Value
+from time import time
+
+
+class Heartbeat(object):
+    """
+    worker process 가 loop 마다 기록하는 마지막 실행 시간 (shared memory)
+    WatchDog 이 살아있지만 멈춘 process 를 찾는데 사용, 0 이면 아직 한번도 기록하지 않음
+    """
+    def __init__(self):
+        # 단일 writer 이므로 lock 없이 8 byte 기록
+        self.value = Value('d', 0.0, lock=False)
+
+    def beat(self):
+        self.value.value = time()
+
+    def reset(self):
+        self.value.value = 0.0
+
+    @property
+    def last(self):
+        return self.value.value
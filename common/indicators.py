@@ -0,0 +1,568 @@
+import math
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+
+from common.log import get_logger
+
+log = get_logger('indicators')
+
+# 마감된 candle, volume 은 price feed 에 거래량이 없어 구간에 수신한 tick 수 (CandleAggregator)
+# 거래량 indicator (mfi, vma, obv_cross, vma_cross) 도 tick 수를 거래량 대신 사용하므로 체결 건수 기준의 활동량을 봄
+Candle = namedtuple('Candle', ['ts', 'open', 'high', 'low', 'close', 'volume'])
+
+
+def sign(value):
+    return 1 if value > 0 else (-1 if value < 0 else 0)
+
+
+def oscillator_signal(value, over):
+    """
+    0 ~ 100 oscillator 의 과매도 (1) / 과매수 (-1) 판단, over 와 100 - over 중 작은 값이 과매도 기준
+    """
+    low, high = min(over, 100 - over), max(over, 100 - over)
+    if value <= low:
+        return 1
+    if value >= high:
+        return -1
+    return 0
+
+
+class Ema(object):
+    """
+    지수 이동평균, 처음 period 건은 단순 평균으로 시작
+    """
+    __slots__ = ('period', 'alpha', 'value', 'count')
+
+    def __init__(self, period, alpha=None):
+        self.period = period
+        self.alpha = 2.0 / (period + 1) if alpha is None else alpha
+        self.value = 0.0
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def update(self, x):
+        self.count += 1
+        if self.count <= self.period:
+            self.value += (x - self.value) / self.count
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class Rma(Ema):
+    """
+    Wilder 이동평균 (RSI, ATR)
+    """
+    __slots__ = ()
+
+    def __init__(self, period):
+        super().__init__(period, 1.0 / period)
+
+
+class Window(object):
+    """
+    최근 period 건의 합, 제곱합
+    """
+    __slots__ = ('period', 'items', 'total', 'total_sq')
+
+    def __init__(self, period):
+        self.period = period
+        self.items = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    @property
+    def ready(self):
+        return len(self.items) >= self.period
+
+    def update(self, x):
+        self.items.append(x)
+        self.total += x
+        self.total_sq += x * x
+        if len(self.items) > self.period:
+            old = self.items.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+        return self.total
+
+    @property
+    def mean(self):
+        return self.total / len(self.items) if self.items else 0.0
+
+    @property
+    def std(self):
+        if not self.items:
+            return 0.0
+        mean = self.mean
+        return math.sqrt(max(self.total_sq / len(self.items) - mean * mean, 0.0))
+
+
+class Extreme(object):
+    """
+    최근 period 건의 최대 (또는 최소), monotonic deque 로 update 당 amortized O(1)
+    """
+    __slots__ = ('period', 'items', 'count', 'better')
+
+    def __init__(self, period, highest=True):
+        self.period = period
+        self.items = deque()  # (index, value)
+        self.count = 0
+        self.better = (lambda a, b: a >= b) if highest else (lambda a, b: a <= b)
+
+    def update(self, x):
+        while self.items and self.better(x, self.items[-1][1]):
+            self.items.pop()
+        self.items.append((self.count, x))
+        if self.items[0][0] <= self.count - self.period:
+            self.items.popleft()
+        self.count += 1
+        return self.items[0][1]
+
+
+def true_range(candle, prev_close):
+    if prev_close is None:
+        return candle.high - candle.low
+    return max(candle.high - candle.low, abs(candle.high - prev_close), abs(candle.low - prev_close))
+
+
+class Indicator(ABC):
+    """
+    마감된 candle 마다 update 한번 (O(1)) 으로 상태를 갱신
+    signal(values) 는 주문별 설정값 (IndicatorMap 의 value) 으로 1 (매수) / -1 (매도) / 0 을 반환
+    """
+    ready = False
+
+    @abstractmethod
+    def update(self, candle):
+        """
+        :param candle: Candle, 마감된 순서대로 한번씩
+        """
+
+    @abstractmethod
+    def signal(self, values):
+        """
+        ready 일때만 호출
+        :param values: 주문의 indicator 설정값 tuple
+        :return: 1 / -1 / 0
+        """
+
+
+class Macd(Indicator):
+    def __init__(self, fast, slow, signal):
+        self.fast, self.slow, self.signal_ema = Ema(fast), Ema(slow), Ema(signal)
+        self.macd = 0.0
+
+    def update(self, candle):
+        fast, slow = self.fast.update(candle.close), self.slow.update(candle.close)
+        if self.slow.ready:
+            self.macd = fast - slow
+            self.signal_ema.update(self.macd)
+            self.ready = self.signal_ema.ready
+
+    def signal(self, values):
+        return sign(self.macd - self.signal_ema.value)
+
+
+class EmaCross(Indicator):
+    def __init__(self, short, long):
+        self.short, self.long = Ema(short), Ema(long)
+
+    def update(self, candle):
+        self.short.update(candle.close)
+        self.long.update(candle.close)
+        self.ready = self.short.ready and self.long.ready
+
+    def signal(self, values):
+        return sign(self.short.value - self.long.value)
+
+
+class Rsi(Indicator):
+    def __init__(self, period):
+        self.gain, self.loss = Rma(period), Rma(period)
+        self.prev = None
+        self.value = 50.0
+
+    def update(self, candle):
+        self.push(candle.close)
+
+    def push(self, close):
+        if self.prev is not None:
+            change = close - self.prev
+            gain, loss = self.gain.update(max(change, 0.0)), self.loss.update(max(-change, 0.0))
+            self.value = 100.0 if loss == 0 else 100.0 - 100.0 / (1.0 + gain / loss)
+            self.ready = self.gain.ready
+        self.prev = close
+        return self.value
+
+    def signal(self, values):
+        return oscillator_signal(self.value, values[0])
+
+
+class Stoch(Indicator):
+    """
+    %K 가 과매도 구간에서 %D 위 (반등), 과매수 구간에서 %D 아래 일때 signal
+    """
+    def __init__(self, k_period, smooth_k, d_period):
+        self.highest, self.lowest = Extreme(k_period), Extreme(k_period, highest=False)
+        self.count, self.k_period = 0, k_period
+        self.k, self.d = Window(smooth_k), Window(d_period)
+
+    def update(self, candle):
+        self.push(candle.high, candle.low, candle.close)
+
+    def push(self, high, low, close):
+        highest, lowest = self.highest.update(high), self.lowest.update(low)
+        self.count += 1
+        if self.count < self.k_period:
+            return
+        raw = 50.0 if highest == lowest else 100.0 * (close - lowest) / (highest - lowest)
+        self.k.update(raw)
+        if self.k.ready:
+            self.d.update(self.k.mean)
+            self.ready = self.d.ready
+
+    def signal(self, values):
+        side = oscillator_signal(self.k.mean, values[0])
+        return side if side == sign(self.k.mean - self.d.mean) else 0
+
+
+class StochRsi(Stoch):
+    def __init__(self, rsi_period, k_period, smooth_k, d_period):
+        super().__init__(k_period, smooth_k, d_period)
+        self.rsi = Rsi(rsi_period)
+
+    def update(self, candle):
+        value = self.rsi.push(candle.close)
+        if self.rsi.ready:
+            self.push(value, value, value)
+
+
+class Mfi(Indicator):
+    """
+    money flow 는 typical price * tick 수
+    """
+    def __init__(self, period):
+        self.positive, self.negative = Window(period), Window(period)
+        self.prev = None
+        self.value = 50.0
+
+    def update(self, candle):
+        typical = (candle.high + candle.low + candle.close) / 3
+        if self.prev is not None:
+            flow = typical * candle.volume
+            positive = self.positive.update(flow if typical > self.prev else 0.0)
+            negative = self.negative.update(flow if typical < self.prev else 0.0)
+            self.value = 100.0 if negative <= 0 else 100.0 - 100.0 / (1.0 + positive / negative)
+            self.ready = self.positive.ready
+        self.prev = typical
+
+    def signal(self, values):
+        return oscillator_signal(self.value, values[0])
+
+
+class BollingerBand(Indicator):
+    """
+    band: band 폭 대비 % 만큼 안쪽까지 닿으면 signal (0 이면 band 를 넘어야 함)
+    """
+    def __init__(self, period, deviations):
+        self.window = Window(period)
+        self.deviations = deviations
+        self.close = 0.0
+
+    def update(self, candle):
+        self.window.update(candle.close)
+        self.close = candle.close
+        self.ready = self.window.ready
+
+    def signal(self, values):
+        mean, width = self.window.mean, self.window.std * self.deviations
+        margin = 2 * width * values[0] / 100
+        if self.close <= mean - width + margin:
+            return 1
+        if self.close >= mean + width - margin:
+            return -1
+        return 0
+
+
+class Vma(Indicator):
+    """
+    rate: 거래량 (tick 수) 이 평균의 rate 배 이상이면 candle 방향으로 signal
+    """
+    def __init__(self, period):
+        self.window = Window(period)
+        self.volume, self.side = 0.0, 0
+
+    def update(self, candle):
+        self.window.update(candle.volume)
+        self.volume, self.side = candle.volume, sign(candle.close - candle.open)
+        self.ready = self.window.ready
+
+    def signal(self, values):
+        return self.side if self.volume >= self.window.mean * values[0] else 0
+
+
+class ObvCross(Indicator):
+    """
+    OBV 는 종가가 오른 candle 의 tick 수를 더하고 내린 candle 의 tick 수를 뺀 누적값
+    """
+    def __init__(self, short, long):
+        self.short, self.long = Ema(short), Ema(long)
+        self.obv = 0.0
+        self.prev = None
+
+    def update(self, candle):
+        if self.prev is not None:
+            self.obv += candle.volume * sign(candle.close - self.prev)
+        self.prev = candle.close
+        self.short.update(self.obv)
+        self.long.update(self.obv)
+        self.ready = self.short.ready and self.long.ready
+
+    def signal(self, values):
+        return sign(self.short.value - self.long.value)
+
+
+class Supertrend(Indicator):
+    def __init__(self, period, multiplier):
+        self.atr = Rma(period)
+        self.multiplier = multiplier
+        self.upper = self.lower = None
+        self.trend = 1
+        self.prev_close = None
+
+    def update(self, candle):
+        atr = self.atr.update(true_range(candle, self.prev_close))
+        middle = (candle.high + candle.low) / 2
+        upper, lower = middle + self.multiplier * atr, middle - self.multiplier * atr
+        if self.upper is not None:
+            if not (upper < self.upper or self.prev_close > self.upper):
+                upper = self.upper
+            if not (lower > self.lower or self.prev_close < self.lower):
+                lower = self.lower
+            if self.trend == -1 and candle.close > upper:
+                self.trend = 1
+            elif self.trend == 1 and candle.close < lower:
+                self.trend = -1
+        self.upper, self.lower, self.prev_close = upper, lower, candle.close
+        self.ready = self.atr.ready
+
+    def signal(self, values):
+        return self.trend
+
+
+class Tii(Indicator):
+    """
+    Trend Intensity Index, 각 candle 의 편차는 그 시점의 이동평균 기준으로 계산 (candle 당 O(1))
+    """
+    def __init__(self, period, signal):
+        self.average = Window(period)
+        self.positive, self.negative = Window(max(period // 2, 1)), Window(max(period // 2, 1))
+        self.signal_ema = Ema(signal)
+        self.value = 50.0
+
+    def update(self, candle):
+        self.average.update(candle.close)
+        if not self.average.ready:
+            return
+        deviation = candle.close - self.average.mean
+        positive = self.positive.update(max(deviation, 0.0))
+        negative = self.negative.update(max(-deviation, 0.0))
+        self.value = 50.0 if positive + negative == 0 else 100.0 * positive / (positive + negative)
+        self.signal_ema.update(self.value)
+        self.ready = self.positive.ready and self.signal_ema.ready
+
+    def signal(self, values):
+        # 추세 지표이므로 oscillator 와 반대 방향, signal line 방향과 같을때만
+        side = -oscillator_signal(self.value, values[0])
+        return side if side == sign(self.value - self.signal_ema.value) else 0
+
+
+class VmaCross(Indicator):
+    """
+    단기 거래량 (tick 수) 평균이 장기 평균보다 클때 candle 방향으로 signal
+    """
+    def __init__(self, short, long):
+        self.short, self.long = Window(short), Window(long)
+        self.side = 0
+
+    def update(self, candle):
+        self.short.update(candle.volume)
+        self.long.update(candle.volume)
+        self.side = sign(candle.close - candle.open)
+        self.ready = self.long.ready
+
+    def signal(self, values):
+        return self.side if self.short.mean > self.long.mean else 0
+
+
+class AtrTrailingStop(Indicator):
+    """
+    highlow 가 0 이 아니면 stop 을 종가 대신 고가 / 저가 기준으로 계산
+    """
+    def __init__(self, period, multiplier, highlow):
+        self.atr = Rma(period)
+        self.multiplier = multiplier
+        self.highlow = bool(highlow)
+        self.stop = None
+        self.trend = 1
+        self.prev_close = None
+
+    def update(self, candle):
+        offset = self.multiplier * self.atr.update(true_range(candle, self.prev_close))
+        long_stop = (candle.high if self.highlow else candle.close) - offset
+        short_stop = (candle.low if self.highlow else candle.close) + offset
+        if self.stop is None:
+            self.stop = long_stop
+        elif self.trend == 1:
+            self.stop = max(self.stop, long_stop)
+            if candle.close < self.stop:
+                self.trend, self.stop = -1, short_stop
+        else:
+            self.stop = min(self.stop, short_stop)
+            if candle.close > self.stop:
+                self.trend, self.stop = 1, long_stop
+        self.prev_close = candle.close
+        self.ready = self.atr.ready
+
+    def signal(self, values):
+        return self.trend
+
+
+# IndicatorMap.indicator_map 의 name: (class, config 중 period 처럼 정수인 항목 위치)
+INDICATORS = {
+    'macd': (Macd, (0, 1, 2)),
+    'ema_cross': (EmaCross, (0, 1)),
+    'stoch': (Stoch, (0, 1, 2)),
+    'stoch_rsi': (StochRsi, (0, 1, 2, 3)),
+    'rsi': (Rsi, (0,)),
+    'mfi': (Mfi, (0,)),
+    'bollinger_band': (BollingerBand, (0,)),
+    'vma': (Vma, (0,)),
+    'obv_cross': (ObvCross, (0, 1)),
+    'supertrend': (Supertrend, (0,)),
+    'tii': (Tii, (0, 1)),
+    'vma_cross': (VmaCross, (0, 1)),
+    'atr_trailing_stop': (AtrTrailingStop, (0,)),
+}
+
+
+def create(indicator_key):
+    """
+    :param indicator_key: 'macd|12.0|26.0|9.0' (BaseDb.db_set_order 에서 만든 key)
+    :return: Indicator
+    """
+    name, *params = indicator_key.split('|')
+    cls, periods = INDICATORS[name]
+    params = [max(int(float(value)), 1) if i in periods else float(value) for i, value in enumerate(params)]
+    return cls(*params)
+
+
+class OrderSignal(object):
+    """
+    indicator 주문 하나의 설정 (MTS3_ORDER_LIST 의 indicator_dic) 과 마지막 판단
+    """
+    __slots__ = ('id', 'direction', 'action', 'indicators', 'last_side')
+
+    def __init__(self, _id, indicator_dic):
+        self.id = _id
+        self.direction = int(indicator_dic['direction'])
+        self.action = 'OPEN' if indicator_dic.get('indicatorType', 'OPEN') == 'OPEN' else 'CLOSE'
+        self.indicators = [(key, tuple(values)) for key, values in indicator_dic['indicators'].items()]
+        self.last_side = indicator_dic.get('last_side')
+
+
+class IndicatorEngine(object):
+    """
+    symbol_kline 별로 구독중인 indicator key 를 candle 마다 한번씩만 계산하고 구독 주문에 결과를 전달
+    주문은 모든 indicator 의 signal 이 주문 방향으로 바뀌는 candle 에서 fire
+    (처음 판단한 candle 에서 이미 같은 방향이면 다음 전환까지 대기)
+    새 주문의 마지막 판단은 seed 로 warm 된 indicator 에서 채우므로 재시작 후 첫 candle 에서 다시 fire 하지 않음
+    """
+    def __init__(self):
+        self.indicators = {}  # symbol_kline: {indicator key: Indicator}
+        self.orders = {}  # symbol_kline: {id: OrderSignal}
+
+    def subscribe(self, symbol_kline, members, orders):
+        """
+        구독 목록 반영, 구독 주문이 없는 indicator 와 목록에 없는 주문은 삭제
+        :param members: {indicator key: {id, ...}} (BaseDb.db_get_indicator_members)
+        :param orders: {id: indicator_dic} 새로 구독한 주문
+        :return: 새로 만든 indicator key 목록 (이전 candle 로 warm 필요)
+        """
+        indicators = self.indicators.setdefault(symbol_kline, {})
+        current = self.orders.setdefault(symbol_kline, {})
+        ids = set()
+        for key, members_of in members.items():
+            ids.update(members_of)
+        for _id in [i for i in current if i not in ids]:
+            del current[_id]
+        for _id, indicator_dic in orders.items():
+            if _id in ids:
+                current[_id] = OrderSignal(_id, indicator_dic)
+        added = []
+        for key in [i for i in indicators if i not in members]:
+            del indicators[key]
+        for key in members:
+            if key not in indicators:
+                try:
+                    indicators[key] = create(key)
+                    added.append(key)
+                except (KeyError, ValueError, TypeError) as e:
+                    log.warning('INDICATOR_UNKNOWN_KEY', _key=key, symbol_kline=symbol_kline, key=key, error=str(e))
+        return added
+
+    def warm(self, symbol_kline, key, candles):
+        indicator = self.indicators[symbol_kline][key]
+        for candle in candles:
+            indicator.update(candle)
+
+    def seed(self, symbol_kline, ids):
+        """
+        새로 구독한 주문의 last_side 를 현재 (warm 된) indicator 의 signal 로 채움, fire 하지 않음
+        :param ids: 새로 구독한 주문 id 목록
+        """
+        orders = self.orders.get(symbol_kline, {})
+        self.evaluate(symbol_kline, [orders[_id] for _id in ids if _id in orders])
+
+    def remove(self, symbol_kline, ids):
+        orders = self.orders.get(symbol_kline, {})
+        for _id in ids:
+            orders.pop(_id, None)
+
+    def update(self, symbol_kline, candle):
+        """
+        :param candle: Candle
+        :return: [OrderSignal, ...] fire 할 주문
+        """
+        for indicator in self.indicators.get(symbol_kline, {}).values():
+            indicator.update(candle)
+        return self.evaluate(symbol_kline)
+
+    def evaluate(self, symbol_kline, orders=None):
+        """
+        :param orders: 판단할 OrderSignal 목록, None 이면 구독중인 전체
+        :return: [OrderSignal, ...] signal 이 주문 방향으로 바뀐 주문
+        """
+        indicators = self.indicators.get(symbol_kline, {})
+        signals = {}  # (key, values): signal, 같은 설정의 주문은 한번만 판단
+        fired = []
+        for order in (self.orders.get(symbol_kline, {}).values() if orders is None else orders):
+            side = None
+            for item in order.indicators:
+                signal = signals.get(item)
+                if signal is None:
+                    indicator = indicators.get(item[0])
+                    signal = signals[item] = indicator.signal(item[1]) if (indicator is not None) and indicator.ready else None
+                if signal is None:
+                    side = None
+                    break
+                side = signal if side is None or side == signal else 0
+            if side is None:
+                continue
+            if side == order.direction and order.last_side is not None and order.last_side != side:
+                fired.append(order)
+            order.last_side = side
+        return fired
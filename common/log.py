@@ -0,0 +1,162 @@
+import json
+import logging
+import multiprocessing
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.util import Finalize
+from queue import Queue, Full
+
+from config.settings import DEBUG
+from config.tuning import LogConfig
+
+ROOT = 'Watcher'
+_loggers = {}
+_handler = None
+
+
+class DropQueueHandler(QueueHandler):
+    """
+    record 를 호출한 thread 에서 문자열로 format 한 뒤 queue 에 넣음 (writer thread 는 쓰기만),
+    queue 가 가득 차면 기다리지 않고 버림
+    """
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 넣은 뒤에 field 값 (주문 dict 등) 이 바뀌어도 기록 내용은 그대로
+        record = super().prepare(record)
+        record.fields = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    같은 (logger, event, key) 는 period 동안 burst 건까지만 기록, 버린 건수는 다음 구간의 첫 record 에 suppressed 로 붙임
+    """
+    def __init__(self, period, burst):
+        super().__init__()
+        self.period = period
+        self.burst = burst
+        self.windows = {}  # key: [구간 시작, 기록 수, 버린 수]
+
+    def filter(self, record):
+        if not getattr(record, 'limit', True):
+            return True
+        key = (record.name, record.msg, getattr(record, 'rate_key', None))
+        window = self.windows.get(key)
+        if window is None or record.created - window[0] >= self.period:
+            if window is not None and window[2]:
+                record.suppressed = window[2]
+            self.windows[key] = [record.created, 1, 0]
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class EventFormatter(logging.Formatter):
+    """
+    'json': {"ts", "level", "process", "logger", "event", field ...} 한 줄
+    'text': '시간 level process logger event key=value ...'
+    """
+    def __init__(self, fmt='json'):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = dict(getattr(record, 'fields', None) or {})
+        if getattr(record, 'suppressed', 0):
+            fields['suppressed'] = record.suppressed
+        if record.exc_info:
+            fields['exc'] = self.formatException(record.exc_info)
+        event = record.getMessage()
+        if self.fmt == 'json':
+            row = {'ts': round(record.created, 6), 'level': record.levelname, 'process': record.processName,
+                   'logger': record.name, 'event': event}
+            row.update(fields)
+            return json.dumps(row, default=str, ensure_ascii=False)
+        return ' '.join(['{}.{:03d}'.format(self.formatTime(record, '%Y-%m-%d %H:%M:%S'), int(record.msecs)),
+                         record.levelname, record.processName, record.name, event] +
+                        ['{}={}'.format(k, v) for k, v in fields.items()])
+
+
+class EventLogger(object):
+    """
+    event 이름과 field 로 기록, 기록하지 않는 level 이면 record 를 만들지 않음
+    field 는 rate limit 을 통과한 record 만 호출한 thread 에서 문자열로 바뀜
+    :param _key: rate limit 을 나눌 key (같은 event 라도 key 가 다르면 따로 제한)
+    :param _limit: False 면 rate limit 없이 기록 (주문 처리 결과 등)
+    """
+    __slots__ = ('logger',)
+
+    def __init__(self, name):
+        self.logger = logging.getLogger('{}.{}'.format(ROOT, name))
+
+    def log(self, level, event, _key=None, _limit=True, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={'fields': fields, 'rate_key': _key, 'limit': _limit})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+
+def get_logger(name):
+    """
+    :param name: module 또는 role 이름 ('PriceWatcher', 'redis_db', ...)
+    """
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = EventLogger(name)
+    return logger
+
+
+def setup_logging(process_name=None):
+    """
+    process 시작시 호출, Watcher logger 를 queue 로 연결하고 background thread 가 stdout 에 기록
+    fork 로 물려받은 handler (부모 process 의 queue, writer thread 는 없음) 는 교체
+    :param process_name: record 의 process 이름 (WatchDog.process_list key)
+    """
+    global _handler
+    if process_name:
+        multiprocessing.current_process().name = process_name
+    root = logging.getLogger(ROOT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(LogConfig.LEVEL or (logging.DEBUG if DEBUG else logging.INFO))
+    root.propagate = False
+    queue = Queue(LogConfig.QUEUE_SIZE)
+    _handler = DropQueueHandler(queue)
+    _handler.addFilter(RateLimitFilter(LogConfig.RATE_SEC, LogConfig.RATE_BURST))
+    _handler.setFormatter(EventFormatter(LogConfig.FORMAT))
+    root.addHandler(_handler)
+    # queue 의 record 는 이미 format 된 문자열
+    stream = logging.StreamHandler(sys.stdout)
+    listener = QueueListener(queue, stream)
+    listener.start()
+    # 종료시 queue 에 남은 record 기록 (multiprocessing child 는 atexit 대신 Finalize 가 실행됨)
+    Finalize(None, listener.stop, exitpriority=0)
+
+
+def dropped():
+    """
+    queue 가 가득 차서 버린 record 수
+    """
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,158 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.request import urlopen
+
+from common.log import get_logger
+
+log = get_logger('metrics')
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram(object):
+    """
+    고정 bucket histogram, observe 는 bisect 한번
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """
+    process 별 counter, gauge, histogram
+    label 은 keyword 로 전달 (metrics.inc('watcher_ticks_total', 3, symbol='BTC-USDT'))
+    """
+    def __init__(self, process):
+        self.process = process
+        self.counters = {}  # (name, labels): value
+        self.gauges = {}
+        self.histograms = {}  # (name, labels): Histogram
+        self.server = None
+
+    def inc(self, name, value=1, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, /, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def snapshot(self):
+        """
+        :return: {'counter': [[name, labels, value]], 'gauge': [...], 'histogram': [[name, labels, buckets, counts, sum, count]]}
+        """
+        process = [('process', self.process)]
+        return {'counter': [[name, dict(process + list(labels)), value] for (name, labels), value in list(self.counters.items())],
+                'gauge': [[name, dict(process + list(labels)), value] for (name, labels), value in list(self.gauges.items())],
+                'histogram': [[name, dict(process + list(labels)), list(h.buckets), list(h.counts), h.sum, h.count]
+                              for (name, labels), h in list(self.histograms.items())]}
+
+    def serve(self, host, port):
+        """
+        /metrics (prometheus text), /metrics.json (snapshot) 를 daemon thread 로 제공
+        """
+        self.server = start_server(host, port, lambda: [self.snapshot()])
+        return self.server
+
+
+def label_text(labels, extra=None):
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+
+def render(snapshots):
+    """
+    여러 process 의 snapshot 을 metric 이름별로 묶어 prometheus text format 으로 변환
+    :param snapshots: [Metrics.snapshot(), ...]
+    :return: str
+    """
+    families = {}
+    for snapshot in snapshots:
+        for kind in ('counter', 'gauge', 'histogram'):
+            for item in snapshot.get(kind, []):
+                families.setdefault((item[0], kind), []).append(item)
+    lines = []
+    for (name, kind), items in sorted(families.items()):
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for item in items:
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(name, label_text(item[1]), item[2]))
+                continue
+            _, labels, buckets, counts, total, count = item
+            cumulative = 0
+            for le, n in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append('{}_bucket{} {}'.format(name, label_text(labels, ('le', le)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, label_text(labels), total))
+            lines.append('{}_count{} {}'.format(name, label_text(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+def fetch_snapshot(host, port, timeout=0.5):
+    """
+    다른 process 의 /metrics.json 조회
+    :return: [snapshot, ...] / None (연결 실패)
+    """
+    try:
+        with urlopen('http://{}:{}/metrics.json'.format(host, port), timeout=timeout) as res:
+            return json.loads(res.read())
+    except Exception:
+        return None
+
+
+def start_server(host, port, collect):
+    """
+    :param collect: 호출시 [snapshot, ...] 을 반환하는 함수
+    :return: ThreadingHTTPServer / None (bind 실패)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = render(collect()).encode(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(collect()).encode(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        log.error('METRICS_SERVER_ERROR', host=host, port=port, error=str(e))
+        return None
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
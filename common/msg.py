@@ -1,10 +1,13 @@
 from datetime import datetime
-import requests
 import simplejson
 
 
 from database.mongo import Conn
+from database.registry import ConnectionRegistry
 from config.settings import SlackMSG, SERVICE
+from common.log import get_logger
+
+log = get_logger('msg')
 
 
 class MessageHandle(Conn):
@@ -14,7 +17,10 @@ class MessageHandle(Conn):
     """
     def __init__(self):
         Conn.__init__(self)
-        self.s = requests.Session()
+
+    @property
+    def s(self):
+        return ConnectionRegistry.http()
 
     def send_slack(self, event_type, title, msg):
         data = {'username': SERVICE, 'title': title, 'text': msg,
@@ -26,7 +32,7 @@ class MessageHandle(Conn):
             # self.mongo_ins_error({'event_type': event_type, 'title': title, 'msg': msg})
             return res
         except Exception as e:
-            print('send_slack_error: {}'.format(str(e)))
+            log.error('SEND_SLACK_ERROR', error=str(e))
             return False
 
 
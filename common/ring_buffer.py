@@ -0,0 +1,113 @@
+import struct
+from multiprocessing import shared_memory
+
+SEQ = struct.Struct('<Q')
+RECORD = struct.Struct('<IIdd')  # symbol id, tick 수, price, timestamp (24 bytes)
+SYMBOL = struct.Struct('<32s')
+
+WRITE_OFFSET = 0  # producer 만 기록
+READ_OFFSET = 64  # consumer 만 기록
+SYMBOL_COUNT_OFFSET = 128
+SYMBOL_OFFSET = 192
+
+
+class TickRing(object):
+    """
+    price tick 전달용 shared memory ring buffer (single producer / single consumer)
+    record 는 (symbol id, tick 수, price, timestamp) 고정 크기 binary 이며, symbol 이름은 같은 block 의
+    symbol table 에 producer 가 추가하고 consumer 는 모르는 id 를 만나면 table 을 다시 읽음
+    fork 전에 WatchDog 에서 생성하여 GetPriceProc, PriceWatcher 에 전달
+    """
+    def __init__(self, capacity=65536, max_symbols=4096):
+        self.capacity = capacity
+        self.max_symbols = max_symbols
+        self.record_offset = SYMBOL_OFFSET + max_symbols * SYMBOL.size
+        self.shm = shared_memory.SharedMemory(create=True, size=self.record_offset + capacity * RECORD.size)
+        self.buf = self.shm.buf
+        SEQ.pack_into(self.buf, WRITE_OFFSET, 0)
+        SEQ.pack_into(self.buf, READ_OFFSET, 0)
+        SEQ.pack_into(self.buf, SYMBOL_COUNT_OFFSET, 0)
+        self.symbol_ids = {}  # producer: symbol: id
+        self.symbols = []  # consumer: id: symbol
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def qsize(self):
+        return SEQ.unpack_from(self.buf, WRITE_OFFSET)[0] - SEQ.unpack_from(self.buf, READ_OFFSET)[0]
+
+    def free(self):
+        return self.capacity - self.qsize()
+
+    def symbol_id(self, symbol):
+        """
+        producer 측 symbol id 조회, 처음 보는 symbol 은 table 에 추가
+        :return: id / None (table 가득 참, 이름이 SYMBOL.size byte 보다 김)
+        """
+        _id = self.symbol_ids.get(symbol)
+        if _id is None:
+            name = symbol.encode()
+            if len(name) > SYMBOL.size:
+                # 잘라서 기록하면 다른 symbol 과 섞이거나 multibyte 중간에서 잘려 decode 할 수 없음
+                return None
+            # 재시작된 producer 는 기존 table 을 먼저 읽어옴
+            _id = SEQ.unpack_from(self.buf, SYMBOL_COUNT_OFFSET)[0]
+            if _id > len(self.symbol_ids):
+                self.symbol_ids = {self.symbol_name(i): i for i in range(_id)}
+                if symbol in self.symbol_ids:
+                    return self.symbol_ids[symbol]
+            if _id >= self.max_symbols:
+                return None
+            SYMBOL.pack_into(self.buf, SYMBOL_OFFSET + _id * SYMBOL.size, name)
+            SEQ.pack_into(self.buf, SYMBOL_COUNT_OFFSET, _id + 1)
+            self.symbol_ids[symbol] = _id
+        return _id
+
+    def symbol_name(self, _id):
+        """
+        consumer 측 symbol 이름 조회
+        """
+        if _id >= len(self.symbols):
+            count = SEQ.unpack_from(self.buf, SYMBOL_COUNT_OFFSET)[0]
+            for i in range(len(self.symbols), count):
+                self.symbols.append(SYMBOL.unpack_from(self.buf, SYMBOL_OFFSET + i * SYMBOL.size)[0].rstrip(b'\x00').decode())
+        return self.symbols[_id]
+
+    def put(self, symbol, price, ts, count=1):
+        """
+        :param count: record 가 대표하는 tick 수, 병합된 tick 을 high, low, last 로 나누어 기록할때 candle volume 유지용
+        :return: True / False (buffer 가득 참 또는 symbol table 가득 참)
+        """
+        write_seq = SEQ.unpack_from(self.buf, WRITE_OFFSET)[0]
+        if write_seq - SEQ.unpack_from(self.buf, READ_OFFSET)[0] >= self.capacity:
+            return False
+        _id = self.symbol_id(symbol)
+        if _id is None:
+            return False
+        RECORD.pack_into(self.buf, self.record_offset + (write_seq % self.capacity) * RECORD.size, _id, count, price, ts)
+        SEQ.pack_into(self.buf, WRITE_OFFSET, write_seq + 1)
+        return True
+
+    def get_many(self, limit=None):
+        """
+        읽을 수 있는 record 를 모두 반환 (최대 limit 건)
+        :return: [(symbol, price, ts, count), ...]
+        """
+        read_seq = SEQ.unpack_from(self.buf, READ_OFFSET)[0]
+        available = SEQ.unpack_from(self.buf, WRITE_OFFSET)[0] - read_seq
+        if limit is not None:
+            available = min(available, limit)
+        if available <= 0:
+            return []
+        rows = []
+        start = read_seq % self.capacity
+        first = min(available, self.capacity - start)
+        for begin, count in ((start, first), (0, available - first)):
+            if count:
+                offset = self.record_offset + begin * RECORD.size
+                for _id, ticks, price, ts in RECORD.iter_unpack(self.buf[offset:offset + count * RECORD.size]):
+                    rows.append((self.symbol_name(_id), price, ts, ticks))
+        SEQ.pack_into(self.buf, READ_OFFSET, read_seq + available)
+        return rows
@@ -0,0 +1,56 @@
+import heapq
+
+
+class DeadlineHeap(object):
+    """
+    key 별 deadline 을 보관하는 priority queue
+    같은 key 를 다시 push 하거나 discard 하면 기존 항목은 꺼낼때 무시 (lazy invalidation)
+    """
+    def __init__(self):
+        self.heap = []
+        self.due = {}  # key: deadline
+
+    def __len__(self):
+        return len(self.due)
+
+    def __contains__(self, key):
+        return key in self.due
+
+    def clear(self):
+        self.heap = []
+        self.due = {}
+
+    def push(self, key, deadline):
+        self.due[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+
+    def discard(self, key):
+        self.due.pop(key, None)
+
+    def peek(self):
+        """
+        가장 빠른 deadline, 없으면 None
+        """
+        while self.heap:
+            deadline, key = self.heap[0]
+            if self.due.get(key) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now):
+        """
+        deadline 이 now 이전인 key 를 모두 꺼냄
+        :return: [key, ...]
+        """
+        keys = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.heap)
+            if self.due.get(key) == deadline:
+                del self.due[key]
+                keys.append(key)
+        if len(self.heap) > 2 * len(self.due) + 1024:
+            # 무시된 항목이 많으면 재구성
+            self.heap = [(deadline, key) for key, deadline in self.due.items()]
+            heapq.heapify(self.heap)
+        return keys
@@ -0,0 +1,105 @@
+import mmap
+import os
+import struct
+
+MAGIC = b'ETSTAPE1'
+HEADER = struct.Struct('<8sIIQ')  # magic, record size, max symbols, symbol count
+RECORD = struct.Struct('<I4xdd')  # symbol id, price, timestamp (24 bytes, TickRing 과 같은 record)
+SYMBOL = struct.Struct('<32s')
+SYMBOL_OFFSET = 64
+
+
+class TickTapeWriter(object):
+    """
+    price tick 을 고정 크기 binary record 로 파일 끝에 추가
+    file: header (64 bytes) + symbol table (max_symbols * 32 bytes) + record ...
+    같은 파일을 다시 열면 기존 symbol table 을 읽고 이어서 기록, 끝의 잘린 record 는 버림
+    """
+    def __init__(self, path, max_symbols=4096):
+        self.path = path
+        self.symbol_ids = {}
+        if os.path.exists(path) and os.path.getsize(path) >= SYMBOL_OFFSET:
+            self.f = open(path, 'r+b')
+            magic, size, self.max_symbols, count = HEADER.unpack(self.f.read(HEADER.size))
+            if magic != MAGIC or size != RECORD.size:
+                raise ValueError('not a tick tape: {}'.format(path))
+            self.record_offset = SYMBOL_OFFSET + self.max_symbols * SYMBOL.size
+            for i in range(count):
+                self.f.seek(SYMBOL_OFFSET + i * SYMBOL.size)
+                self.symbol_ids[SYMBOL.unpack(self.f.read(SYMBOL.size))[0].rstrip(b'\x00').decode()] = i
+            end = os.path.getsize(path)
+            self.f.truncate(end - (end - self.record_offset) % RECORD.size)
+        else:
+            self.f = open(path, 'w+b')
+            self.max_symbols = max_symbols
+            self.record_offset = SYMBOL_OFFSET + max_symbols * SYMBOL.size
+            self.f.write(HEADER.pack(MAGIC, RECORD.size, max_symbols, 0).ljust(self.record_offset, b'\x00'))
+        self.f.seek(0, os.SEEK_END)
+
+    def symbol_id(self, symbol):
+        _id = self.symbol_ids.get(symbol)
+        if _id is None:
+            _id = len(self.symbol_ids)
+            if _id >= self.max_symbols:
+                return None
+            self.f.seek(SYMBOL_OFFSET + _id * SYMBOL.size)
+            self.f.write(SYMBOL.pack(symbol.encode()))
+            self.f.seek(HEADER.size - 8)
+            self.f.write(struct.pack('<Q', _id + 1))
+            self.f.seek(0, os.SEEK_END)
+            self.symbol_ids[symbol] = _id
+        return _id
+
+    def write(self, symbol, price, ts):
+        """
+        :return: True / False (symbol table 가득 참)
+        """
+        _id = self.symbol_id(symbol)
+        if _id is None:
+            return False
+        self.f.write(RECORD.pack(_id, price, ts))
+        return True
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class TickTape(object):
+    """
+    TickTapeWriter 로 기록한 파일을 mmap 으로 읽음
+    """
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, max_symbols, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or size != RECORD.size:
+            raise ValueError('not a tick tape: {}'.format(path))
+        self.record_offset = SYMBOL_OFFSET + max_symbols * SYMBOL.size
+        self.symbols = [SYMBOL.unpack_from(self.mm, SYMBOL_OFFSET + i * SYMBOL.size)[0].rstrip(b'\x00').decode()
+                        for i in range(count)]
+        self.count = (len(self.mm) - self.record_offset) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.read()
+
+    def read(self, start=0, stop=None):
+        """
+        :return: generator (symbol, price, ts)
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        view = memoryview(self.mm)[self.record_offset + start * RECORD.size:self.record_offset + stop * RECORD.size]
+        try:
+            for _id, price, ts in RECORD.iter_unpack(view):
+                yield self.symbols[_id], price, ts
+        finally:
+            view.release()
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
@@ -0,0 +1,54 @@
+
+
+class TickConflator(object):
+    """
+    scan 사이에 들어온 tick 을 symbol 별 [last, high, low, ts, count] 로 병합
+    high, low 를 유지하므로 병합된 구간 안의 trigger 도 누락되지 않음
+    ts 는 병합된 tick 중 가장 오래된 수신 시간 (lag 계산용), count 는 병합된 tick 수 (candle volume)
+    """
+    def __init__(self):
+        self.pending = {}
+        self.ticks = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, symbol, price, ts, count=1):
+        """
+        :param count: price 가 대표하는 tick 수 (ring 에 병합되어 기록된 record 는 0 또는 여러건)
+        """
+        row = self.pending.get(symbol)
+        if row is None:
+            self.pending[symbol] = [price, price, price, ts, count]
+        else:
+            row[0] = price
+            if price > row[1]:
+                row[1] = price
+            if price < row[2]:
+                row[2] = price
+            row[4] += count
+        self.ticks += count
+
+    def merge(self, batch):
+        """
+        이미 병합된 batch 를 뒤에 이어 붙임
+        :param batch: {symbol: [last, high, low, ts, count]}
+        """
+        for symbol, (last, high, low, ts, count) in batch.items():
+            row = self.pending.get(symbol)
+            if row is None:
+                self.pending[symbol] = [last, high, low, ts, count]
+            else:
+                row[0] = last
+                if high > row[1]:
+                    row[1] = high
+                if low < row[2]:
+                    row[2] = low
+                if ts < row[3]:
+                    row[3] = ts
+                row[4] += count
+
+    def take(self):
+        batch = self.pending
+        self.pending = {}
+        return batch
@@ -0,0 +1,242 @@
+from bisect import bisect_right, insort
+from heapq import merge
+
+MEMBER_MAX = chr(0x10ffff)
+
+
+class TrailGroup(object):
+    """
+    같은 extreme (trailing 시작 후 최고가/최저가) 을 가진 trailing stop 묶음
+    stop = extreme - direction * distance 이므로 distance 오름차순으로 두면 먼저 trigger 되는 순서
+    """
+    __slots__ = ('extreme', 'entries', 'dirty')
+
+    def __init__(self, extreme):
+        self.extreme = extreme
+        self.entries = []  # [(distance, member)]
+        self.dirty = True  # redis 에 기록하지 않은 stop 변경
+
+
+class TrailSide(object):
+    """
+    symbol, direction 하나의 trailing stop
+    direction 1: 매도 stop, 가격이 오르면 stop 도 올라감 (price <= stop 이면 trigger)
+    direction -1: 매수 stop, 가격이 내리면 stop 도 내려감 (price >= stop 이면 trigger)
+    새 extreme 이 나오면 모든 group 이 같은 extreme 을 가지게 되므로 하나로 합침,
+    group 은 보통 1개이고 tick 마다 주문 수와 관계없이 group 수 만큼만 비교
+    """
+    __slots__ = ('direction', 'groups', 'members')
+
+    def __init__(self, direction):
+        self.direction = direction
+        self.groups = []  # direction * extreme 오름차순, 마지막 group 의 extreme 이 가장 유리
+        self.members = {}  # member: TrailGroup
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, member, distance, extreme):
+        self.remove(member)
+        key = self.direction * extreme
+        keys = [self.direction * group.extreme for group in self.groups]
+        i = bisect_right(keys, key)
+        if i and keys[i - 1] == key:
+            group = self.groups[i - 1]
+        else:
+            group = TrailGroup(extreme)
+            self.groups.insert(i, group)
+        insort(group.entries, (distance, member))
+        group.dirty = True
+        self.members[member] = group
+
+    def remove(self, member):
+        group = self.members.pop(member, None)
+        if group is None:
+            return
+        group.entries = [entry for entry in group.entries if entry[1] != member]
+        if not group.entries:
+            self.groups.remove(group)
+
+    def extend(self, price):
+        """
+        price 가 가장 유리한 extreme 을 넘으면 모든 group 을 price 를 extreme 으로 하는 group 하나로 합침
+        :return: True / False (stop 이 움직임)
+        """
+        if not self.groups or self.direction * price <= self.direction * self.groups[-1].extreme:
+            return False
+        if len(self.groups) > 1:
+            group = TrailGroup(price)
+            group.entries = list(merge(*[g.entries for g in self.groups]))
+            for distance, member in group.entries:
+                self.members[member] = group
+            self.groups = [group]
+        group = self.groups[0]
+        group.extreme = price
+        group.dirty = True
+        return True
+
+    def fire(self, price):
+        """
+        price 에서 trigger 되는 stop 을 제거
+        :return: [member, ...]
+        """
+        fired = []
+        for group in list(self.groups):
+            # direction * (extreme - price) >= distance 이면 trigger
+            limit = self.direction * (group.extreme - price)
+            if not group.entries or limit < group.entries[0][0]:
+                continue
+            i = bisect_right(group.entries, (limit, MEMBER_MAX))
+            for distance, member in group.entries[:i]:
+                fired.append(member)
+                del self.members[member]
+            del group.entries[:i]
+            if not group.entries:
+                self.groups.remove(group)
+        return fired
+
+
+class TrailBook(object):
+    """
+    PriceWatcher 의 trailing stop (TRAIL 주문) local 상태
+    등록된 주문은 다음 tick 가격과 triggerPrice 의 차이를 distance 로 고정하고 extreme 을 따라 stop 을 옮김
+    stop 변경은 group 의 dirty 로 모아 flush 에서 일정 주기, 최대 건수로 redis 에 기록
+    """
+    def __init__(self):
+        self.sides = {}  # (symbol, direction): TrailSide
+        self.triggers = {}  # member: (symbol, direction, triggerPrice)
+        self.pending = {}  # symbol: {member: direction}, distance 를 정할 tick 대기
+        self.loaded = set()
+        self.dirty = set()  # stop 이 바뀐 (symbol, direction)
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def clear(self, symbols=None):
+        """
+        :param symbols: 다시 load 할 symbol 목록, None 이면 전체
+        """
+        symbols = set(self.loaded) if symbols is None else set(symbols)
+        for member, (symbol, direction, trigger) in list(self.triggers.items()):
+            if symbol in symbols:
+                del self.triggers[member]
+        for key in [key for key in self.sides if key[0] in symbols]:
+            del self.sides[key]
+            self.dirty.discard(key)
+        for symbol in symbols:
+            self.pending.pop(symbol, None)
+        self.loaded -= symbols
+
+    def load(self, symbol, rows):
+        """
+        :param rows: [(member, direction, triggerPrice, state), ...] state 는 [triggerPrice, distance, extreme] / None
+        """
+        self.loaded.add(symbol)
+        for member, direction, trigger, state in rows:
+            self.register(symbol, direction, member, trigger, state)
+
+    def register(self, symbol, direction, member, trigger, state=None):
+        """
+        TRAIL 주문 등록, 같은 triggerPrice 로 다시 등록되면 (재시작시 재등록 등) 기존 stop 을 유지하고 redis 에 다시 기록
+        :param state: [triggerPrice, distance, extreme], 저장된 상태가 없으면 None
+        """
+        if symbol not in self.loaded:
+            return
+        direction = int(direction)
+        trigger = float(trigger)
+        side = self.sides.get((symbol, direction))
+        if self.triggers.get(member) == (symbol, direction, trigger):
+            if side is not None and member in side.members:
+                side.members[member].dirty = True
+                self.dirty.add((symbol, direction))
+            return
+        self.remove(symbol, direction, member)
+        self.triggers[member] = (symbol, direction, trigger)
+        if state is not None and float(state[0]) == trigger:
+            self.track(symbol, direction, member, float(state[1]), float(state[2]))
+        else:
+            self.pending.setdefault(symbol, {})[member] = direction
+
+    def remove(self, symbol, direction, member):
+        if self.triggers.pop(member, None) is None:
+            return
+        self.pending.get(symbol, {}).pop(member, None)
+        side = self.sides.get((symbol, int(direction)))
+        if side is not None:
+            side.remove(member)
+
+    def apply(self, op):
+        """
+        change feed 이벤트 반영
+        :param op: ['t', symbol, direction, member, triggerPrice] / ['r', symbol, direction, member]
+        """
+        if op[0] == 't':
+            self.register(op[1], op[2], op[3], op[4])
+        elif op[0] == 'r':
+            self.remove(op[1], op[2], op[3])
+
+    def track(self, symbol, direction, member, distance, extreme):
+        key = (symbol, direction)
+        side = self.sides.get(key)
+        if side is None:
+            side = self.sides[key] = TrailSide(direction)
+        side.add(member, distance, extreme)
+        self.dirty.add(key)
+
+    def update(self, symbol, last, high=None, low=None):
+        """
+        :param last, high, low: 병합된 구간의 마지막/최고/최저 가격
+        :return: [(member, direction), ...] trigger 된 stop
+        """
+        high = last if high is None else high
+        low = last if low is None else low
+        pending = self.pending.pop(symbol, None)
+        if pending:
+            for member, direction in pending.items():
+                distance = direction * (last - self.triggers[member][2])
+                if distance > 0:
+                    self.track(symbol, direction, member, distance, last)
+                else:
+                    # 이미 trigger 가격을 넘음, 일반 trigger 로 처리되도록 추적하지 않음
+                    del self.triggers[member]
+        fired = []
+        for direction in (1, -1):
+            side = self.sides.get((symbol, direction))
+            if not side:
+                continue
+            # 병합된 구간 안의 순서를 모르므로 이전 stop 으로 반대쪽 극값을 먼저 확인하고, extreme 갱신 후 마지막 가격 확인
+            members = side.fire(low if direction == 1 else high)
+            if side.extend(high if direction == 1 else low):
+                self.dirty.add((symbol, direction))
+            members.extend(side.fire(last))
+            for member in members:
+                del self.triggers[member]
+                fired.append((member, direction))
+        return fired
+
+    def flush(self, limit):
+        """
+        redis 에 기록하지 않은 stop 변경을 group 단위로 꺼냄, 최소 1 group
+        :param limit: 최대 주문 수, 남은 변경은 다음 flush 로
+        :return: {(symbol, direction): [(member, stop, [triggerPrice, distance, extreme]), ...]}
+        """
+        res = {}
+        cnt = 0
+        for key in list(self.dirty):
+            side = self.sides.get(key)
+            if side is None:
+                self.dirty.discard(key)
+                continue
+            for group in side.groups:
+                if not group.dirty:
+                    continue
+                if cnt and cnt + len(group.entries) > limit:
+                    return res
+                rows = res.setdefault(key, [])
+                for distance, member in group.entries:
+                    rows.append((member, group.extreme - side.direction * distance,
+                                 [self.triggers[member][2], distance, group.extreme]))
+                cnt += len(group.entries)
+                group.dirty = False
+            self.dirty.discard(key)
+        return res
@@ -0,0 +1,148 @@
+import numpy as np
+
+
+class TrendlineEngine(object):
+    """
+    활성 trendline 을 column array 로 보관하고 trigger 가격, tick 반올림, 변경 목록을 vectorized 로 계산
+    row 삭제는 마지막 row 를 빈자리로 옮겨 array 를 항상 [0, size) 로 유지
+    계산식은 common.calc 의 trendline_trigger_calc, round_coin 과 같음
+    """
+    COLUMNS = (('start_date', np.float64), ('end_date', np.float64), ('start_price', np.float64),
+               ('end_price', np.float64), ('tick', np.float64), ('length', np.int64), ('direction', np.int64),
+               ('last_price', np.float64))
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.keys = []  # row: queue key ('id=action')
+        self.symbols = []  # row: symbol
+        self.rows = {}  # queue key: row
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, _key):
+        return _key in self.rows
+
+    def _grow(self, need):
+        capacity = len(self.start_date)
+        if need <= capacity:
+            return
+        while capacity < need:
+            capacity *= 2
+        for name, dtype in self.COLUMNS:
+            column = np.zeros(capacity, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def add(self, _key, line, tick, length, last_price=np.nan):
+        """
+        trendline 추가 또는 갱신
+        :param _key: 'id=OPEN'
+        :param line: dict(startDate, endDate, tradingStartPrice, tradingEndPrice, symbol, direction)
+        :param tick: tick size
+        :param length: 소숫점 자릿수
+        :param last_price: 마지막으로 기록한 trigger 가격, 모르면 nan
+        """
+        row = self.rows.get(_key)
+        if row is None:
+            self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.rows[_key] = row
+            self.keys.append(_key)
+            self.symbols.append(line['symbol'])
+        else:
+            self.symbols[row] = line['symbol']
+        self.start_date[row] = line['startDate']
+        self.end_date[row] = line['endDate']
+        self.start_price[row] = line['tradingStartPrice']
+        self.end_price[row] = line['tradingEndPrice']
+        self.tick[row] = tick
+        self.length[row] = length
+        self.direction[row] = line['direction']
+        self.last_price[row] = last_price
+        return row
+
+    def remove(self, _key):
+        row = self.rows.pop(_key, None)
+        if row is None:
+            return False
+        last = self.size - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self.symbols[row] = self.symbols[last]
+            self.rows[moved] = row
+            for name, dtype in self.COLUMNS:
+                column = getattr(self, name)
+                column[row] = column[last]
+        self.keys.pop()
+        self.symbols.pop()
+        self.size = last
+        return True
+
+    def prices(self, now, rows=None):
+        """
+        현재 trigger 가격 계산 (round_coin(trendline_trigger_calc) + direction * tick)
+        :param now: unixtime(ms)
+        :param rows: 계산할 row index array, None 이면 전체
+        :return: price array (계산 불가 row 는 nan)
+        """
+        sl = slice(0, self.size) if rows is None else rows
+        start_date, end_date = self.start_date[sl], self.end_date[sl]
+        start_price, tick = self.start_price[sl], self.tick[sl]
+        length = self.length[sl]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price = start_price + (now - start_date) / (end_date - start_date) * (self.end_price[sl] - start_price)
+            price = np.round(price / tick) * tick
+        for digits in np.unique(length):
+            mask = length == digits
+            price[mask] = np.round(price[mask], int(digits))
+        price += self.direction[sl] * tick
+        price[~np.isfinite(price)] = np.nan
+        return price
+
+    def changed(self, now, rows=None):
+        """
+        마지막 기록 가격과 달라진 trendline
+        :return: (row index array, price array)
+        """
+        rows = np.arange(self.size) if rows is None else np.asarray(rows, dtype=np.int64)
+        price = self.prices(now, rows)
+        mask = np.isfinite(price) & (price != self.last_price[rows])
+        return rows[mask], price[mask]
+
+    def commit(self, rows, price):
+        """
+        redis 에 기록한 가격 반영
+        """
+        self.last_price[rows] = price
+
+    def next_change(self, now, rows):
+        """
+        trigger 가격이 다음 tick 으로 바뀌는 시간 (prices 의 tick 반올림 경계를 지나는 시점)
+        :return: unixtime array, 기울기가 0 이거나 계산 불가면 inf
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        start_date, start_price, tick = self.start_date[rows], self.start_price[rows], self.tick[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (self.end_price[rows] - start_price) / (self.end_date[rows] - start_date)
+            n = np.round((start_price + (now - start_date) * slope) / tick)
+            due = np.ceil(start_date + ((n + np.sign(slope) * 0.5) * tick - start_price) / slope) + 1
+        due = np.where(np.isfinite(due) & (slope != 0), np.maximum(due, now + 1), np.inf)
+        return due
+
+    def group(self, rows, price):
+        """
+        symbol, direction 별 {queue key: price} 로 묶음 (db_change_score 입력 형식)
+        :return: {(symbol, direction): {_key: price}}
+        """
+        res = {}
+        for row, value in zip(rows.tolist(), price.tolist()):
+            _key = (self.symbols[row], int(self.direction[row]))
+            if _key not in res:
+                res[_key] = {}
+            res[_key][self.keys[row]] = value
+        return res
@@ -0,0 +1,139 @@
+import sys
+from bisect import bisect_left, bisect_right, insort
+
+MEMBER_MAX = chr(0x10ffff)
+
+
+class OrderRecord(object):
+    """
+    fire 에 필요한 trigger 정보만 가진 compact record, member 'id=action' 을 추가할때 한번만 나눔
+    """
+    __slots__ = ('id', 'action', 'score')
+
+    def __init__(self, member, score):
+        _id, _, action = member.partition('=')
+        self.id = _id
+        self.action = sys.intern(action)
+        self.score = score
+
+
+class SideBook(object):
+    """
+    symbol, direction 하나에 대한 trigger 목록 (score 오름차순 정렬)
+    """
+    __slots__ = ('entries', 'records')
+
+    def __init__(self):
+        self.entries = []  # [(score, member)]
+        self.records = {}  # member: OrderRecord
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, member, score):
+        old = self.records.get(member)
+        if old is not None:
+            if old.score == score:
+                return
+            self._discard(old.score, member)
+        self.records[member] = OrderRecord(member, score)
+        insort(self.entries, (score, member))
+
+    def remove(self, member):
+        record = self.records.pop(member, None)
+        if record is not None:
+            self._discard(record.score, member)
+
+    def crossing(self, direction, price):
+        """
+        price 에서 trigger 되는 record 목록
+        direction 1: score >= price, -1: score <= price
+        """
+        if direction == 1:
+            entries = self.entries[bisect_left(self.entries, (price,)):]
+        else:
+            entries = self.entries[:bisect_right(self.entries, (price, MEMBER_MAX))]
+        return [self.records[member] for score, member in entries]
+
+    def _discard(self, score, member):
+        i = bisect_left(self.entries, (score, member))
+        if i < len(self.entries) and self.entries[i] == (score, member):
+            del self.entries[i]
+
+
+class TriggerBook(object):
+    """
+    WATCHER_LIST:{symbol}:{direction} zset 의 local 사본
+    direction 1: price <= score 이면 trigger (하락 매수)
+    direction -1: price >= score 이면 trigger (상승 매도)
+    load 되지 않은 symbol 의 이벤트는 무시하고, 첫 tick 에서 redis 로부터 load 함
+    """
+    def __init__(self):
+        self.sides = {}  # (symbol, direction): SideBook
+        self.loaded = set()
+
+    def clear(self):
+        self.sides = {}
+        self.loaded = set()
+
+    def load(self, symbol, direction, items):
+        """
+        :param symbol: 'BTC-USDT'
+        :param direction: 1 / -1
+        :param items: [(member, score), ...] (zrange withscores 결과)
+        """
+        side = SideBook()
+        side.records = {member: OrderRecord(member, float(score)) for member, score in items}
+        side.entries = sorted((record.score, member) for member, record in side.records.items())
+        self.sides[(symbol, int(direction))] = side
+        self.loaded.add(symbol)
+
+    def add(self, symbol, direction, member, score):
+        if symbol not in self.loaded:
+            return
+        key = (symbol, int(direction))
+        if key not in self.sides:
+            self.sides[key] = SideBook()
+        self.sides[key].add(member, float(score))
+
+    def remove(self, symbol, direction, member):
+        side = self.sides.get((symbol, int(direction)))
+        if side is not None:
+            side.remove(member)
+
+    def apply(self, op):
+        """
+        change feed 이벤트 반영
+        :param op: ['a', symbol, direction, member, score] / ['r', symbol, direction, member]
+        """
+        if op[0] == 'a':
+            self.add(op[1], op[2], op[3], op[4])
+        elif op[0] == 'r':
+            self.remove(op[1], op[2], op[3])
+
+    def best(self, symbol, direction):
+        """
+        가장 먼저 trigger 될 가격, 없으면 None
+        """
+        side = self.sides.get((symbol, direction))
+        if not side:
+            return None
+        return side.entries[-1][0] if direction == 1 else side.entries[0][0]
+
+    def crossing(self, symbol, direction, price):
+        """
+        :return: [OrderRecord, ...] price 에서 trigger 되는 주문
+        """
+        side = self.sides.get((symbol, int(direction)))
+        if not side:
+            return []
+        return side.crossing(direction, price)
+
+    def crossed(self, symbol, direction, price):
+        best = self.best(symbol, direction)
+        if best is None:
+            return False
+        return price <= best if direction == 1 else price >= best
+
+    def size(self, symbol=None):
+        return sum(len(side) for key, side in self.sides.items() if symbol is None or key[0] == symbol)
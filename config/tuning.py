@@ -0,0 +1,129 @@
+
+
+class WatcherKeys:
+    """
+    watcher 내부에서 사용하는 redis key / channel 이름
+    """
+    BOOK_CHANNEL = 'WATCHER_BOOK_EVENT'  # WATCHER_LIST zset 변경 이벤트
+    LINE_CHANNEL = 'WATCHER_LINE_EVENT'  # TRENDLINE_QUEUE 변경 이벤트
+    TIME_CHANNEL = 'WATCHER_TIME_EVENT'  # START_TIME_MON, END_TIME_MON 변경 이벤트
+    INGEST_STATS = 'WATCHER_INGEST_STATS'  # price 수신 queue depth, lag
+    WARM_START_STATS = 'WATCHER_WARM_START'  # NewOrderProc 시작시 trigger 재등록 진행 상황
+    ORDER_KEYS = 'ORDER_KEYS:'  # + order id, 주문이 소유한 key/member 목록 (set)
+    INDICATOR_SET = 'INDICATOR_SET:{}:{}'  # symbol_kline, indicator key: 구독 주문 id (set)
+    INDICATOR_KEYS = 'INDICATOR_KEYS:{}'  # symbol_kline: indicator key 목록 (set)
+    INDICATOR_KLINES = 'INDICATOR_KLINES'  # indicator 가 등록된 적 있는 symbol_kline 목록 (set), candle 집계 대상
+    TRAIL_ORDERS = 'TRAIL_ORDERS:{}'  # symbol: TRAIL 주문 member 별 [direction, triggerPrice] (hash)
+    TRAIL_STATE = 'TRAIL_STATE:{}'  # symbol: PriceWatcher 가 기록하는 member 별 [triggerPrice, distance, extreme] (hash)
+
+
+class PriceBookConfig:
+    RESYNC_SEC = 60  # local trigger book 전체 재동기화 주기
+    FEED_DRAIN_LIMIT = 10000  # 한번에 처리할 최대 이벤트 수
+
+
+class TickBatchConfig:
+    ENABLED = True  # False 면 tick 1건씩 queue 로 전달
+    BATCH_SIZE = 500  # redis 에서 한번에 가져올 최대 tick 수
+    QUEUE_MAXSIZE = 64  # price queue 최대 batch 수, 가득 차면 producer 에서 계속 병합
+    POP_TIMEOUT = 1  # blpop timeout (seconds)
+    STATS_SEC = 5  # INGEST_STATS 기록 주기
+
+
+class RingBufferConfig:
+    ENABLED = True  # True 면 price queue 대신 shared memory ring buffer 사용 (batch 수신)
+    CAPACITY = 65536  # 최대 record 수
+    MAX_SYMBOLS = 4096
+    READ_LIMIT = 20000  # 한번에 읽을 최대 record 수
+    IDLE_SLEEP = 0.0005  # buffer 가 비었을때 최소 대기
+    IDLE_SLEEP_MAX = 0.005
+
+
+class PriceShardConfig:
+    WORKERS = 1  # PriceWatcher process 수, symbol 은 crc32 hash 로 고정 배정
+
+
+class FireConfig:
+    SERVER_SIDE = True  # True 면 lua script 로 trigger 선택/삭제/POST_ORDER 를 한번에 처리
+
+
+class LineConfig:
+    RECONCILE_SEC = 300  # TRENDLINE_QUEUE 전체 hscan 재동기화 주기
+    MAX_WAIT_SEC = 1.0  # 다음 deadline 이 멀어도 최대 대기 시간
+    RETRY_MS = 1000  # 기록 실패한 line 재시도 간격
+    SCAN_COUNT = 1000  # hscan 한번에 가져올 수
+    FEED_DRAIN_LIMIT = 100000
+
+
+class TimeConfig:
+    WINDOW = 10000  # local heap 에 올려둘 가장 빠른 deadline 수 (start, end 각각)
+    RECONCILE_SEC = 300  # zset 재조회 주기
+    MAX_WAIT_SEC = 5.0  # 다음 deadline 이 멀어도 최대 대기 시간
+    FEED_DRAIN_LIMIT = 10000
+
+
+class WarmStartConfig:
+    ENABLED = True  # False 면 MTS_ORDER_LIST 를 hgetall 후 1건씩 재등록
+    SCAN_COUNT = 2000  # hscan 한번에 가져올 수 (pipeline 한번에 기록할 주문 수)
+    DECODE_WORKERS = 2  # json decode process 수, 0 이면 NewOrderProc 에서 직접 decode
+    PROGRESS_SEC = 5  # 진행 상황 출력/기록 주기
+    RETRY_SEC = 5  # asyncio mode 에서 재등록 실패시 처음부터 다시 시도하기 전 대기 (process mode 는 WatchDog 이 재시작)
+
+
+class IntakeConfig:
+    BATCH_SIZE = 500  # NEW_ORDER 에서 한번에 가져올 최대 주문 수 (pipeline 한번으로 기록)
+    POP_TIMEOUT = 1  # blpop timeout (seconds)
+
+
+class MetricsConfig:
+    ENABLED = True  # process 별 /metrics, /metrics.json http endpoint
+    HOST = '127.0.0.1'
+    PORT = 9400  # WatchDog, 전체 process 합산
+    PROCESS_PORTS = {'get_price': 9401, 'new_order_proc': 9402, 'time_proc': 9403, 'line_watcher': 9404}
+    PRICE_WATCHER_PORT = 9410  # + shard 번호
+
+
+class TapeConfig:
+    RECORD_PATH = None  # 지정하면 GetPriceProc 가 수신한 tick 을 파일에 기록 (common.tape, bench.replay 참고)
+    MAX_SYMBOLS = 4096
+    FLUSH_SEC = 1
+
+
+class TrailConfig:
+    ENABLED = True  # False 면 TRAIL 주문은 처음 triggerPrice 에 고정된 stop
+    FLUSH_SEC = 1.0  # 움직인 stop 을 redis 에 기록하는 주기
+    MAX_WRITES = 5000  # flush 한번에 기록할 최대 주문 수, 남은 변경은 다음 flush 로
+
+
+class CandleConfig:
+    ENABLED = True  # PriceWatcher 가 indicator 구독 symbol_kline 의 candle 을 집계해 IndicatorWatcher 에 전달
+    PATH = '/var/tmp/ets_watcher_candles_{}.bin'  # np.memmap 파일 경로 ({} 는 shard 번호, 재시작시 history 유지), 같은 host 의 배포끼리는 다르게 지정, 비우면 시작 실패
+    CAPACITY = 500  # symbol_kline 별 보관할 마감 candle 수
+    MAX_SERIES = 1024  # 파일 하나에 보관할 최대 symbol_kline 수
+    SIZE_UNIT_SEC = 60  # candleSize 단위 (분)
+    FILL_GAPS = True  # tick 이 없던 구간을 직전 종가 candle 로 채움
+    SUBSCRIPTION_SEC = 30  # INDICATOR_KLINES 재조회 주기
+    CLOSE_CHECK_SEC = 1  # tick 이 끊긴 symbol 의 candle 마감 확인 주기
+
+
+class LogConfig:
+    LEVEL = None  # 'DEBUG' / 'INFO' / ..., None 이면 settings.DEBUG 에 따라
+    FORMAT = 'json'  # 'json': 한 줄 json / 'text': key=value
+    QUEUE_SIZE = 10000  # background writer 로 넘기는 queue, 가득 차면 hot loop 가 기다리지 않고 버림
+    RATE_SEC = 10  # 같은 event 를 이 구간 동안
+    RATE_BURST = 20  # 최대 건수까지만 기록, 버린 건수는 다음 구간에 suppressed 로 기록
+
+
+class RuntimeConfig:
+    MODE = 'process'  # 'process': role 별 process (WatchDog) / 'asyncio': 한 process 의 asyncio task (AsyncWatchDog)
+
+
+class SupervisorConfig:
+    MAX_WAIT_SEC = 1.0  # process 종료 이벤트가 없어도 heartbeat 확인, metrics 갱신 주기
+    HANG_SEC = 30  # heartbeat 가 이보다 오래 없으면 멈춘 것으로 보고 재시작
+    STARTUP_SEC = 300  # 첫 heartbeat 까지 허용 시간 (시작시 재등록 등)
+    TERMINATE_SEC = 5  # terminate 후 kill 까지 대기
+    BACKOFF_MIN = 0.5  # 연속 종료 2번째부터 재시작 대기, 종료마다 2배
+    BACKOFF_MAX = 30
+    BACKOFF_RESET_SEC = 60  # 이보다 오래 실행된 후 종료되면 즉시 재시작 (연속 종료 횟수 초기화)
+    REDIS_SOCKET_TIMEOUT = 30  # blpop timeout 보다 길게, 끊긴 연결에서 무한 대기하지 않도록
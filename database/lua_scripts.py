@@ -0,0 +1,160 @@
+"""
+BaseDb 에서 register_script 로 등록하여 EVALSHA 로 호출하는 lua script
+"""
+
+# ORDER_KEYS:{id} 목록의 key/member 삭제 (BaseDb.db_index 참고)
+# removed 에 삭제된 watcher trigger 를 book 이벤트로, line_removed 에 삭제된 trendline queue field 를 추가
+REMOVE_ORDER = """
+local function remove_order(index_prefix, id, removed, line_key, line_removed)
+    local refs = redis.call('SMEMBERS', index_prefix .. id)
+    for _, ref in ipairs(refs) do
+        local r = cjson.decode(ref)
+        if r[1] == 'w' then
+            if redis.call('ZREM', r[2], r[3]) == 1 then
+                table.insert(removed, {'r', r[4], r[5], r[3]})
+            end
+        elseif r[1] == 'z' then
+            redis.call('ZREM', r[2], r[3])
+        elseif r[1] == 'h' then
+            if redis.call('HDEL', r[2], r[3]) == 1 and r[2] == line_key then
+                table.insert(line_removed, {'r', r[3]})
+            end
+        elseif r[1] == 's' then
+            redis.call('SREM', r[2], r[3])
+        end
+    end
+    redis.call('DEL', index_prefix .. id)
+end
+"""
+
+# 가격을 넘은 trigger 를 한번에 선택/삭제하고 POST_ORDER 에 'id=action' 을 rpush
+# KEYS: watcher zset, 반대 direction watcher zset, POST_ORDER, MTS_ORDER_LIST, TRENDLINE_QUEUE,
+#       MTS_ORDER_DETAIL, START_TIME_MON, END_TIME_MON
+# ARGV: min, max, book channel, symbol, direction, ORDER_KEYS prefix, line channel, time channel
+# return: {fired, stale} (stale: 주문정보가 없어 trigger 만 삭제된 member)
+# ORDER_KEYS:{id} 와 그 ref 는 KEYS 에 없으므로 단일 redis 에서만 동작 (cluster 불가)
+FIRE_TRIGGERS = REMOVE_ORDER + """
+local fired = {}
+local stale = {}
+local removed = {}
+local line_removed = {}
+local time_removed = {}
+local direction = tonumber(ARGV[5])
+local actions = {'OPEN', 'CLOSE', 'TRIGGER_CANCEL'}
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[2])
+for _, member in ipairs(members) do
+    if redis.call('ZREM', KEYS[1], member) == 1 then
+        table.insert(removed, {'r', ARGV[4], direction, member})
+        local id = string.match(member, '^([^=]+)=')
+        if id and redis.call('HEXISTS', KEYS[4], id) == 1 then
+            remove_order(ARGV[6], id, removed, KEYS[5], line_removed)
+            -- index 기록 이전 주문
+            for _, action in ipairs(actions) do
+                local m = id .. '=' .. action
+                if redis.call('ZREM', KEYS[1], m) == 1 then
+                    table.insert(removed, {'r', ARGV[4], direction, m})
+                end
+                if redis.call('ZREM', KEYS[2], m) == 1 then
+                    table.insert(removed, {'r', ARGV[4], -direction, m})
+                end
+                if redis.call('HDEL', KEYS[5], m) == 1 then
+                    table.insert(line_removed, {'r', m})
+                end
+            end
+            redis.call('HDEL', KEYS[4], id)
+            redis.call('HDEL', KEYS[6], id)
+            redis.call('ZREM', KEYS[7], id)
+            redis.call('ZREM', KEYS[8], id)
+            -- index 의 'z' ref 로 먼저 삭제되었을 수 있으므로 ZREM 결과와 관계없이 TimeWatcher 에 전달
+            table.insert(time_removed, {'r', id})
+            redis.call('RPUSH', KEYS[3], member)
+            table.insert(fired, member)
+        else
+            table.insert(stale, member)
+        end
+    end
+end
+if #removed > 0 then
+    redis.call('PUBLISH', ARGV[3], cjson.encode(removed))
+end
+if #line_removed > 0 then
+    redis.call('PUBLISH', ARGV[7], cjson.encode(line_removed))
+end
+if #time_removed > 0 then
+    redis.call('PUBLISH', ARGV[8], cjson.encode(time_removed))
+end
+return {fired, stale}
+"""
+
+# 주문 N건을 한번에 삭제하고 (mode 가 post 면) POST_ORDER 에 'id=action' 을 rpush
+# KEYS: POST_ORDER, MTS_ORDER_LIST, TRENDLINE_QUEUE, MTS_ORDER_DETAIL, START_TIME_MON, END_TIME_MON
+# ARGV: mode ('remove' / 'post' / 'post_once': 주문정보가 있는 경우만 처리), ORDER_KEYS prefix,
+#       book channel, line channel, time channel, 이후 주문별 6개씩
+#       (id, action, symbol, buy watcher key, sell watcher key, MTS3_ORDER_LIST key 또는 '')
+# return: 처리된 'id=action' 목록
+# ORDER_KEYS:{id} 와 그 ref, ARGV 의 watcher zset, MTS3_ORDER_LIST 는 KEYS 에 없으므로 단일 redis 에서만 동작 (cluster 불가)
+REMOVE_ORDERS = REMOVE_ORDER + """
+local mode = ARGV[1]
+local done = {}
+local removed = {}
+local line_removed = {}
+local time_removed = {}
+local actions = {'OPEN', 'CLOSE', 'TRIGGER_CANCEL'}
+for i = 6, #ARGV, 6 do
+    local id, action, symbol = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    if mode ~= 'post_once' or redis.call('HEXISTS', KEYS[2], id) == 1 then
+        remove_order(ARGV[2], id, removed, KEYS[3], line_removed)
+        -- index 기록 이전 주문
+        for _, a in ipairs(actions) do
+            local m = id .. '=' .. a
+            if redis.call('ZREM', ARGV[i + 3], m) == 1 then
+                table.insert(removed, {'r', symbol, 1, m})
+            end
+            if redis.call('ZREM', ARGV[i + 4], m) == 1 then
+                table.insert(removed, {'r', symbol, -1, m})
+            end
+            if redis.call('HDEL', KEYS[3], m) == 1 then
+                table.insert(line_removed, {'r', m})
+            end
+        end
+        if ARGV[i + 5] ~= '' then
+            redis.call('HDEL', ARGV[i + 5], id)
+        end
+        redis.call('HDEL', KEYS[2], id)
+        redis.call('HDEL', KEYS[4], id)
+        redis.call('ZREM', KEYS[5], id)
+        redis.call('ZREM', KEYS[6], id)
+        table.insert(time_removed, {'r', id})
+        if mode ~= 'remove' then
+            redis.call('RPUSH', KEYS[1], id .. '=' .. action)
+        end
+        table.insert(done, id .. '=' .. action)
+    end
+end
+if #removed > 0 then
+    redis.call('PUBLISH', ARGV[3], cjson.encode(removed))
+end
+if #line_removed > 0 then
+    redis.call('PUBLISH', ARGV[4], cjson.encode(line_removed))
+end
+if #time_removed > 0 then
+    redis.call('PUBLISH', ARGV[5], cjson.encode(time_removed))
+end
+return done
+"""
+
+# trailing stop 의 trigger 가격과 상태 기록, 이미 삭제된 주문 (watcher zset 에 없는 member) 은 다시 만들지 않음
+# KEYS: watcher zset, TRAIL_STATE hash
+# ARGV: 주문별 3개씩 (member, stop, 상태 json)
+# return: 기록된 member 수
+TRAIL_STOPS = """
+local updated = 0
+for i = 1, #ARGV, 3 do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+        updated = updated + 1
+    end
+end
+return updated
+"""
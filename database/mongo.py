@@ -1,11 +1,18 @@
-from pymongo import MongoClient
+from database.registry import ConnectionRegistry
 
-from config.settings import Mongo
 
 class Conn(object):
     def __init__(self):
-        mongo_conn = MongoClient(Mongo.HOST)
-    #     self.mongo_db = mongo_conn.marginbot
+        pass
+
+    @property
+    def mongo_conn(self):
+        # 처음 사용할때 process 별로 한번 연결
+        return ConnectionRegistry.mongo()
+
+    # @property
+    # def mongo_db(self):
+    #     return self.mongo_conn.marginbot
     #
     # def mongo_ins_msg(self, data):
     #     collection = self.mongo_db['send_telegram']
@@ -1,86 +1,189 @@
+import ast
 import ujson as json
-import redis
-from config.settings import Redis, Watcher
+from config.settings import Watcher
 from config.trading_map import Mapping, IndicatorMap
+from config.tuning import WatcherKeys, TrailConfig
+from database.lua_scripts import FIRE_TRIGGERS, REMOVE_ORDERS, TRAIL_STOPS
+from database.registry import ConnectionRegistry
 from common.msg import MessageHandle
 from common.decorator import except_console, except_pass
+from common.log import get_logger
 
+log = get_logger('redis_db')
 
-class RedisClient(object):
-    def __init__(self):
-        if Redis.REDIS_PASSWORD:
-            self.pool = redis.ConnectionPool(host=Redis.REDIS_SERVER, db=Redis.REDIS_DB, port=Redis.REDIS_PORT,
-                                             password=Redis.REDIS_PASSWORD, decode_responses=True)
-        else:
-            self.pool = redis.ConnectionPool(host=Redis.REDIS_SERVER, db=Redis.REDIS_DB, port=Redis.REDIS_PORT,
-                                             decode_responses=True)
 
+class RedisClient(object):
+    """
+    process 에서 공유하는 redis client (database.registry.ConnectionRegistry)
+    """
     def conn(self):
-        return redis.StrictRedis(connection_pool=self.pool)
+        return ConnectionRegistry.redis()
 
 
 class BaseDb(MessageHandle, Mapping):
     def __init__(self):
         MessageHandle.__init__(self)
         Mapping.__init__(self)
-        self.client = RedisClient().conn()
         self.scan_direction = {'buy': '+', 'sell': '-'}
         self.logger = None
 
+    @property
+    def client(self):
+        # fork 후 child 에서 처음 사용할때 연결
+        return ConnectionRegistry.redis()
+
+    @property
+    def fire_script(self):
+        return ConnectionRegistry.script(FIRE_TRIGGERS)
+
+    @property
+    def remove_script(self):
+        return ConnectionRegistry.script(REMOVE_ORDERS)
+
+    @property
+    def trail_script(self):
+        return ConnectionRegistry.script(TRAIL_STOPS)
+
     @except_console
-    def db_get_price(self):
+    def db_get_price(self, timeout=0):
         """
         socket 에서 push해준 가격을 가져옴
-        :return: '{"symbol": "XBT-USD", "price": 9845.5}'
+        :param timeout: blpop 대기 (seconds), 0 이면 무한 대기
+        :return: '{"symbol": "XBT-USD", "price": 9845.5}' / None (timeout)
         """
-        price = self.client.blpop(Watcher.PRICE_QUEUE)
-        return price[1]
+        price = self.client.blpop(Watcher.PRICE_QUEUE, timeout=timeout)
+        return price[1] if price else None
 
     @except_console
-    def db_get_order(self):
+    def db_get_price_batch(self, size, timeout=1):
         """
-        new order id를 가져와 order 정보를 반환
-        :return: id, dict(order_detail)
+        socket 에서 push해준 가격을 최대 size 건 가져옴
+        :return: ['{"symbol": "XBT-USD", "price": 9845.5}', ...]
         """
-        _id = self.client.blpop(Watcher.NEW_ORDER)[1]
-        # res = self.db_zrem(Watcher.TRANSACTION, _id)
-        order_detail = self.client.hget(Watcher.ORDER_DETAIL, _id)
-        print(Watcher.ORDER_DETAIL, _id, '\n', order_detail)
-        return _id, json.loads(order_detail)
+        first = self.client.blpop(Watcher.PRICE_QUEUE, timeout=timeout)
+        if not first:
+            return []
+        p = self.client.pipeline(transaction=True)
+        p.lrange(Watcher.PRICE_QUEUE, 0, size - 2)
+        p.ltrim(Watcher.PRICE_QUEUE, size - 1, -1)
+        rest, _ = p.execute()
+        return [first[1]] + rest
+
+    @except_pass
+    def db_set_stats(self, _key, stats, p=None):
+        (p or self.client).hmset(_key, stats)
+
+    @except_console
+    def db_get_orders(self, size=500, timeout=1):
+        """
+        new order id 를 최대 size 건 가져와 order 정보를 hmget 한번으로 반환
+        같은 id 가 여러번 들어오면 마지막 위치에서 한번만 반환 (order 정보는 같은 hash 값)
+        :param size: 최대 주문 수
+        :param timeout: 첫 id blpop 대기 (seconds)
+        :return: [(id, dict(order_detail)), ...]
+        """
+        res = self.client.blpop(Watcher.NEW_ORDER, timeout=timeout)
+        if not res:
+            return []
+        ids = [res[1]]
+        if size > 1:
+            p = self.client.pipeline(transaction=True)
+            p.lrange(Watcher.NEW_ORDER, 0, size - 2)
+            p.ltrim(Watcher.NEW_ORDER, size - 1, -1)
+            ids.extend(p.execute()[0])
+        ids = list(dict.fromkeys(reversed(ids)))[::-1]
+        orders = []
+        for _id, order_detail in zip(ids, self.client.hmget(Watcher.ORDER_DETAIL, *ids)):
+            if order_detail is None:
+                log.warning('ORDER_NOT_FOUND', key=Watcher.ORDER_DETAIL, id=_id)
+                continue
+            orders.append((_id, json.loads(order_detail)))
+        return orders
 
     @except_console
     def db_get_order_info(self, _id):
         return json.loads(self.client.hget(Watcher.ORDER_DETAIL, _id))
 
     @except_console
-    def db_get_trendline_queue(self):
-        res = self.client.hgetall(Watcher.TRENDLINE_QUEUE)
-        if not res:
-            res = {}
-        return res
+    def db_scan_trendline_queue(self, count=1000):
+        """
+        TRENDLINE_QUEUE 를 hscan 으로 나누어 조회
+        :return: {queue key: dict(trendline)}
+        """
+        return {_key: json.loads(line) for _key, line in self.client.hscan_iter(Watcher.TRENDLINE_QUEUE, count=count)}
+
+    @except_console
+    def db_get_watcher_scores(self, items):
+        """
+        :param items: [(symbol, direction, member), ...]
+        :return: [score / None, ...]
+        """
+        p = self.client.pipeline(transaction=False)
+        for symbol, direction, member in items:
+            p.zscore(Watcher.WATCHER_LIST.format(symbol, direction), member)
+        return p.execute()
 
     @except_console
     def db_order_list_getall(self):
         order_list = self.client.hgetall(Watcher.MTS_ORDER_LIST)
         return order_list
 
+    def db_scan_order_list(self, count=1000):
+        """
+        MTS_ORDER_LIST 를 hscan 으로 나누어 조회 (전체를 memory 에 올리지 않음)
+        hscan 특성상 같은 주문이 두번 나올 수 있음
+        :param count: hscan 한번에 가져올 수
+        :return: generator {id: order(json)}
+        """
+        cursor = 0
+        while True:
+            cursor, chunk = self.client.hscan(Watcher.MTS_ORDER_LIST, cursor, count=count)
+            if chunk:
+                yield chunk
+            if not int(cursor):
+                break
+
     @except_console
-    def db_set_order_info(self, _order_info):
-        res = self.client.hset(Watcher.MTS_ORDER_LIST, _order_info['id'], json.dumps(_order_info))
-        return res
+    def db_exists_orders(self, ids):
+        """
+        :return: [True / False, ...] MTS_ORDER_LIST 에 주문정보가 남아있는지
+        """
+        p = self.client.pipeline(transaction=False)
+        for _id in ids:
+            p.hexists(Watcher.MTS_ORDER_LIST, _id)
+        return p.execute()
 
     @except_console
-    def db_set_line_queue(self, _key, data):
-        res = self.client.hset(Watcher.TRENDLINE_QUEUE, _key, json.dumps(data))
+    def db_set_order_info(self, _order_info, p=None):
+        res = (p or self.client).hset(Watcher.MTS_ORDER_LIST, _order_info['id'], json.dumps(_order_info))
         return res
 
+    @except_console
+    def db_set_line_queue(self, _key, data, p=None):
+        pipe = self.client.pipeline(transaction=True) if p is None else p
+        pipe.hset(Watcher.TRENDLINE_QUEUE, _key, json.dumps(data))
+        self.db_index(pipe, _key.split('=')[0], ['h', Watcher.TRENDLINE_QUEUE, _key])
+        pipe.publish(WatcherKeys.LINE_CHANNEL, json.dumps([['a', _key, data]]))
+        if p is None:
+            return pipe.execute()[0]
+        return None
+
     @except_console
     def db_rm_line_queue(self, _key):
         res = self.db_hdel(Watcher.TRENDLINE_QUEUE, _key)
+        self.client.publish(WatcherKeys.LINE_CHANNEL, json.dumps([['r', _key]]))
         return res
 
     @except_console
-    def db_set_order(self, order_info, start_waiting_time=None):
+    def db_set_order(self, order_info, start_waiting_time=None, p=None):
+        """
+        주문의 trigger, start/end time, indicator, 주문정보 등록
+        :param order_info: dict(주문 정보)
+        :param start_waiting_time: trendline 시작 시간 (unixtime), 없으면 None
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        :return: 주문정보 hset 결과 (p 가 주어지면 None)
+        """
+        pipe = self.client.pipeline(transaction=True) if p is None else p
         if order_info['planType'] != 'strategy':
             if order_info['indicatorType'] == 'OPEN':
                 if order_info['status'] == 'PENDING':
@@ -93,22 +196,30 @@ class BaseDb(MessageHandle, Mapping):
                 elif order_info['status'] == 'WAITING':
                     action = 'CLOSE'
                 else:
-                    print('invailid status:', order_info['status'])
+                    log.warning('INVALID_STATUS', _key=order_info['status'], id=order_info['id'], status=order_info['status'])
                     return
             _key = '{}={}'.format(order_info['id'], action)
 
-            p = self.client.pipeline(transaction=True)
             if order_info['planType'] in Mapping.date_ckeck and action == 'OPEN':
                 # start, end time 설정
+                time_ops = [['a', 'end', order_info['id'], order_info['endDate']]]
                 if start_waiting_time:
-                    p.zadd(Watcher.START_TIME_MON, {order_info['id']: start_waiting_time})
-                p.zadd(Watcher.END_TIME_MON, {order_info['id']: order_info['endDate']})
+                    pipe.zadd(Watcher.START_TIME_MON, {order_info['id']: start_waiting_time})
+                    self.db_index(pipe, order_info['id'], ['z', Watcher.START_TIME_MON, order_info['id']])
+                    time_ops.append(['a', 'start', order_info['id'], start_waiting_time])
+                pipe.zadd(Watcher.END_TIME_MON, {order_info['id']: order_info['endDate']})
+                self.db_index(pipe, order_info['id'], ['z', Watcher.END_TIME_MON, order_info['id']])
+                pipe.publish(WatcherKeys.TIME_CHANNEL, json.dumps(time_ops))
 
             if 'price' in order_info:
                 # price triger 등록
-                p.zadd(Watcher.WATCHER_LIST.format(order_info['symbol'], order_info['direction']),
-                       {_key: float(order_info['price'])})
-            p.execute()
+                pipe.zadd(Watcher.WATCHER_LIST.format(order_info['symbol'], order_info['direction']),
+                          {_key: float(order_info['price'])})
+                self.db_index(pipe, order_info['id'], self.watcher_ref(order_info['symbol'], order_info['direction'], _key))
+                self.db_publish_book(pipe, [['a', order_info['symbol'], order_info['direction'], _key, float(order_info['price'])]])
+                if order_info['indicatorType'] == 'TRAIL' and action == 'CLOSE' and TrailConfig.ENABLED:
+                    # PriceWatcher 가 stop 을 옮김, 재등록되어도 같은 triggerPrice 면 기존 trailing 상태 유지
+                    self.db_set_trail(order_info, _key, p=pipe)
 
         else:
             # strategy 주문 저장
@@ -122,12 +233,12 @@ class BaseDb(MessageHandle, Mapping):
                     indicator_key = '|'.join([indicator[IndicatorMap.indicator_map[indicator['name']]['config'][0]]] + [str(float(indicator[i])) for i in _items_key])
                     values = [float(indicator[i]) for i in _value_key]
                     indicator_dic['indicators'][indicator_key] = values
-                    self.set_indicator(_symbol_kline, order_info['id'], indicator_key)
+                    self.set_indicator(_symbol_kline, order_info['id'], indicator_key, p=pipe)
 
                 indicator_dic['direction'] = order_info['direction']
                 indicator_dic['last_side'] = None
                 indicator_dic['indicatorType'] = order_info['indicatorType']
-                self.set_indicator_order(_symbol_kline, order_info['id'], indicator_dic)
+                self.set_indicator_order(_symbol_kline, order_info['id'], indicator_dic, p=pipe)
             else:
                 # limit 주문
                 if order_info['indicatorType'] == 'TAKE':
@@ -136,80 +247,278 @@ class BaseDb(MessageHandle, Mapping):
                     elif order_info['status'] == 'WAITING':
                         action = 'CLOSE'
                     else:
-                        print('invailid status:', order_info['status'])
+                        log.warning('INVALID_STATUS', _key=order_info['status'], id=order_info['id'], status=order_info['status'])
                         return
                     _key = '{}={}'.format(order_info['id'], action)
                     if 'price' in order_info:
-                        self.client.zadd(Watcher.WATCHER_LIST.format(order_info['symbol'], order_info['direction']),
-                                         {_key: float(order_info['price'])})
+                        self.db_set_trigger(order_info['symbol'], order_info['direction'], _key, order_info['price'], p=pipe)
                 elif order_info['indicatorType'] == 'LOSS':
                     if order_info['status'] != 'WAITING':
-                        print('invailid status:', order_info['status'])
+                        log.warning('INVALID_STATUS', _key=order_info['status'], id=order_info['id'], status=order_info['status'])
                         return
                     action = 'CLOSE'
                     _key = '{}={}'.format(order_info['id'], action)
                     if 'price' in order_info:
-                        self.client.zadd(Watcher.WATCHER_LIST.format(order_info['symbol'], order_info['direction']),
-                                         {_key: float(order_info['price'])})
+                        self.db_set_trigger(order_info['symbol'], order_info['direction'], _key, order_info['price'], p=pipe)
+
+        self.db_set_order_info(order_info, p=pipe)
+        if p is None:
+            return pipe.execute()[-1]
+        return None
+
+    @except_console
+    def db_set_trigger(self, symbol, direction, _key, price, p=None):
+        pipe = self.client.pipeline(transaction=True) if p is None else p
+        pipe.zadd(Watcher.WATCHER_LIST.format(symbol, direction), {_key: float(price)})
+        self.db_index(pipe, _key.split('=')[0], self.watcher_ref(symbol, direction, _key))
+        self.db_publish_book(pipe, [['a', symbol, direction, _key, float(price)]])
+        if p is None:
+            return pipe.execute()
+        return None
+
+    @except_console
+    def db_set_trail(self, order_info, _key, p=None):
+        """
+        TRAIL 주문을 PriceWatcher 의 trailing stop 으로 등록 (trigger 는 db_set_order 에서 WATCHER_LIST 에 등록)
+        :param _key: watcher member 'id=CLOSE'
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        """
+        pipe = self.client.pipeline(transaction=True) if p is None else p
+        symbol, direction, price = order_info['symbol'], order_info['direction'], float(order_info['price'])
+        pipe.hset(WatcherKeys.TRAIL_ORDERS.format(symbol), _key, json.dumps([direction, price]))
+        self.db_index(pipe, order_info['id'], ['h', WatcherKeys.TRAIL_ORDERS.format(symbol), _key],
+                      ['h', WatcherKeys.TRAIL_STATE.format(symbol), _key])
+        self.db_publish_book(pipe, [['t', symbol, direction, _key, price]])
+        if p is None:
+            return pipe.execute()
+        return None
+
+    @except_console
+    def db_get_trails(self, symbols):
+        """
+        symbol 별 TRAIL 주문과 PriceWatcher 가 기록한 trailing 상태 조회
+        :param symbols: ['BTC-USDT', ...]
+        :return: {symbol: [(member, direction, triggerPrice, [triggerPrice, distance, extreme] / None), ...]}
+        """
+        p = self.client.pipeline(transaction=False)
+        self.trail_request(symbols, p)
+        return self.trail_result(symbols, p.execute())
+
+    @staticmethod
+    def trail_request(symbols, p):
+        """
+        db_get_trails 조회를 pipeline 에 추가 (sync / async pipeline)
+        """
+        for symbol in symbols:
+            p.hgetall(WatcherKeys.TRAIL_ORDERS.format(symbol))
+            p.hgetall(WatcherKeys.TRAIL_STATE.format(symbol))
 
-        res = self.db_set_order_info(order_info)
+    @staticmethod
+    def trail_result(symbols, rows):
+        """
+        :param rows: trail_request 로 추가한 명령의 결과
+        """
+        res = {}
+        for i, symbol in enumerate(symbols):
+            orders, states = rows[i * 2], rows[i * 2 + 1]
+            res[symbol] = []
+            for member, data in orders.items():
+                direction, price = json.loads(data)
+                state = states.get(member)
+                res[symbol].append((member, direction, price, json.loads(state) if state else None))
         return res
 
     @except_console
-    def set_indicator(self, _symbol_kline, ord_id, indicator, remove=False):
+    def db_set_trail_stops(self, writes, p=None):
+        """
+        움직인 trailing stop 을 WATCHER_LIST score 와 TRAIL_STATE 에 기록 (symbol/direction 별 lua script, pipeline 한번)
+        :param writes: {(symbol, direction): [(member, stop, state), ...]} (TrailBook.flush)
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        :return: 기록된 주문 수 (p 가 주어지면 None)
+        """
+        if not writes:
+            return 0
+        pipe = self.client.pipeline(transaction=False) if p is None else p
+        for (symbol, direction), rows in writes.items():
+            args = []
+            for member, stop, state in rows:
+                args.extend([member, stop, json.dumps(state)])
+            self.trail_script(keys=[Watcher.WATCHER_LIST.format(symbol, direction), WatcherKeys.TRAIL_STATE.format(symbol)],
+                              args=args, client=pipe)
+        if p is None:
+            return sum(pipe.execute())
+        return None
+
+    @staticmethod
+    def watcher_ref(symbol, direction, _key):
+        return ['w', Watcher.WATCHER_LIST.format(symbol, direction), _key, symbol, int(direction)]
+
+    def db_index(self, p, _id, *refs):
+        """
+        주문이 소유한 key/member 를 ORDER_KEYS:{id} 에 기록, rm_order 는 이 목록만 삭제
+        :param p: pipeline 또는 client
+        :param refs: ['w', watcher key, member, symbol, direction] / ['z', key, member] / ['h', key, field]
+                     / ['s', key, member]
+        """
+        p.sadd(WatcherKeys.ORDER_KEYS + _id, *[json.dumps(ref) for ref in refs])
+
+    def db_publish_book(self, p, ops):
+        """
+        WATCHER_LIST 변경을 PriceWatcher 의 local trigger book 에 전달
+        :param p: pipeline 또는 client
+        :param ops: [['a', symbol, direction, member, score]] / [['r', symbol, direction, member]]
+        """
+        if ops:
+            p.publish(WatcherKeys.BOOK_CHANNEL, json.dumps(ops))
+
+    @except_console
+    def db_get_watcher_book(self, symbols):
+        """
+        symbol 별 buy, sell triger 목록 조회
+        :param symbols: ['BTC-USDT', ...]
+        :return: {(symbol, direction): [(member, score), ...]}
+        """
+        p = self.client.pipeline(transaction=False)
+        keys = [(symbol, direction) for symbol in symbols for direction in (1, -1)]
+        for symbol, direction in keys:
+            p.zrange(Watcher.WATCHER_LIST.format(symbol, direction), 0, -1, withscores=True)
+        return dict(zip(keys, p.execute()))
+
+    @except_console
+    def set_indicator(self, _symbol_kline, ord_id, indicator, remove=False, p=None):
         """
-        인티케이터 추가/삭제
+        인티케이터 추가/삭제, INDICATOR_SET:{symbol_kline}:{indicator} set 에 주문 id 저장
         :param _symbol_kline:  'ETH-USD_15'
         :param ord_id: '2as12-3asdfasdf-3-asdf-asdfaf'
         :param indicator: 'macd|10|20'
         :param remove: True / False
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
         :return: 1/0 의미없음
         """
-        res = None
+        _key = WatcherKeys.INDICATOR_SET.format(_symbol_kline, indicator)
+        pipe = self.client.pipeline(transaction=True) if p is None else p
         if not remove:
-            # indicator 목록제거
-            data = self.client.hget(Watcher.INDICATOR_LIST.format(_symbol_kline), indicator)
-            if data:
-                indicator_set = eval(data) # string 을 set type으로 변환
-                indicator_set.add(ord_id)
-            else:
-                indicator_set = {ord_id}
-            res = self.client.hset(Watcher.INDICATOR_LIST.format(_symbol_kline), indicator, str(indicator_set))
-        else:
             # indicator 추가
-            data = self.client.hget(Watcher.INDICATOR_LIST.format(_symbol_kline), indicator)
-            if data:
-                indicator_set = eval(data) # string 을 set type으로 변환
-                indicator_set.remove(ord_id)
-                if indicator_set:
-                    res = self.client.hset(Watcher.INDICATOR_LIST.format(_symbol_kline), indicator, str(indicator_set))
-                else:
-                    res = self.db_hdel(Watcher.INDICATOR_LIST.format(_symbol_kline), indicator)
-        return res
+            pipe.sadd(_key, ord_id)
+            pipe.sadd(WatcherKeys.INDICATOR_KEYS.format(_symbol_kline), indicator)
+            pipe.sadd(WatcherKeys.INDICATOR_KLINES, _symbol_kline)
+            self.db_index(pipe, ord_id, ['s', _key, ord_id])
+        else:
+            # indicator 목록제거, 비어있는 indicator key 는 db_get_indicator_members 에서 정리
+            pipe.srem(_key, ord_id)
+        if p is None:
+            return pipe.execute()[0]
+        return None
 
     @except_console
-    def set_indicator_order(self, _symbol_kline, _id, indicator_dic=None, remove=False):
+    def set_indicator_order(self, _symbol_kline, _id, indicator_dic=None, remove=False, p=None):
         """
         주문 추가/삭제
         :param _symbol_kline:  'ETH-USD_15'
         :param ord_id: '2as12-3asdfasdf-3-asdf-asdfaf'
         :param indicator_dic: 'macd|10|20'
         :param remove: True / False
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
         :return: 1/0 의미없음
         """
         res = {}
         if not remove:
-            # 주문 삭제
-            res['set_{}'.format(_id)] = self.client.hset(Watcher.MTS3_ORDER_LIST.format(_symbol_kline), _id, json.dumps(indicator_dic))
-        else:
             # 주문 추가
+            pipe = self.client.pipeline(transaction=True) if p is None else p
+            pipe.hset(Watcher.MTS3_ORDER_LIST.format(_symbol_kline), _id, json.dumps(indicator_dic))
+            self.db_index(pipe, _id, ['h', Watcher.MTS3_ORDER_LIST.format(_symbol_kline), _id])
+            if p is None:
+                res['set_{}'.format(_id)] = pipe.execute()[0]
+        else:
+            # 주문 삭제
             indicator_list = self.client.hget(Watcher.MTS3_ORDER_LIST.format(_symbol_kline), _id)
             if indicator_list:
                 indicator_list = json.loads(indicator_list)
+                pipe = self.client.pipeline(transaction=True) if p is None else p
                 for i in indicator_list['indicators']:
-                    res = self.set_indicator(_symbol_kline, _id, i, remove=True)
+                    self.set_indicator(_symbol_kline, _id, i, remove=True, p=pipe)
+                if p is None:
+                    res = pipe.execute()
         return res
 
+    @except_console
+    def db_get_indicator_members(self, _symbol_kline, indicators=None):
+        """
+        indicator 별 구독 주문 id 를 한번에 조회
+        :param _symbol_kline: 'ETH-USD_15'
+        :param indicators: ['macd|12.0|26.0|9.0', ...], None 이면 등록된 전체
+        :return: {indicator: {ord_id, ...}}
+        """
+        if indicators is None:
+            indicators = list(self.client.smembers(WatcherKeys.INDICATOR_KEYS.format(_symbol_kline)))
+        if not indicators:
+            return {}
+        p = self.client.pipeline(transaction=False)
+        for indicator in indicators:
+            p.smembers(WatcherKeys.INDICATOR_SET.format(_symbol_kline, indicator))
+        res = dict(zip(indicators, p.execute()))
+        empty = [indicator for indicator, members in res.items() if not members]
+        if empty:
+            self.client.srem(WatcherKeys.INDICATOR_KEYS.format(_symbol_kline), *empty)
+        return res
+
+    @except_console
+    def db_get_indicator_klines(self):
+        """
+        indicator 구독이 남아있는 symbol_kline 목록
+        INDICATOR_KLINES 가 없으면 (이전 버전에서 등록된 indicator) INDICATOR_KEYS 를 scan 해서 1회 채움
+        :return: ['BTC-USDT_15', ...]
+        """
+        klines = list(self.client.smembers(WatcherKeys.INDICATOR_KLINES))
+        if not klines:
+            prefix = WatcherKeys.INDICATOR_KEYS.format('')
+            klines = [_key[len(prefix):] for _key in
+                      self.client.scan_iter(match=WatcherKeys.INDICATOR_KEYS.format('*'), count=1000)]
+            if klines:
+                self.client.sadd(WatcherKeys.INDICATOR_KLINES, *klines)
+        if not klines:
+            return []
+        p = self.client.pipeline(transaction=False)
+        for _symbol_kline in klines:
+            p.scard(WatcherKeys.INDICATOR_KEYS.format(_symbol_kline))
+        # 구독이 모두 빠진 symbol_kline 은 다시 등록될 수 있으므로 INDICATOR_KLINES 에서 지우지 않고 건너뜀
+        return [_symbol_kline for _symbol_kline, cnt in zip(klines, p.execute()) if cnt]
+
+    @except_console
+    def db_get_indicator_orders(self, _symbol_kline, ids):
+        """
+        indicator 주문 설정 조회
+        :param ids: [ord_id, ...]
+        :return: {ord_id: indicator_dic}
+        """
+        if not ids:
+            return {}
+        rows = self.client.hmget(Watcher.MTS3_ORDER_LIST.format(_symbol_kline), *ids)
+        return {_id: json.loads(row) for _id, row in zip(ids, rows) if row is not None}
+
+    @except_console
+    def db_migrate_indicator_list(self):
+        """
+        기존 INDICATOR_LIST:{symbol_kline} hash (set repr 문자열) 를 INDICATOR_SET 으로 1회 변환 후 삭제
+        :return: 변환한 hash 수
+        """
+        cnt = 0
+        prefix = Watcher.INDICATOR_LIST.format('')
+        for _key in self.client.scan_iter(match=Watcher.INDICATOR_LIST.format('*'), count=1000):
+            if self.client.type(_key) != 'hash':
+                continue
+            _symbol_kline = _key[len(prefix):]
+            p = self.client.pipeline(transaction=True)
+            for indicator, data in self.client.hgetall(_key).items():
+                for ord_id in ast.literal_eval(data):
+                    self.set_indicator(_symbol_kline, ord_id, indicator, p=p)
+            p.delete(_key)
+            p.execute()
+            cnt += 1
+        if cnt:
+            log.info('INDICATOR_LIST_MIGRATED', count=cnt)
+        return cnt
+
     @except_pass
     def db_zrem(self, _key, _id):
         res = self.client.zrem(_key, _id)
@@ -219,64 +528,102 @@ class BaseDb(MessageHandle, Mapping):
         self.client.hdel(_key, _id)
 
     @except_console
-    def db_post_order(self, order_info, action):
+    def db_post_order(self, order_info, action, p=None):
         """
         주문처리
         :param order_info: dict(주문 정보)
         :param action: 'OPEN', 'TAKE', 'CLOSE'
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
         :return:
         """
-        _key = '{}={}'.format(order_info['id'], action)
-
-        print('db_post_order:', _key)
-        self.rm_order(order_info['id'], order_info['symbol'])
-
-        p = self.client.pipeline(transaction=True)
-
-        if action == 'END':
-            p.rpush(Watcher.POST_ORDER, '{}={}'.format(order_info['id'], action))
-        else:
-            p.rpush(Watcher.POST_ORDER, '{}={}'.format(order_info['id'], action))
-
-        print('POST_RES:','{}={}'.format(order_info['id'], action))
-        res = p.execute()
-
-        return res
+        log.info('POST_ORDER', _limit=False, member='{}={}'.format(order_info['id'], action))
+        return self.db_post_orders([(order_info['id'], order_info['symbol'], action)], once=False, p=p)
 
     @except_console
     def rm_order(self, _id, symbol, indicators=False):
-        # trendline 인경우 삭제
-        for _key in self.client.hscan_iter(Watcher.TRENDLINE_QUEUE, match= _id + '*'):
-            self.db_hdel(Watcher.TRENDLINE_QUEUE, _key[0])
+        return self.db_remove_orders([(_id, symbol, None, indicators)])
 
-        # buy, sell triger 삭제
-        buy_list = self.client.zscan(Watcher.WATCHER_LIST.format(symbol, 1), 0, '*{}*'.format(_id), 100000000)
-        sell_list = self.client.zscan(Watcher.WATCHER_LIST.format(symbol, -1), 0, '*{}*'.format(_id), 100000000)
-        for i in buy_list[1]:
-            self.db_zrem(Watcher.WATCHER_LIST.format(symbol, 1), i[0])
-        for i in sell_list[1]:
-            self.db_zrem(Watcher.WATCHER_LIST.format(symbol, -1), i[0])
+    @except_console
+    def db_post_orders(self, orders, once=True, p=None):
+        """
+        주문 N건을 삭제하고 POST_ORDER 에 등록 (lua script 한번)
+        :param orders: [(id, symbol, action), ...]
+        :param once: True 면 주문정보(MTS_ORDER_LIST)가 남아있는 주문만 처리, 다른 process 가 먼저 처리한 주문은 건너뜀
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        :return: 등록된 ['id=action', ...] (p 가 주어지면 None)
+        """
+        res = self.db_remove_orders([(_id, symbol, action, False) for _id, symbol, action in orders],
+                                    mode='post_once' if once else 'post', p=p)
+        if p is not None:
+            return None
+        if res:
+            log.info('POST_RES', _limit=False, members=res)
+        return res
 
-        # 주문정보 삭제
-        self.db_hdel(Watcher.MTS_ORDER_LIST, _id)
-        if indicators and 'candleSize' in indicators[0]:
-            _symbol_kline = '{}_{}'.format(symbol, indicators[0]['candleSize'])
-            self.db_hdel(Watcher.MTS3_ORDER_LIST.format(_symbol_kline), _id)
+    @except_console
+    def db_remove_orders(self, orders, mode='remove', p=None):
+        """
+        주문 N건이 소유한 trigger, trendline queue, start/end time, indicator, 주문정보를 lua script 한번으로 삭제
+        :param orders: [(id, symbol, action, indicators), ...]
+        :param mode: 'remove' / 'post' / 'post_once' (lua_scripts.REMOVE_ORDERS 참고)
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        :return: 처리된 ['id=action', ...]
+        """
+        if not orders:
+            return []
+        args = [mode, WatcherKeys.ORDER_KEYS, WatcherKeys.BOOK_CHANNEL, WatcherKeys.LINE_CHANNEL, WatcherKeys.TIME_CHANNEL]
+        for _id, symbol, action, indicators in orders:
+            mts3 = ''
+            if indicators and 'candleSize' in indicators[0]:
+                mts3 = Watcher.MTS3_ORDER_LIST.format('{}_{}'.format(symbol, indicators[0]['candleSize']))
+            args.extend([_id, action or '', symbol, Watcher.WATCHER_LIST.format(symbol, 1),
+                         Watcher.WATCHER_LIST.format(symbol, -1), mts3])
+        keys = [Watcher.POST_ORDER, Watcher.MTS_ORDER_LIST, Watcher.TRENDLINE_QUEUE, Watcher.MTS_ORDER_DETAIL,
+                Watcher.START_TIME_MON, Watcher.END_TIME_MON]
+        return self.remove_script(keys=keys, args=args, client=p)
 
-        self.db_hdel(Watcher.MTS_ORDER_DETAIL, _id)
+    @except_console
+    def db_change_score(self, symbol, direction, items_dict, new=None, p=None):
+        """
+        trendline trigger 가격을 한번의 zadd 로 갱신
+        :param items_dict: {'id=OPEN': price}
+        :param new: 처음 기록하는 member 목록 (index 등록), None 이면 전체
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        """
+        _key = Watcher.WATCHER_LIST.format(symbol, direction)
+        pipe = self.client.pipeline(transaction=True) if p is None else p
+        pipe.zadd(_key, items_dict, ch=True)
+        for i in (items_dict if new is None else new):
+            self.db_index(pipe, i.split('=')[0], self.watcher_ref(symbol, direction, i))
+        self.db_publish_book(pipe, [['a', symbol, direction, i, items_dict[i]] for i in items_dict])
+        if p is None:
+            return pipe.execute()
 
-        #trendline인 경우 start, end time 삭제
-        self.db_hdel(Watcher.START_TIME_MON, _id)
-        self.db_hdel(Watcher.END_TIME_MON, _id)
+    @except_console
+    def db_get_time_window(self, name, size):
+        """
+        START_TIME_MON / END_TIME_MON 에서 가장 빠른 size 건 조회
+        :param name: 'start' / 'end'
+        :return: [(id, deadline), ...]
+        """
+        _key = Watcher.START_TIME_MON if name == 'start' else Watcher.END_TIME_MON
+        return self.client.zrange(_key, 0, size - 1, withscores=True)
 
     @except_console
-    def db_change_score(self, symbol, direction, items_dict):
-        _key = Watcher.WATCHER_LIST.format(symbol, direction)
-        p = self.client.pipeline(transaction=True)
-        for i in items_dict:
-            p.zadd(_key, {i: items_dict[i]}, ch=True)
-        res = p.execute()
-        return res
+    def db_activate_trendline(self, order_info, p=None):
+        """
+        시작된 trendline 을 TRENDLINE_QUEUE 에 등록 (LineWatcher 가 가격 계산 시작)
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
+        """
+        if order_info['indicatorType'] == 'TRAIL':
+            action = 'CLOSE'
+        else:
+            action = 'TRIGGER_CANCEL' if order_info['status'] == 'PENDING' else 'OPEN'
+        _tmp_queue = {i: order_info[i] for i in Mapping.item_indicators['trendLine']}
+        _tmp_queue['symbol'] = order_info['symbol']
+        _tmp_queue['currentPrice'] = 0
+        _tmp_queue['direction'] = order_info['direction']
+        return self.db_set_line_queue('{}={}'.format(order_info['id'], action), _tmp_queue, p=p)
 
     @except_console
     def db_start_time_check(self, _now):
@@ -284,10 +631,15 @@ class BaseDb(MessageHandle, Mapping):
         target = self.client.zrangebyscore(Watcher.START_TIME_MON, '-inf', _now, withscores=False)
         if target:
             order_list = self.client.hmget(Watcher.MTS_ORDER_LIST, *target)
-            if order_list and order_list[0] != None:
-                for order in order_list:
-                    order = json.loads(order)
-                    res.append(self.db_set_order(order, start_waiting_time=None))
+            for order in order_list:
+                if order is None:
+                    continue
+                order = json.loads(order)
+                if order.get('planType') in Mapping.date_ckeck:
+                    self.db_activate_trendline(order)
+                res.append(self.db_set_order(order, start_waiting_time=None))
+            # 처리한 시작 시간 삭제
+            self.client.zrem(Watcher.START_TIME_MON, *target)
         return res, target
 
     @except_console
@@ -296,14 +648,13 @@ class BaseDb(MessageHandle, Mapping):
         target = self.client.zrangebyscore(Watcher.END_TIME_MON, '-inf', _now, withscores=False)
         if target:
             order_list = self.client.hmget(Watcher.MTS_ORDER_LIST, *target)
-            if order_list[0]:
-                try:
-                    for order in order_list:
-                        order = json.loads(order)
-                        res.append(self.db_post_order(order, 'END'))
-                        print('order:', order)
-                except Exception as e:
-                    print('db_end_time_check for order_list error:', e)
+            stale = [_id for _id, order in zip(target, order_list) if order is None]
+            orders = [json.loads(order) for order in order_list if order is not None]
+            if orders:
+                res = self.db_post_orders([(order['id'], order['symbol'], 'END') for order in orders])
+            if stale:
+                # 주문정보가 없는 종료 시간 삭제
+                self.client.zrem(Watcher.END_TIME_MON, *stale)
 
         return res, target
 
@@ -319,15 +670,12 @@ class BaseDb(MessageHandle, Mapping):
         _key = Watcher.WATCHER_LIST.format(symbol, '1')
         target = self.client.zrangebyscore(_key, price, '+inf', withscores=True)
         if target:
+            orders = []
             for _key, score in target:
                 _id, action = _key.split('=')
-                order = self.client.hget(Watcher.MTS_ORDER_LIST, _id)
-                if order:
-                    self.db_rm_line_queue(_key)
-                    res.append(self.db_post_order(json.loads(order), action))
-                else:
-                    print('db_scan_buy cannot findid', Watcher.MTS_ORDER_LIST, _key, _id)
-                    # self.send_slack('PriceWatcher scan_buy', 'can not find id', _key)
+                orders.append((_id, symbol, action))
+            # 주문정보가 없는 trigger 는 post_once 에서 건너뜀
+            res = self.db_post_orders(orders)
             return res
 
     @except_console
@@ -342,16 +690,52 @@ class BaseDb(MessageHandle, Mapping):
         _key = Watcher.WATCHER_LIST.format(symbol, '-1')
         target = self.client.zrangebyscore(_key, '-inf', price, withscores=True)
         if target:
+            orders = []
             for _key, score in target:
                 _id, action = _key.split('=')
-                order = self.client.hget(Watcher.MTS_ORDER_LIST, _id)
-                if order:
-                    res.append(self.db_post_order(json.loads(order), action))
-                else:
-                    print('db_scan_buy cannot findid', Watcher.MTS_ORDER_LIST, _key, _id)
-                    # self.send_slack('PriceWatcher scan_buy', 'can not find id', _key)
+                orders.append((_id, symbol, action))
+            # 주문정보가 없는 trigger 는 post_once 에서 건너뜀
+            res = self.db_post_orders(orders)
             return res
 
+    @except_console
+    def db_fire_triggers_many(self, requests):
+        """
+        여러 symbol/direction 의 fire script 를 pipeline 한번으로 호출
+        price 를 넘은 trigger 를 삭제하고 POST_ORDER 에 등록, 같은 member 는 한번만 fire 되므로 여러 process 가 동시에 호출해도 안전
+        :param requests: [(symbol, direction, price), ...]
+        :return: [['id=action', ...], ...] request 순서대로 fire 된 목록
+        """
+        p = self.client.pipeline(transaction=False)
+        for symbol, direction, price in requests:
+            self.fire_request(symbol, direction, price, p)
+        return self.fire_result(p.execute())
+
+    def fire_request(self, symbol, direction, price, p):
+        """
+        fire script 호출을 pipeline 에 추가
+        """
+        _min, _max = (price, '+inf') if direction == 1 else ('-inf', price)
+        keys = [Watcher.WATCHER_LIST.format(symbol, direction), Watcher.WATCHER_LIST.format(symbol, -direction),
+                Watcher.POST_ORDER, Watcher.MTS_ORDER_LIST, Watcher.TRENDLINE_QUEUE, Watcher.MTS_ORDER_DETAIL,
+                Watcher.START_TIME_MON, Watcher.END_TIME_MON]
+        self.fire_script(keys=keys, args=[_min, _max, WatcherKeys.BOOK_CHANNEL, symbol, direction,
+                                          WatcherKeys.ORDER_KEYS, WatcherKeys.LINE_CHANNEL, WatcherKeys.TIME_CHANNEL], client=p)
+
+    @staticmethod
+    def fire_result(rows):
+        """
+        :param rows: fire script 결과 [[fired, stale], ...]
+        :return: [['id=action', ...], ...]
+        """
+        res = []
+        for fired, stale in rows:
+            if fired:
+                log.info('POST_RES', _limit=False, members=fired)
+            if stale:
+                log.warning('ORDER_NOT_FOUND', key=Watcher.MTS_ORDER_LIST, members=stale)
+            res.append(fired)
+        return res
 
     @except_console
     def get_ticksize(self):
@@ -0,0 +1,118 @@
+import os
+import threading
+
+import redis
+import requests
+from pymongo import MongoClient
+
+from config.settings import Redis, Mongo
+from config.tuning import SupervisorConfig
+
+
+class ConnectionRegistry(object):
+    """
+    process 별로 하나씩 공유하는 redis client, mongo client, http session
+    처음 사용할때 생성하고, fork 된 child process 에서는 부모의 연결을 버리고 다시 생성
+    """
+    _pid = None
+    _redis = None
+    _aredis = None
+    _mongo = None
+    _http = None
+    _scripts = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        """
+        fork 후 child 에서 호출, 부모 process 의 socket 은 닫지 않고 참조만 버림
+        """
+        cls._pid = os.getpid()
+        cls._redis = None
+        cls._aredis = None
+        cls._mongo = None
+        cls._http = None
+        cls._scripts = {}
+        cls._lock = threading.Lock()
+
+    @classmethod
+    def _check_pid(cls):
+        # register_at_fork 를 거치지 않은 경우 대비
+        if cls._pid != os.getpid():
+            cls.reset()
+
+    @staticmethod
+    def redis_kwargs():
+        kwargs = {'host': Redis.REDIS_SERVER, 'db': Redis.REDIS_DB, 'port': Redis.REDIS_PORT,
+                  'decode_responses': True, 'socket_timeout': SupervisorConfig.REDIS_SOCKET_TIMEOUT,
+                  'socket_keepalive': True}
+        if Redis.REDIS_PASSWORD:
+            kwargs['password'] = Redis.REDIS_PASSWORD
+        return kwargs
+
+    @classmethod
+    def redis(cls):
+        cls._check_pid()
+        if cls._redis is None:
+            with cls._lock:
+                if cls._redis is None:
+                    cls._redis = redis.StrictRedis(connection_pool=redis.ConnectionPool(**cls.redis_kwargs()))
+        return cls._redis
+
+    @classmethod
+    def aredis(cls):
+        """
+        asyncio mode (AsyncWatchDog) 의 redis client, 하나의 event loop 에서만 사용
+        """
+        cls._check_pid()
+        if cls._aredis is None:
+            from redis import asyncio as aioredis
+            cls._aredis = aioredis.Redis(**cls.redis_kwargs())
+        return cls._aredis
+
+    @classmethod
+    def set_redis(cls, client):
+        """
+        현재 process 의 redis client 를 지정 (benchmark 등에서 별도 db / in-process redis 사용)
+        """
+        cls._check_pid()
+        cls._redis = client
+        cls._scripts = {}
+
+    @classmethod
+    def set_aredis(cls, client):
+        cls._check_pid()
+        cls._aredis = client
+
+    @classmethod
+    def script(cls, source):
+        """
+        lua script 를 process 의 redis client 에 한번만 등록
+        :param source: lua script
+        :return: redis Script (EVALSHA 로 호출)
+        """
+        client = cls.redis()
+        script = cls._scripts.get(source)
+        if script is None:
+            script = cls._scripts[source] = client.register_script(source)
+        return script
+
+    @classmethod
+    def mongo(cls):
+        cls._check_pid()
+        if cls._mongo is None:
+            with cls._lock:
+                if cls._mongo is None:
+                    cls._mongo = MongoClient(Mongo.HOST)
+        return cls._mongo
+
+    @classmethod
+    def http(cls):
+        cls._check_pid()
+        if cls._http is None:
+            cls._http = requests.Session()
+        return cls._http
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=ConnectionRegistry.reset)
@@ -0,0 +1,69 @@
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import config.settings  # noqa: F401
+except ImportError:
+    # 배포 환경의 config/settings.py 가 없으면 test 에서 사용하는 key 이름만 채움 (연결 정보는 사용하지 않음)
+    import config
+
+    class Watcher:
+        PRICE_QUEUE = 'PRICE_QUEUE'
+        NEW_ORDER = 'NEW_ORDER'
+        ORDER_DETAIL = 'ORDER_DETAIL'
+        TRENDLINE_QUEUE = 'TRENDLINE_QUEUE'
+        MTS_ORDER_LIST = 'MTS_ORDER_LIST'
+        MTS_ORDER_DETAIL = 'MTS_ORDER_DETAIL'
+        MTS3_ORDER_LIST = 'MTS3_ORDER_LIST:{}'
+        WATCHER_LIST = 'WATCHER_LIST:{}:{}'
+        START_TIME_MON = 'START_TIME_MON'
+        END_TIME_MON = 'END_TIME_MON'
+        INDICATOR_LIST = 'INDICATOR_LIST:{}'
+        POST_ORDER = 'POST_ORDER'
+        TICK_SIZE_KEYS = 'TICK_SIZE_KEYS'
+        MARKET_DATA_KEY = 'MARKET_DATA'
+
+    class Redis:
+        REDIS_SERVER = 'localhost'
+        REDIS_PORT = 6379
+        REDIS_DB = 0
+        REDIS_PASSWORD = None
+
+    class Mongo:
+        HOST = 'mongodb://localhost'
+
+    class SlackMSG:
+        URI = ''
+        TOKEN = ''
+        CHANNEL = ''
+
+    class TryExceptionConfig:
+        RETRY_COUNT = 1
+        SLEEP = 0
+
+    settings = types.ModuleType('config.settings')
+    for _name, _value in dict(Watcher=Watcher, Redis=Redis, Mongo=Mongo, SlackMSG=SlackMSG,
+                              TryExceptionConfig=TryExceptionConfig, DEBUG=False, SERVICE='test').items():
+        setattr(settings, _name, _value)
+    sys.modules['config.settings'] = settings
+    config.settings = settings
+
+
+@pytest.fixture
+def redis_client():
+    """
+    process 의 redis client 를 fakeredis 로 교체 (lua script 는 lupa 가 있어야 실행)
+    """
+    fakeredis = pytest.importorskip('fakeredis')
+    from database.registry import ConnectionRegistry
+    client = fakeredis.FakeStrictRedis(decode_responses=True)
+    ConnectionRegistry.set_redis(client)
+    yield client
+    ConnectionRegistry.set_redis(None)
@@ -0,0 +1,157 @@
+import json
+
+import numpy as np
+import pytest
+
+from common.candles import CandleStore, CandleAggregator
+from common.indicators import Candle
+from config.tuning import CandleConfig
+
+T0 = 1700000100.0  # 5분 구간의 시작
+
+
+def aggregator(capacity=500, path=None, fill_gaps=True):
+    store = CandleStore(path, capacity=capacity, max_series=4)
+    candles = CandleAggregator(store, unit_sec=60, fill_gaps=fill_gaps)
+    assert candles.subscribe(['BTC_1', 'BTC_5', 'BTC_x']) == ['BTC_x']
+    return candles, store
+
+
+def test_ticks_close_on_next_bucket():
+    candles, store = aggregator()
+    assert candles.update('BTC', 100.0, 100.0, 100.0, T0 + 5.0) == []
+    assert candles.update('BTC', 103.0, 103.0, 103.0, T0 + 20.0) == []
+    assert candles.update('BTC', 99.0, 99.0, 99.0, T0 + 59.0) == []
+    closed = candles.update('BTC', 101.0, 101.0, 101.0, T0 + 61.0)
+    assert closed == [('BTC_1', Candle(T0, 100.0, 103.0, 99.0, 99.0, 3))]
+    # 5분 candle 은 아직 진행중
+    assert store.candles('BTC_5') == []
+    assert candles.close_due(T0 + 300.0) == [('BTC_1', Candle(T0 + 60.0, 101.0, 101.0, 101.0, 101.0, 1)),
+                                             ('BTC_5', Candle(T0, 100.0, 103.0, 99.0, 101.0, 4))]
+    # 이미 마감된 구간의 늦은 tick 은 버림
+    assert candles.update('BTC', 90.0, 90.0, 90.0, T0 + 100.0) == []
+    assert store.candles('BTC_1', 1) == [Candle(T0 + 60.0, 101.0, 101.0, 101.0, 101.0, 1)]
+
+
+def test_merged_tick_opens_at_previous_close():
+    candles, store = aggregator()
+    candles.update('BTC', 100.0, 100.0, 100.0, T0)
+    candles.update('BTC', 104.0, 106.0, 102.0, T0 + 60.0)
+    candles.update('BTC', 98.0, 99.0, 97.0, T0 + 120.0)
+    # 직전 종가 100 을 병합 구간 [102, 106] 안으로 맞춤, 다음 candle 은 직전 종가 104 가 [97, 99] 밖이라 고가
+    assert [c.open for c in store.candles('BTC_1')] == [100.0, 102.0]
+    candles.close_due(T0 + 180.0)
+    assert store.candles('BTC_1', 1)[0].open == 99.0
+
+
+def test_gap_is_filled_with_flat_candles():
+    candles, store = aggregator()
+    candles.update('BTC', 100.0, 100.0, 100.0, T0)
+    closed = candles.update('BTC', 105.0, 105.0, 105.0, T0 + 250.0)
+    assert closed == [('BTC_1', Candle(T0, 100.0, 100.0, 100.0, 100.0, 1))] + \
+        [('BTC_1', Candle(T0 + ts, 100.0, 100.0, 100.0, 100.0, 0)) for ts in (60.0, 120.0, 180.0)]
+
+    candles, store = aggregator(fill_gaps=False)
+    candles.update('BTC', 100.0, 100.0, 100.0, T0)
+    assert len(candles.update('BTC', 105.0, 105.0, 105.0, T0 + 250.0)) == 1
+
+
+def test_ring_wraparound_returns_contiguous_view():
+    store = CandleStore(capacity=3, max_series=2)
+    sid = store.series('BTC_1')
+    for i in range(7):
+        store.append(sid, (60.0 * i, i, i, i, i, 1.0))
+        view = store.view(sid)
+        # 한바퀴를 넘어도 최근 candle 이 오래된 순으로 연속된 구간
+        assert view[:, 0].tolist() == [60.0 * j for j in range(max(i - 2, 0), i + 1)]
+        assert np.shares_memory(view, store.data)
+    assert store.view(sid, 2)[:, 0].tolist() == [300.0, 360.0]
+    assert store.last(sid)[0] == 360.0
+    assert store.series('ETH_1') == 1
+    assert store.series('XRP_1') is None
+
+
+def test_memmap_reload_keeps_history_and_open_candle(tmp_path):
+    path = str(tmp_path / 'candles.bin')
+    candles, store = aggregator(capacity=3, path=path)
+    for i in range(5):
+        candles.update('BTC', 100.0 + i, 100.0 + i, 100.0 + i, T0 + 60.0 * i)
+    candles.update('BTC', 99.0, 99.0, 99.0, T0 + 250.0)
+    store.flush()
+    expected = store.candles('BTC_1')
+    del candles, store
+
+    # 재시작: 파일의 history 와 만들고 있던 candle 을 그대로 이어서 사용
+    candles, store = aggregator(capacity=3, path=path)
+    assert store.candles('BTC_1') == expected
+    assert store.series_ids == {'BTC_1': 0, 'BTC_5': 1}
+    closed = candles.update('BTC', 98.0, 98.0, 98.0, T0 + 300.0)
+    assert closed[0] == ('BTC_1', Candle(T0 + 240.0, 104.0, 104.0, 99.0, 99.0, 2))
+
+
+def test_price_watcher_feeds_indicator_orders(redis_client, monkeypatch, tmp_path):
+    from config.settings import Watcher
+    from database.redis_db import BaseDb
+    from watchdog import PriceWatcher
+
+    monkeypatch.setattr(CandleConfig, 'CLOSE_CHECK_SEC', float('inf'))
+    monkeypatch.setattr(CandleConfig, 'PATH', str(tmp_path / 'candles_{}.bin'))
+    key = 'ema_cross|2.0|4.0'
+    db = BaseDb()
+    redis_client.hset(Watcher.MTS_ORDER_LIST, 's1', json.dumps({'id': 's1', 'symbol': 'BTC'}))
+    db.set_indicator('BTC_1', 's1', key)
+    db.set_indicator_order('BTC_1', 's1', {'direction': 1, 'indicators': {key: []}, 'last_side': None,
+                                           'indicatorType': 'OPEN'})
+    watcher = PriceWatcher()
+    watcher.start_candles()
+    closes = [110.0, 108.0, 106.0, 104.0, 102.0, 100.0, 103.0, 107.0, 112.0, 115.0]
+    fired_at = None
+    for i, close in enumerate(closes + closes[-1:]):
+        watcher.update_candles([('BTC', close + 1, close + 1, close + 1, T0 + 60.0 * i, 1),
+                                ('BTC', close, close, close, T0 + 60.0 * i + 30, 1)])
+        if fired_at is None and redis_client.llen(Watcher.POST_ORDER):
+            fired_at = i
+    # 단기 EMA 가 장기 EMA 를 상향 돌파한 candle 이 마감될때 한번만 fire
+    assert redis_client.lrange(Watcher.POST_ORDER, 0, -1) == ['s1=OPEN']
+    assert fired_at == 8
+    assert len(watcher.indicator_watcher.history('BTC_1')) == len(closes)
+
+
+def test_price_watcher_requires_store_path(monkeypatch):
+    from watchdog import PriceWatcher
+
+    monkeypatch.setattr(CandleConfig, 'PATH', None)
+    watcher = PriceWatcher()
+    with pytest.raises(ValueError):
+        watcher.start_candles()
+    assert watcher.candles is None
+
+
+def test_ring_conflation_keeps_tick_volume(redis_client, monkeypatch, tmp_path):
+    from common.ring_buffer import TickRing
+    from common.ticks import TickConflator
+    from config.settings import Watcher
+    from watchdog import GetPriceProc, PriceWatcher
+
+    monkeypatch.setattr(CandleConfig, 'CLOSE_CHECK_SEC', float('inf'))
+    monkeypatch.setattr(CandleConfig, 'PATH', str(tmp_path / 'candles_{}.bin'))
+    ring = TickRing(capacity=4, max_symbols=2)
+    proc = GetPriceProc()
+    proc.price_queues, proc.conflators = [ring], [TickConflator()]
+    redis_client.rpush(Watcher.PRICE_QUEUE, *[json.dumps({'symbol': 'BTC', 'price': 100.0 + i}) for i in range(10)])
+    proc.get_price_ring()
+    # 4건은 그대로, ring 이 가득 차 병합된 6건은 공간이 생긴 뒤 high, low, last 3 record 로 기록
+    rows = ring.get_many()
+    proc.flush_ring(0)
+    rows += ring.get_many()
+    ring.close()
+    assert len(rows) == 7
+    assert sum(count for _symbol, price, ts, count in rows) == 10
+
+    watcher = PriceWatcher()
+    watcher.start_candles()
+    watcher.subscribe_candles(['BTC_1'])
+    ts = rows[0][2]
+    assert watcher.close_candles((_symbol, price, price, price, ts, count) for _symbol, price, ts, count in rows) == {}
+    closed = watcher.close_candles([('BTC', 120.0, 120.0, 120.0, ts + 60, 1)])
+    assert closed == {'BTC_1': [Candle(ts - ts % 60, 100.0, 109.0, 100.0, 109.0, 10)]}
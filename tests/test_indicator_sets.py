@@ -0,0 +1,39 @@
+import pytest
+
+from config.settings import Watcher
+from config.tuning import WatcherKeys
+
+
+@pytest.fixture
+def db(redis_client):
+    from database.redis_db import BaseDb
+    return BaseDb()
+
+
+def test_migrate_indicator_list(redis_client, db):
+    redis_client.hset(Watcher.INDICATOR_LIST.format('BTC_15'), mapping={
+        'macd|12.0|26.0|9.0': str({'o1', 'o2'}),
+        'rsi|14.0': str({'o2'}),
+    })
+    redis_client.hset(Watcher.INDICATOR_LIST.format('ETH_60'), 'rsi|14.0', str({'o3'}))
+    assert db.db_migrate_indicator_list() == 2
+    assert not redis_client.keys(Watcher.INDICATOR_LIST.format('*'))
+    assert db.db_get_indicator_members('BTC_15') == {'macd|12.0|26.0|9.0': {'o1', 'o2'}, 'rsi|14.0': {'o2'}}
+    assert db.db_get_indicator_members('ETH_60') == {'rsi|14.0': {'o3'}}
+    # 변환이 끝나면 아무것도 하지 않음
+    assert db.db_migrate_indicator_list() == 0
+
+    # 변환된 구독도 ORDER_KEYS index 로 삭제
+    db.rm_order('o2', 'BTC')
+    assert db.db_get_indicator_members('BTC_15') == {'macd|12.0|26.0|9.0': {'o1'}, 'rsi|14.0': set()}
+    assert db.db_get_indicator_members('BTC_15') == {'macd|12.0|26.0|9.0': {'o1'}}
+
+
+def test_remove_is_idempotent(redis_client, db):
+    db.set_indicator('BTC_15', 'o1', 'rsi|14.0')
+    db.set_indicator('BTC_15', 'o1', 'rsi|14.0', remove=True)
+    db.set_indicator('BTC_15', 'o1', 'rsi|14.0', remove=True)
+    assert redis_client.smembers(WatcherKeys.INDICATOR_SET.format('BTC_15', 'rsi|14.0')) == set()
+    # 비어있는 indicator key 는 조회시 정리
+    assert db.db_get_indicator_members('BTC_15') == {'rsi|14.0': set()}
+    assert redis_client.smembers(WatcherKeys.INDICATOR_KEYS.format('BTC_15')) == set()
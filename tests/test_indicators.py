@@ -0,0 +1,226 @@
+import statistics
+
+import pytest
+
+from common.indicators import Candle, Rsi, Macd, BollingerBand, Stoch, IndicatorEngine, Indicator
+
+# Wilder (1978) RSI 예제 종가, 기대값은 TA-Lib RSI(14) 결과 (소수 2자리)
+WILDER_CLOSES = [44.34, 44.09, 44.15, 43.61, 44.33, 44.83, 45.10, 45.42, 45.84, 46.08, 45.89, 46.03, 45.61, 46.28,
+                 46.28, 46.00, 46.03, 46.41, 46.22, 45.64, 46.21, 46.25, 45.71, 46.45, 45.78, 45.35, 44.03, 44.18,
+                 44.22, 44.57, 43.42, 42.66, 43.13]
+WILDER_RSI = [70.46, 66.25, 66.48, 69.35, 66.29, 57.92, 62.88, 63.21, 56.01, 62.34, 54.67, 50.39, 40.02, 41.49,
+              41.90, 45.50, 37.32, 33.09, 37.79]
+
+
+def candle(close, high=None, low=None, volume=1.0):
+    return Candle(0, close, close if high is None else high, close if low is None else low, close, volume)
+
+
+def series(n=80):
+    """
+    고가/저가 폭이 일정하지 않은 결정적 가격 series
+    """
+    closes = [100 + 8 * ((i * 7) % 13) / 13 - 0.15 * i + (3 if i % 11 == 0 else 0) for i in range(n)]
+    return [candle(c, c + 0.5 + (i % 4) * 0.3, c - 0.4 - (i % 3) * 0.2) for i, c in enumerate(closes)]
+
+
+def ema_reference(values, period):
+    """
+    처음 period 건의 단순 평균으로 시작하는 EMA, 값이 없는 위치는 None
+    """
+    res = [None] * len(values)
+    if len(values) < period:
+        return res
+    value = sum(values[:period]) / period
+    res[period - 1] = value
+    for i in range(period, len(values)):
+        value += 2.0 / (period + 1) * (values[i] - value)
+        res[i] = value
+    return res
+
+
+def test_indicator_is_abstract():
+    with pytest.raises(TypeError):
+        Indicator()
+
+
+def test_rsi_matches_wilder_reference():
+    rsi = Rsi(14)
+    values = []
+    for close in WILDER_CLOSES:
+        rsi.update(candle(close))
+        values.append(round(rsi.value, 2) if rsi.ready else None)
+    assert values[:14] == [None] * 14
+    assert values[14:] == WILDER_RSI
+
+
+def test_macd_matches_sma_seeded_ema():
+    candles = series()
+    closes = [c.close for c in candles]
+    fast, slow = ema_reference(closes, 12), ema_reference(closes, 26)
+    macd_line = [f - s for f, s in zip(fast[25:], slow[25:])]
+    signal_line = ema_reference(macd_line, 9)
+
+    macd = Macd(12, 26, 9)
+    for i, c in enumerate(candles):
+        macd.update(c)
+        j = i - 25
+        # signal line 이 채워지는 candle 부터 ready
+        assert macd.ready == (j >= 8)
+        if j >= 0:
+            assert macd.macd == pytest.approx(macd_line[j])
+        if macd.ready:
+            assert macd.signal_ema.value == pytest.approx(signal_line[j])
+            assert macd.signal(()) == (1 if macd_line[j] > signal_line[j] else -1)
+
+
+def test_bollinger_band_matches_population_std():
+    candles = series()
+    band = BollingerBand(20, 2.0)
+    for i, c in enumerate(candles):
+        band.update(c)
+        assert band.ready == (i >= 19)
+        if not band.ready:
+            continue
+        window = [x.close for x in candles[i - 19:i + 1]]
+        mean, std = statistics.mean(window), statistics.pstdev(window)
+        assert band.window.mean == pytest.approx(mean)
+        assert band.window.std == pytest.approx(std)
+        expected = 1 if c.close <= mean - 2 * std else (-1 if c.close >= mean + 2 * std else 0)
+        assert band.signal((0.0,)) == expected
+
+
+def test_bollinger_band_margin():
+    band = BollingerBand(4, 1.0)
+    for close in (10, 12, 10, 12):
+        band.update(candle(close))
+    # mean 11, std 1, band 10 ~ 12
+    assert band.signal((0.0,)) == -1
+    # mean 11.4, std 0.82, 상단 12.22
+    band.update(candle(11.6))
+    assert band.signal((0.0,)) == 0
+    # band 폭 (2 * std) 의 50% 안쪽까지 signal
+    assert band.signal((50.0,)) == -1
+
+
+def test_stoch_matches_reference():
+    candles = series()
+    k_period, smooth_k, d_period = 14, 3, 3
+    raw = []
+    for i in range(k_period - 1, len(candles)):
+        window = candles[i - k_period + 1:i + 1]
+        highest, lowest = max(c.high for c in window), min(c.low for c in window)
+        raw.append(100.0 * (candles[i].close - lowest) / (highest - lowest))
+    k = [statistics.mean(raw[i - smooth_k + 1:i + 1]) for i in range(smooth_k - 1, len(raw))]
+    d = [statistics.mean(k[i - d_period + 1:i + 1]) for i in range(d_period - 1, len(k))]
+
+    stoch = Stoch(k_period, smooth_k, d_period)
+    first = k_period - 1 + smooth_k - 1 + d_period - 1
+    for i, c in enumerate(candles):
+        stoch.update(c)
+        assert stoch.ready == (i >= first)
+        if stoch.ready:
+            j = i - first
+            assert stoch.k.mean == pytest.approx(k[j + d_period - 1])
+            assert stoch.d.mean == pytest.approx(d[j])
+
+
+def test_stoch_signal_needs_cross_direction():
+    stoch = Stoch(3, 1, 2)
+    for close in (10, 9, 8, 7):
+        stoch.update(candle(close, close + 1, close - 1))
+    # 과매도 (%K 25) 이지만 %K 가 %D 아래
+    assert stoch.signal((30.0,)) == 0
+    # %K 26.7, %D 25.8
+    stoch.update(candle(6.8, 7, 6))
+    assert stoch.k.mean > stoch.d.mean
+    assert stoch.signal((30.0,)) == 1
+
+
+def engine_with_rsi(history):
+    engine = IndicatorEngine()
+    key = 'rsi|14.0'
+    added = engine.subscribe('BTC_1', {key: {'o1'}}, {'o1': {'direction': -1, 'indicators': {key: [70.0]}}})
+    for k in added:
+        engine.warm('BTC_1', k, history)
+    engine.seed('BTC_1', ['o1'])
+    return engine
+
+
+def test_seeded_order_does_not_refire_after_restart():
+    # 재시작 직전 이미 과매수 (-1) 상태였다면 첫 candle 에서 같은 방향이어도 fire 하지 않음
+    overbought = [candle(100 + i) for i in range(20)]
+    engine = engine_with_rsi(overbought)
+    assert engine.orders['BTC_1']['o1'].last_side == -1
+    assert engine.update('BTC_1', candle(121)) == []
+
+
+def test_seeded_order_fires_on_first_transition():
+    flat = [candle(100 + (i % 2)) for i in range(20)]
+    engine = engine_with_rsi(flat)
+    assert engine.orders['BTC_1']['o1'].last_side == 0
+    fired = []
+    for i in range(10):
+        fired.extend(engine.update('BTC_1', candle(102 + i)))
+        if fired:
+            break
+    assert [order.id for order in fired] == ['o1']
+
+
+def test_indicator_watcher_warms_without_delivered_candles(redis_client):
+    from common.candles import CandleStore
+    from config.settings import Watcher
+    from config.tuning import WatcherKeys
+    from watchdog import IndicatorWatcher
+
+    key = 'ema_cross|5.0|20.0'
+    redis_client.sadd(WatcherKeys.INDICATOR_KEYS.format('BTC_1'), key)
+    redis_client.sadd(WatcherKeys.INDICATOR_SET.format('BTC_1', key), 'o1')
+    redis_client.hset(Watcher.MTS3_ORDER_LIST.format('BTC_1'), 'o1',
+                      '{"direction": 1, "indicators": {"%s": []}, "last_side": null}' % key)
+    store = CandleStore(capacity=50, max_series=2)
+    sid = store.series('BTC_1')
+    for i in range(30):
+        store.append(sid, (60.0 * (i + 1), 100.0 + i, 100.0 + i, 100.0 + i, 100.0 + i, 1.0))
+    delivered = store.candles('BTC_1', 1)
+
+    watcher = IndicatorWatcher(store)
+    assert watcher.on_candles('BTC_1', delivered) == []
+    # store 에 이미 기록된 마감 candle 은 warm 에서 빼고 on_candles 에서 한번만 반영
+    assert watcher.engine.indicators['BTC_1'][key].short.count == 30
+    assert watcher.engine.orders['BTC_1']['o1'].last_side == 1
+
+
+def test_volume_indicators_use_tick_count():
+    from common.candles import CandleStore, CandleAggregator
+    from common.indicators import create
+
+    candles = CandleAggregator(CandleStore(capacity=50, max_series=1), unit_sec=60)
+    candles.subscribe(['BTC_1'])
+    t0 = 1700000100.0
+    closed = []
+    for i, close in enumerate([100.0, 101.0, 100.5, 102.0, 101.0]):
+        closed += candles.update('BTC', close - 0.2, close - 0.2, close - 0.2, t0 + 60 * i, 1)
+        closed += candles.update('BTC', close, close, close, t0 + 60 * i + 30, 1)
+    # 병합된 8 tick 과 1 tick, 거래량과 관계없이 tick 수가 volume
+    closed += candles.update('BTC', 104.0, 104.5, 100.8, t0 + 300, 8)
+    closed += candles.update('BTC', 104.2, 104.2, 104.2, t0 + 330, 1)
+    closed += candles.update('BTC', 104.0, 104.0, 104.0, t0 + 360, 1)
+    bars = [c for _, c in closed]
+    assert [c.volume for c in bars] == [2, 2, 2, 2, 2, 9]
+
+    indicators = {key: create(key) for key in ('mfi|5.0', 'vma|5.0', 'obv_cross|2.0|3.0', 'vma_cross|2.0|5.0')}
+    for c in bars:
+        for indicator in indicators.values():
+            indicator.update(c)
+    # tick 이 몰린 마지막 candle: 평균 (2 * 4 + 9) / 5 = 3.4 tick
+    assert indicators['vma|5.0'].signal((2.0,)) == 1
+    assert indicators['vma|5.0'].signal((3.0,)) == 0
+    assert indicators['vma_cross|2.0|5.0'].signal(()) == 1
+    assert indicators['obv_cross|2.0|3.0'].obv == sum(c.volume * ((c.close > p.close) - (c.close < p.close))
+                                                       for p, c in zip(bars, bars[1:]))
+    typical = [(c.high + c.low + c.close) / 3 for c in bars]
+    flows = [(t * c.volume, t - p) for p, t, c in zip(typical, typical[1:], bars[1:])]
+    positive = sum(flow for flow, change in flows if change > 0)
+    negative = sum(flow for flow, change in flows if change < 0)
+    assert indicators['mfi|5.0'].value == pytest.approx(100.0 - 100.0 / (1.0 + positive / negative))
@@ -0,0 +1,166 @@
+import json
+
+import pytest
+
+pytest.importorskip('lupa')
+
+from config.settings import Watcher  # noqa: E402
+from config.tuning import WatcherKeys  # noqa: E402
+
+ORDER = {'active': 1, 'status': 'WAITING', 'side': 'BUY', 'tradeType': 'Limit', 'indicatorType': 'OPEN',
+         'symbol': 'BTC', 'planType': 'reserved', 'direction': 1, 'indicator': 'reserved'}
+
+
+def place_orders(client, db):
+    """
+    db_set_order 로 등록한 주문 (ORDER_KEYS index 있음) 과 index 기록 이전 형식의 주문을 섞어 등록
+    """
+    db.db_set_order(dict(ORDER, id='a1', price=100.0))
+    db.db_set_order(dict(ORDER, id='a2', price=90.0))
+    # 가격과 같은 trigger
+    db.db_set_order(dict(ORDER, id='a3', price=95.0))
+    db.db_set_order(dict(ORDER, id='a4', price=99.0))
+    db.db_set_trigger('BTC', -1, 'a4=CLOSE', 300.0)
+    db.db_set_order(dict(ORDER, id='a5', direction=-1, price=200.0, indicatorType='TAKE'))
+    db.db_set_order(dict(ORDER, id='t1', planType='trendLine', price=97.0, endDate=2000), start_waiting_time=1000)
+    db.db_set_line_queue('t1=OPEN', {'symbol': 'BTC', 'direction': 1})
+    db.db_set_order(dict(ORDER, id='e1', symbol='ETH', price=10.0))
+    # index 기록 이전 주문
+    client.hset(Watcher.MTS_ORDER_LIST, 'l1', json.dumps(dict(ORDER, id='l1', price=98.0)))
+    client.hset(Watcher.MTS_ORDER_DETAIL, 'l1', '{}')
+    client.zadd(Watcher.WATCHER_LIST.format('BTC', 1), {'l1=OPEN': 98.0})
+    client.zadd(Watcher.WATCHER_LIST.format('BTC', -1), {'l1=CLOSE': 250.0})
+    client.hset(Watcher.TRENDLINE_QUEUE, 'l1=OPEN', '{}')
+    client.zadd(Watcher.END_TIME_MON, {'l1': 3000})
+
+
+def python_remove(client, _id, symbol):
+    """
+    lua script 이전의 rm_order (주문 id 로 trendline queue, 양쪽 trigger, 주문정보, start/end time 삭제)
+    """
+    for _key, _ in client.hscan_iter(Watcher.TRENDLINE_QUEUE, match=_id + '=*'):
+        client.hdel(Watcher.TRENDLINE_QUEUE, _key)
+    for direction in (1, -1):
+        for member, _ in client.zscan_iter(Watcher.WATCHER_LIST.format(symbol, direction), match=_id + '=*'):
+            client.zrem(Watcher.WATCHER_LIST.format(symbol, direction), member)
+    client.hdel(Watcher.MTS_ORDER_LIST, _id)
+    client.hdel(Watcher.MTS_ORDER_DETAIL, _id)
+    client.zrem(Watcher.START_TIME_MON, _id)
+    client.zrem(Watcher.END_TIME_MON, _id)
+
+
+def python_fire(client, symbol, direction, price):
+    """
+    lua script 이전의 db_scan_decrease / db_scan_increase (trigger 별 hget, rm_order, rpush)
+    """
+    _min, _max = (price, '+inf') if direction == 1 else ('-inf', price)
+    fired = []
+    for member in client.zrangebyscore(Watcher.WATCHER_LIST.format(symbol, direction), _min, _max):
+        _id, action = member.split('=')
+        if client.hget(Watcher.MTS_ORDER_LIST, _id):
+            python_remove(client, _id, symbol)
+            client.rpush(Watcher.POST_ORDER, member)
+            fired.append(member)
+    return fired
+
+
+def state(client):
+    """
+    python 처리에서도 사용하던 key 의 내용
+    """
+    res = {}
+    for _key in client.keys('*'):
+        if _key.startswith(WatcherKeys.ORDER_KEYS):
+            continue
+        _type = client.type(_key)
+        if _type == 'zset':
+            res[_key] = client.zrange(_key, 0, -1, withscores=True)
+        elif _type == 'hash':
+            res[_key] = client.hgetall(_key)
+        elif _type == 'list':
+            res[_key] = client.lrange(_key, 0, -1)
+        elif _type == 'set':
+            res[_key] = sorted(client.smembers(_key))
+    return res
+
+
+def messages(pubsub):
+    res = {}
+    while True:
+        message = pubsub.get_message(timeout=0.01)
+        if message is None:
+            return res
+        if message['type'] == 'message':
+            res.setdefault(message['channel'], []).extend(json.loads(message['data']))
+
+
+@pytest.fixture
+def db(redis_client):
+    from database.redis_db import BaseDb
+    return BaseDb()
+
+
+@pytest.mark.parametrize('direction, price', [(1, 95.0), (1, 100.0), (1, 80.0), (-1, 250.0), (-1, 199.0)])
+def test_fire_triggers_matches_python_path(redis_client, db, direction, price):
+    place_orders(redis_client, db)
+    fired = python_fire(redis_client, 'BTC', direction, price)
+    expected = state(redis_client)
+
+    redis_client.flushall()
+    place_orders(redis_client, db)
+    assert db.db_fire_triggers_many([('BTC', direction, price)]) == [fired]
+    assert state(redis_client) == expected
+
+
+def test_fire_triggers_publishes_removals(redis_client, db):
+    from common.trigger_book import TriggerBook
+
+    place_orders(redis_client, db)
+    book = TriggerBook()
+    for (symbol, direction), items in db.db_get_watcher_book(['BTC']).items():
+        book.load(symbol, direction, items)
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(WatcherKeys.BOOK_CHANNEL, WatcherKeys.LINE_CHANNEL, WatcherKeys.TIME_CHANNEL)
+    messages(pubsub)
+
+    fired = db.db_fire_triggers_many([('BTC', 1, 95.0)])[0]
+    events = messages(pubsub)
+    for op in events[WatcherKeys.BOOK_CHANNEL]:
+        book.apply(op)
+    # 반대 direction 의 trigger 까지 local book 에서 빠짐
+    for direction in (1, -1):
+        assert sorted(book.sides[('BTC', direction)].records) == \
+            sorted(redis_client.zrange(Watcher.WATCHER_LIST.format('BTC', direction), 0, -1))
+    assert sorted(op[1] for op in events[WatcherKeys.TIME_CHANNEL]) == sorted(m.split('=')[0] for m in fired)
+    assert sorted(op[1] for op in events[WatcherKeys.LINE_CHANNEL]) == ['l1=OPEN', 't1=OPEN']
+
+
+def test_fire_triggers_drops_stale_trigger(redis_client, db):
+    redis_client.zadd(Watcher.WATCHER_LIST.format('BTC', 1), {'s1=OPEN': 96.0})
+    assert db.db_fire_triggers_many([('BTC', 1, 95.0)]) == [[]]
+    # python 처리는 주문정보가 없는 trigger 를 남겨 매 tick 다시 조회했음
+    assert redis_client.zcard(Watcher.WATCHER_LIST.format('BTC', 1)) == 0
+    assert redis_client.llen(Watcher.POST_ORDER) == 0
+
+
+@pytest.mark.parametrize('_id', ['a4', 't1', 'l1', 'e1', 'missing'])
+def test_remove_orders_matches_python_path(redis_client, db, _id):
+    symbol = 'ETH' if _id == 'e1' else 'BTC'
+    place_orders(redis_client, db)
+    python_remove(redis_client, _id, symbol)
+    expected = state(redis_client)
+
+    redis_client.flushall()
+    place_orders(redis_client, db)
+    db.rm_order(_id, symbol)
+    assert state(redis_client) == expected
+    assert not redis_client.exists(WatcherKeys.ORDER_KEYS + _id)
+
+
+def test_post_orders_once_skips_processed(redis_client, db):
+    place_orders(redis_client, db)
+    orders = [('a1', 'BTC', 'OPEN'), ('missing', 'BTC', 'OPEN'), ('a5', 'BTC', 'CLOSE')]
+    assert db.db_post_orders(orders) == ['a1=OPEN', 'a5=CLOSE']
+    # 다른 process 가 같은 주문을 다시 처리해도 한번만 등록
+    assert db.db_post_orders(orders) == []
+    assert redis_client.lrange(Watcher.POST_ORDER, 0, -1) == ['a1=OPEN', 'a5=CLOSE']
@@ -0,0 +1,44 @@
+from common.metrics import Metrics, render, fetch_snapshot
+
+
+def test_render_groups_processes_by_family():
+    price = Metrics('price_watcher')
+    price.inc('watcher_fired_total', 2, symbol='BTC')
+    price.inc('watcher_fired_total', symbol='BTC')
+    price.set('watcher_queue_depth', 7)
+    line = Metrics('line_watcher')
+    line.set('watcher_queue_depth', 1, name='a"b')
+    assert render([price.snapshot(), line.snapshot()]).splitlines() == [
+        '# TYPE watcher_fired_total counter',
+        'watcher_fired_total{process="price_watcher",symbol="BTC"} 3',
+        '# TYPE watcher_queue_depth gauge',
+        'watcher_queue_depth{process="price_watcher"} 7',
+        'watcher_queue_depth{process="line_watcher",name="a\\"b"} 1',
+    ]
+
+
+def test_render_histogram_is_cumulative():
+    metrics = Metrics('p')
+    for value in (0.003, 0.004, 0.2, 10.0):
+        metrics.observe('watcher_latency_seconds', value)
+    lines = render([metrics.snapshot()]).splitlines()
+    assert lines[0] == '# TYPE watcher_latency_seconds histogram'
+    buckets = dict(line.rsplit(' ', 1) for line in lines if '_bucket' in line)
+    assert buckets['watcher_latency_seconds_bucket{process="p",le="0.0025"}'] == '0'
+    assert buckets['watcher_latency_seconds_bucket{process="p",le="0.005"}'] == '2'
+    assert buckets['watcher_latency_seconds_bucket{process="p",le="0.25"}'] == '3'
+    assert buckets['watcher_latency_seconds_bucket{process="p",le="5.0"}'] == '3'
+    assert buckets['watcher_latency_seconds_bucket{process="p",le="+Inf"}'] == '4'
+    assert 'watcher_latency_seconds_count{process="p"} 4' in lines
+    assert float(lines[-2].rsplit(' ', 1)[1]) == 10.207
+
+
+def test_server_serves_snapshot():
+    metrics = Metrics('p')
+    metrics.inc('watcher_ticks_total', 5)
+    server = metrics.serve('127.0.0.1', 0)
+    try:
+        assert fetch_snapshot('127.0.0.1', server.server_address[1]) == [metrics.snapshot()]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from config.settings import Watcher
+from config.tuning import WatcherKeys
+
+ORDER = {'active': 1, 'status': 'WAITING', 'side': 'BUY', 'tradeType': 'Limit', 'indicatorType': 'OPEN',
+         'symbol': 'BTC', 'planType': 'reserved', 'direction': 1, 'indicator': 'reserved'}
+
+
+def refs(client, _id):
+    return sorted(json.loads(ref) for ref in client.smembers(WatcherKeys.ORDER_KEYS + _id))
+
+
+def snapshot(client):
+    res = {}
+    for _key in client.keys('*'):
+        _type = client.type(_key)
+        if _type == 'zset':
+            res[_key] = client.zrange(_key, 0, -1, withscores=True)
+        elif _type == 'hash':
+            res[_key] = client.hgetall(_key)
+        elif _type == 'set':
+            res[_key] = sorted(client.smembers(_key))
+    return res
+
+
+def place_trendline(db):
+    db.db_set_order(dict(ORDER, id='t1', planType='trendLine', price=97.0, endDate=2000), start_waiting_time=1000)
+    db.db_set_line_queue('t1=OPEN', {'symbol': 'BTC', 'direction': 1})
+    db.db_set_trigger('BTC', -1, 't1=CLOSE', 120.0)
+
+
+def place_others(db):
+    db.db_set_order(dict(ORDER, id='a1', price=100.0))
+    db.db_set_trigger('BTC', -1, 'a1=CLOSE', 110.0)
+    # id 가 t1 으로 시작하는 다른 주문
+    db.db_set_order(dict(ORDER, id='t10', price=96.0))
+
+
+@pytest.fixture
+def db(redis_client):
+    from database.redis_db import BaseDb
+    return BaseDb()
+
+
+def test_writes_record_owned_keys(redis_client, db):
+    place_trendline(db)
+    db.db_change_score('BTC', 1, {'t1=OPEN': 96.5})
+    assert refs(redis_client, 't1') == sorted([
+        ['h', Watcher.TRENDLINE_QUEUE, 't1=OPEN'],
+        ['w', Watcher.WATCHER_LIST.format('BTC', 1), 't1=OPEN', 'BTC', 1],
+        ['w', Watcher.WATCHER_LIST.format('BTC', -1), 't1=CLOSE', 'BTC', -1],
+        ['z', Watcher.START_TIME_MON, 't1'],
+        ['z', Watcher.END_TIME_MON, 't1'],
+    ])
+
+
+def test_rm_order_leaves_other_orders(redis_client, db):
+    place_others(db)
+    expected = snapshot(redis_client)
+
+    redis_client.flushall()
+    place_others(db)
+    place_trendline(db)
+    db.rm_order('t1', 'BTC')
+    assert snapshot(redis_client) == expected
+
+
+def test_rm_order_publishes_indexed_triggers(redis_client, db):
+    place_trendline(db)
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(WatcherKeys.BOOK_CHANNEL)
+    pubsub.get_message(timeout=0.01)
+
+    db.rm_order('t1', 'BTC')
+    message = pubsub.get_message(timeout=0.01)
+    assert sorted(json.loads(message['data'])) == [['r', 'BTC', -1, 't1=CLOSE'], ['r', 'BTC', 1, 't1=OPEN']]
@@ -0,0 +1,55 @@
+import pytest
+
+from common.ring_buffer import TickRing
+
+
+@pytest.fixture
+def ring():
+    ring = TickRing(capacity=4, max_symbols=2)
+    yield ring
+    ring.close()
+
+
+def test_wraparound_keeps_order(ring):
+    expected = []
+    received = []
+    # 여러번 한바퀴를 넘으며, 읽기 시작 위치가 끝에 가까워 두 구간으로 나뉘는 경우를 포함
+    for i in range(25):
+        for j in range(i % 4 + 1):
+            tick = ('BTC' if j % 2 else 'ETH', float(i * 10 + j), 1000.0 + i, j)
+            assert ring.put(*tick)
+            expected.append(tick)
+        received.extend(ring.get_many())
+        assert ring.qsize() == 0
+    assert received == expected
+
+
+def test_full_ring_rejects_until_read(ring):
+    for i in range(4):
+        assert ring.put('BTC', float(i), 0.0)
+    assert ring.free() == 0
+    assert not ring.put('BTC', 4.0, 0.0)
+    assert ring.get_many(limit=3) == [('BTC', float(i), 0.0, 1) for i in range(3)]
+    assert ring.put('BTC', 4.0, 0.0)
+    assert ring.put('BTC', 5.0, 0.0)
+    assert ring.get_many() == [('BTC', 3.0, 0.0, 1), ('BTC', 4.0, 0.0, 1), ('BTC', 5.0, 0.0, 1)]
+    assert ring.get_many() == []
+
+
+def test_symbol_table_full(ring):
+    assert ring.put('BTC', 1.0, 0.0)
+    assert ring.put('ETH', 2.0, 0.0)
+    assert ring.symbol_id('XRP') is None
+    assert not ring.put('XRP', 3.0, 0.0)
+    assert ring.qsize() == 2
+    assert ring.get_many() == [('BTC', 1.0, 0.0, 1), ('ETH', 2.0, 0.0, 1)]
+
+
+@pytest.mark.parametrize('symbol', ['X' * 33, '비트코인' * 3])
+def test_long_symbol_is_rejected(ring, symbol):
+    # 32 byte 로 잘라 기록하지 않고 table 에도 추가하지 않음
+    assert ring.symbol_id(symbol) is None
+    assert not ring.put(symbol, 1.0, 0.0)
+    assert ring.put('X' * 32, 2.0, 0.0)
+    assert ring.put('BTC', 3.0, 0.0)
+    assert ring.get_many() == [('X' * 32, 2.0, 0.0, 1), ('BTC', 3.0, 0.0, 1)]
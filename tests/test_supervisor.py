@@ -0,0 +1,89 @@
+import os
+from time import sleep, time
+
+import pytest
+
+from common.heartbeat import Heartbeat
+from common.metrics import Metrics
+from config.tuning import SupervisorConfig
+
+
+class Role(object):
+    def __init__(self):
+        self.heartbeat = Heartbeat()
+
+    def crash(self):
+        os._exit(1)
+
+    def hang(self):
+        self.heartbeat.beat()
+        sleep(60)
+
+    def silent(self):
+        sleep(60)
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    import watchdog
+    monkeypatch.setattr(SupervisorConfig, 'MAX_WAIT_SEC', 0.05)
+    monkeypatch.setattr(SupervisorConfig, 'BACKOFF_MIN', 0.05)
+    monkeypatch.setattr(SupervisorConfig, 'BACKOFF_MAX', 0.1)
+    monkeypatch.setattr(SupervisorConfig, 'HANG_SEC', 0.3)
+    monkeypatch.setattr(SupervisorConfig, 'STARTUP_SEC', 0.3)
+    monkeypatch.setattr(SupervisorConfig, 'TERMINATE_SEC', 1)
+    dog = watchdog.WatchDog.__new__(watchdog.WatchDog)
+    dog.metrics = Metrics('watchdog')
+    dog.process_list = {}
+    yield dog
+    for info in dog.process_list.values():
+        if info['proc'] is not None:
+            info['proc'].kill()
+            info['proc'].join()
+
+
+def add(dog, _name, target):
+    dog.process_list[_name] = {'target': target, 'Q': [], 'proc': None, 'heartbeat': target.__self__.heartbeat,
+                               'started_at': 0, 'down_since': None, 'restart_at': None, 'failures': 0}
+    dog.start(_name)
+
+
+def run_until(dog, done, limit=10):
+    deadline = time() + limit
+    while not done():
+        assert time() < deadline
+        dog.supervise()
+
+
+def test_crash_loop_backs_off(supervisor, monkeypatch):
+    add(supervisor, 'crash', Role().crash)
+    delays = []
+    exited = supervisor.exited
+
+    def record(_name, down_since):
+        exited(_name, down_since)
+        delays.append(supervisor.metrics.gauges[('watcher_process_backoff_seconds', (('target', _name),))])
+
+    monkeypatch.setattr(supervisor, 'exited', record)
+    run_until(supervisor, lambda: len(delays) == 4)
+    # 첫 종료는 즉시, 연속 종료부터 2배씩 BACKOFF_MAX 까지
+    assert delays == [0, 0.05, 0.1, 0.1]
+
+    # 충분히 오래 실행된 후의 종료는 다시 즉시 재시작
+    monkeypatch.setattr(SupervisorConfig, 'BACKOFF_RESET_SEC', 0)
+    run_until(supervisor, lambda: len(delays) == 5)
+    assert delays[-1] == 0
+    assert supervisor.process_list['crash']['failures'] == 1
+
+
+@pytest.mark.parametrize('target', ['hang', 'silent'])
+def test_stalled_process_is_restarted(supervisor, target):
+    add(supervisor, target, getattr(Role(), target))
+    first = supervisor.process_list[target]['proc']
+    run_until(supervisor, lambda: supervisor.metrics.counters.get(('watcher_process_hangs_total', (('target', target),))))
+    info = supervisor.process_list[target]
+    assert not first.is_alive()
+    assert info['proc'] is not first and info['proc'].is_alive()
+    assert supervisor.metrics.counters[('watcher_process_restarts_total', (('target', target),))] == 1
+    # downtime 은 마지막 heartbeat (없으면 시작 시간) 부터
+    assert supervisor.metrics.counters[('watcher_process_downtime_seconds_total', (('target', target),))] >= 0.3
@@ -0,0 +1,39 @@
+from common.ticks import TickConflator
+
+
+def test_add_keeps_high_low_per_symbol():
+    merged = TickConflator()
+    for symbol, price, ts in [('BTC', 100.0, 1.0), ('ETH', 10.0, 1.1), ('BTC', 104.0, 1.2), ('BTC', 97.0, 1.3),
+                              ('ETH', 9.5, 1.4), ('BTC', 101.0, 1.5)]:
+        merged.add(symbol, price, ts)
+    assert len(merged) == 2
+    assert merged.ticks == 6
+    # [last, high, low, 가장 오래된 수신 시간, tick 수]
+    assert merged.take() == {'BTC': [101.0, 104.0, 97.0, 1.0, 4], 'ETH': [9.5, 10.0, 9.5, 1.1, 2]}
+    assert len(merged) == 0
+
+
+def test_merge_extends_range_of_earlier_batch():
+    merged = TickConflator()
+    merged.add('BTC', 100.0, 2.0)
+    merged.merge({'BTC': [102.0, 103.0, 99.0, 1.5, 3], 'XRP': [0.5, 0.6, 0.4, 1.8, 2]})
+    merged.merge({'BTC': [98.0, 101.0, 96.0, 3.0, 5]})
+    assert merged.take() == {'BTC': [98.0, 103.0, 96.0, 1.5, 9], 'XRP': [0.5, 0.6, 0.4, 1.8, 2]}
+
+
+def test_take_does_not_share_rows():
+    merged = TickConflator()
+    merged.add('BTC', 100.0, 1.0)
+    batch = merged.take()
+    merged.add('BTC', 90.0, 2.0)
+    assert batch == {'BTC': [100.0, 100.0, 100.0, 1.0, 1]}
+    assert merged.take() == {'BTC': [90.0, 90.0, 90.0, 2.0, 1]}
+
+
+def test_ring_records_carry_merged_count():
+    merged = TickConflator()
+    # ring 이 가득 차 병합된 tick 을 high, low, last 로 기록한 record, tick 수는 last 에만 있음
+    for price, ts, count in [(104.0, 1.0, 0), (97.0, 1.0, 0), (101.0, 1.0, 4), (102.0, 1.5, 1)]:
+        merged.add('BTC', price, ts, count)
+    assert merged.ticks == 5
+    assert merged.take() == {'BTC': [102.0, 104.0, 97.0, 1.0, 5]}
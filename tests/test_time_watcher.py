@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from common.scheduler import DeadlineHeap
+from config.settings import Watcher
+from config.tuning import WatcherKeys, TimeConfig
+
+ORDER = {'active': 1, 'status': 'WAITING', 'side': 'BUY', 'tradeType': 'Limit', 'indicatorType': 'OPEN',
+         'symbol': 'BTC', 'planType': 'trendLine', 'direction': 1, 'indicator': 'trendLine'}
+
+
+def test_deadline_heap_keeps_latest_push():
+    heap = DeadlineHeap()
+    heap.push('a', 300)
+    heap.push('b', 100)
+    heap.push('c', 200)
+    # 다시 push 하거나 discard 한 key 의 이전 deadline 은 무시
+    heap.push('b', 400)
+    heap.discard('c')
+    assert heap.peek() == 300
+    assert heap.pop_due(350) == ['a']
+    assert heap.pop_due(1000) == ['b']
+    assert heap.peek() is None
+    assert len(heap) == 0
+
+
+@pytest.fixture
+def watcher(redis_client, monkeypatch):
+    import watchdog
+    from common.change_feed import ChangeFeed
+
+    now = {'ms': 0}
+    monkeypatch.setattr(watchdog, 'get_unixtime_ms', lambda: now['ms'])
+    monkeypatch.setattr(TimeConfig, 'WINDOW', 2)
+    monkeypatch.setattr(TimeConfig, 'MAX_WAIT_SEC', 0)
+    for i, end in enumerate([1000, 2000, 3000, 4000], 1):
+        _id = 'e{}'.format(i)
+        redis_client.hset(Watcher.MTS_ORDER_LIST, _id, json.dumps(dict(ORDER, id=_id, endDate=end)))
+        redis_client.zadd(Watcher.END_TIME_MON, {_id: end})
+    w = watchdog.TimeWatcher()
+    w.time_feed = ChangeFeed(w.client, WatcherKeys.TIME_CHANNEL)
+    w.time_feed.subscribe()
+    w.now = now
+    return w
+
+
+def test_window_reloads_after_horizon(redis_client, watcher):
+    watcher.sync_deadlines()
+    # 가장 빠른 WINDOW 건만 heap 에 올리고 나머지는 horizon 이후로 남김
+    assert sorted(watcher.deadlines['end'].due) == ['e1', 'e2']
+    assert watcher.horizon['end'] == 2000
+    assert watcher.next_deadline() == 1000
+
+    watcher.now['ms'] = 2500
+    watcher.set_price()
+    assert redis_client.lrange(Watcher.POST_ORDER, 0, -1) == ['e1=END', 'e2=END']
+    # window 를 모두 처리하면 다음 window 조회
+    assert sorted(watcher.deadlines['end'].due) == ['e3', 'e4']
+    assert watcher.horizon['end'] == 4000
+
+
+def test_feed_adds_deadline_inside_horizon(redis_client, watcher):
+    from database.redis_db import BaseDb
+
+    watcher.sync_deadlines()
+    db = BaseDb()
+    db.db_set_order(dict(ORDER, id='n1', price=90.0, endDate=1500))
+    db.db_set_order(dict(ORDER, id='n2', price=90.0, endDate=5000))
+    watcher.sync_deadlines(timeout=0.01)
+    # horizon 밖의 deadline 은 window 를 다시 읽을 때 올라옴
+    assert sorted(watcher.deadlines['end'].due) == ['e1', 'e2', 'n1']
+    assert watcher.next_deadline() == 1000
+
+    db.rm_order('e1', 'BTC')
+    watcher.sync_deadlines(timeout=0.01)
+    assert watcher.next_deadline() == 1500
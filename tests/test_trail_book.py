@@ -0,0 +1,79 @@
+import pytest
+
+from common.trail_book import TrailBook
+
+
+def trail_book(*orders):
+    """
+    :param orders: (member, direction, triggerPrice), 첫 tick 은 100
+    """
+    book = TrailBook()
+    book.load('BTC', [])
+    for member, direction, trigger in orders:
+        book.register('BTC', direction, member, trigger)
+    assert book.update('BTC', 100.0) == []
+    return book
+
+
+def stops(book):
+    return {member: stop for rows in book.flush(100).values() for member, stop, state in rows}
+
+
+def test_sell_stop_only_moves_up():
+    book = trail_book(('o1=CLOSE', 1, 95.0))
+    assert stops(book) == {'o1=CLOSE': 95.0}
+    assert book.update('BTC', 110.0) == []
+    assert stops(book) == {'o1=CLOSE': 105.0}
+    # 가격이 내려도 stop 은 그대로
+    assert book.update('BTC', 106.0) == []
+    assert stops(book) == {}
+    assert book.update('BTC', 105.0) == [('o1=CLOSE', 1)]
+    assert len(book) == 0
+
+
+def test_buy_stop_only_moves_down():
+    book = trail_book(('o1=CLOSE', -1, 105.0))
+    assert stops(book) == {'o1=CLOSE': 105.0}
+    assert book.update('BTC', 90.0) == []
+    assert stops(book) == {'o1=CLOSE': 95.0}
+    assert book.update('BTC', 94.0) == []
+    assert stops(book) == {}
+    assert book.update('BTC', 95.0) == [('o1=CLOSE', -1)]
+
+
+@pytest.mark.parametrize('direction, trigger, high, low, last', [(1, 95.0, 120.0, 94.0, 118.0),
+                                                                  (-1, 105.0, 106.0, 80.0, 82.0)])
+def test_merged_tick_checks_previous_stop_first(direction, trigger, high, low, last):
+    book = trail_book(('o1=CLOSE', direction, trigger))
+    # 구간 안의 반대쪽 극값이 이전 stop 을 넘었으면, 새 extreme 으로 stop 을 옮기기 전에 trigger
+    assert book.update('BTC', last, high=high, low=low) == [('o1=CLOSE', direction)]
+
+
+def test_orders_share_extreme_after_new_high():
+    book = trail_book(('o1=CLOSE', 1, 95.0))
+    book.update('BTC', 102.0)
+    book.register('BTC', 1, 'o2=CLOSE', 99.0)
+    book.update('BTC', 101.0)
+    assert stops(book) == {'o1=CLOSE': 97.0, 'o2=CLOSE': 99.0}
+    book.update('BTC', 110.0)
+    assert stops(book) == {'o1=CLOSE': 105.0, 'o2=CLOSE': 108.0}
+    assert book.update('BTC', 108.0) == [('o2=CLOSE', 1)]
+    assert book.update('BTC', 105.0) == [('o1=CLOSE', 1)]
+
+
+def test_restored_state_keeps_stop():
+    book = TrailBook()
+    book.load('BTC', [('o1=CLOSE', 1, 95.0, [95.0, 5.0, 120.0]), ('o2=CLOSE', 1, 90.0, [80.0, 5.0, 120.0])])
+    # 저장된 triggerPrice 가 다르면 (주문 변경) 다음 tick 에서 새로 시작
+    assert book.update('BTC', 116.0) == []
+    assert stops(book) == {'o1=CLOSE': 115.0, 'o2=CLOSE': 90.0}
+    assert book.update('BTC', 115.0) == [('o1=CLOSE', 1)]
+
+
+@pytest.mark.parametrize('direction, last', [(1, 94.0), (-1, 106.0)])
+def test_already_crossed_is_not_tracked(direction, last):
+    book = TrailBook()
+    book.load('BTC', [])
+    book.register('BTC', direction, 'o1=CLOSE', 95.0 if direction == 1 else 105.0)
+    assert book.update('BTC', last) == []
+    assert len(book) == 0
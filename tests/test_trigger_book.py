@@ -0,0 +1,59 @@
+from common.trigger_book import TriggerBook
+
+
+def book_of(buy=(), sell=()):
+    book = TriggerBook()
+    book.load('BTC', 1, buy)
+    book.load('BTC', -1, sell)
+    return book
+
+
+def members(records):
+    return sorted('{}={}'.format(record.id, record.action) for record in records)
+
+
+def test_buy_side_fires_at_or_below_score():
+    book = book_of(buy=[('o1=OPEN', '100'), ('o2=OPEN', '99.5'), ('o3=CLOSE', '100')])
+    assert book.best('BTC', 1) == 100.0
+    # score 와 같은 가격이면 trigger
+    assert members(book.crossing('BTC', 1, 100.0)) == ['o1=OPEN', 'o3=CLOSE']
+    assert book.crossed('BTC', 1, 100.0)
+    assert book.crossing('BTC', 1, 100.01) == []
+    assert not book.crossed('BTC', 1, 100.01)
+    assert members(book.crossing('BTC', 1, 99.5)) == ['o1=OPEN', 'o2=OPEN', 'o3=CLOSE']
+
+
+def test_sell_side_fires_at_or_above_score():
+    book = book_of(sell=[('o1=CLOSE', '200'), ('o2=TRIGGER_CANCEL', '200.5')])
+    assert book.best('BTC', -1) == 200.0
+    assert members(book.crossing('BTC', -1, 200.0)) == ['o1=CLOSE']
+    assert book.crossed('BTC', -1, 200.0)
+    assert book.crossing('BTC', -1, 199.99) == []
+    assert not book.crossed('BTC', -1, 199.99)
+    assert members(book.crossing('BTC', -1, 201)) == ['o1=CLOSE', 'o2=TRIGGER_CANCEL']
+
+
+def test_crossing_matches_best():
+    book = book_of(buy=[('o{}=OPEN'.format(i), str(90 + i)) for i in range(10)],
+                   sell=[('s{}=CLOSE'.format(i), str(110 + i)) for i in range(10)])
+    for price in [x / 4.0 for x in range(340, 500)]:
+        for direction in (1, -1):
+            assert bool(book.crossing('BTC', direction, price)) == book.crossed('BTC', direction, price)
+
+
+def test_events_move_and_remove_triggers():
+    book = book_of(buy=[('o1=OPEN', '100')])
+    book.apply(['a', 'BTC', 1, 'o1=OPEN', 90.0])
+    assert book.crossing('BTC', 1, 95.0) == []
+    assert members(book.crossing('BTC', 1, 90.0)) == ['o1=OPEN']
+    book.apply(['r', 'BTC', '1', 'o1=OPEN'])
+    assert book.best('BTC', 1) is None
+    assert not book.crossed('BTC', 1, 0.0)
+    assert book.size() == 0
+
+
+def test_unloaded_symbol_is_ignored():
+    book = book_of()
+    book.apply(['a', 'ETH', 1, 'e1=OPEN', 10.0])
+    assert book.crossing('ETH', 1, 1.0) == []
+    assert book.size('ETH') == 0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from config.settings import Watcher
+from config.tuning import WarmStartConfig, WatcherKeys
+
+ORDER = {'active': 1, 'status': 'WAITING', 'side': 'BUY', 'tradeType': 'Limit', 'indicatorType': 'OPEN',
+         'symbol': 'BTC', 'planType': 'reserved', 'direction': 1, 'indicator': 'reserved'}
+
+
+class IdleThread(object):
+    """
+    신규 주문 수신 thread 대신 test 에서 new_order_handle 을 직접 호출
+    """
+    def __init__(self, target, daemon):
+        pass
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def proc(redis_client, monkeypatch):
+    import watchdog
+    monkeypatch.setattr(watchdog, 'Thread', IdleThread)
+    monkeypatch.setattr(WarmStartConfig, 'DECODE_WORKERS', 0)
+    return watchdog.NewOrderProc()
+
+
+def test_intake_during_rebuild_wins(redis_client, proc):
+    stored = {_id: json.dumps(dict(ORDER, id=_id, price=price)) for _id, price in [('a1', 100.0), ('a2', 90.0),
+                                                                                   ('a3', 80.0)]}
+    redis_client.hset(Watcher.MTS_ORDER_LIST, mapping=stored)
+
+    def scan(count):
+        yield {'a1': stored['a1']}
+        # 재등록 중 a2 가 변경되고 a3 는 fire 됨, 뒤 chunk 의 scan 결과는 그 이전 값
+        detail = dict(ORDER, id='a2', indicators=[{'triggerPrice': 95.0}])
+        redis_client.hset(Watcher.ORDER_DETAIL, 'a2', json.dumps(detail))
+        redis_client.rpush(Watcher.NEW_ORDER, 'a2')
+        proc.new_order_handle()
+        proc.rm_order('a3', 'BTC')
+        assert proc.live_ids == {'a2'}
+        yield {'a2': stored['a2'], 'a3': stored['a3']}
+
+    proc.db_scan_order_list = scan
+    proc.warm_start()
+    assert redis_client.zrange(Watcher.WATCHER_LIST.format('BTC', 1), 0, -1, withscores=True) == \
+        [('a2=OPEN', 95.0), ('a1=OPEN', 100.0)]
+    assert (proc.warm_stats['orders'], proc.warm_stats['skipped'], proc.warm_stats['done']) == (1, 2, 1)
+    assert not proc.rebuilding
+    assert proc.live_ids == set()
+
+
+@pytest.mark.parametrize('fail_at', ['scan', 'write'])
+def test_failed_rebuild_is_not_reported_done(redis_client, proc, fail_at):
+    stored = {'a1': json.dumps(dict(ORDER, id='a1', price=100.0))}
+    redis_client.hset(Watcher.MTS_ORDER_LIST, mapping=stored)
+
+    def scan(count):
+        yield stored
+        if fail_at == 'scan':
+            raise ConnectionError('scan failed')
+
+    def write_rebuild(targets, p):
+        raise ConnectionError('write failed')
+
+    proc.db_scan_order_list = scan
+    if fail_at == 'write':
+        proc.write_rebuild = write_rebuild
+    # 예외로 run 이 끝나 WatchDog 이 process 를 재시작하도록 WARM_START_DONE 없이 전달
+    with pytest.raises(ConnectionError):
+        proc.warm_start()
+    assert proc.warm_stats['done'] == 0
+    assert not proc.rebuilding
+    assert not redis_client.exists(WatcherKeys.WARM_START_STATS)
@@ -1,15 +1,59 @@
-from datetime import datetime
-import logging
-from collections import defaultdict
+import argparse
+import atexit
+import math
+import zlib
 import ujson as json
+from collections import deque
+from threading import Thread, Lock
 from database.redis_db import BaseDb
-from multiprocessing import Process, Queue
-from config.settings import DEBUG
+from multiprocessing import Process, Queue, Pool, connection
+from queue import Full, Empty
 from config.trading_map import Mapping
 from common.msg import MessageHandle
 from common.decorator import except_console
-from common.calc import get_unixtime, trendline_trigger_calc, round_coin, change_unixtime
-from time import sleep
+from common.log import get_logger, setup_logging
+from common.calc import get_unixtime, get_unixtime_ms, change_unixtime
+from common.change_feed import ChangeFeed
+from common.trigger_book import TriggerBook
+from common.trail_book import TrailBook
+from common.ticks import TickConflator
+from common.ring_buffer import TickRing, SYMBOL as RING_SYMBOL
+from common.trendline_engine import TrendlineEngine
+from common.scheduler import DeadlineHeap
+from common.metrics import Metrics, start_server, fetch_snapshot
+from common.tape import TickTapeWriter
+from common.heartbeat import Heartbeat
+from common.indicators import IndicatorEngine
+from common.candles import CandleStore, CandleAggregator
+from config.tuning import WatcherKeys, PriceBookConfig, TickBatchConfig, RingBufferConfig, PriceShardConfig, FireConfig, \
+    LineConfig, TimeConfig, WarmStartConfig, IntakeConfig, MetricsConfig, TapeConfig, RuntimeConfig, SupervisorConfig, \
+    CandleConfig, TrailConfig
+from time import sleep, time
+
+log = get_logger('watchdog')
+
+
+def metrics_port(name):
+    """
+    process 이름별 metrics endpoint port
+    :param name: WatchDog.process_list key ('price_watcher_0', ...)
+    """
+    if name.startswith('price_watcher_'):
+        return MetricsConfig.PRICE_WATCHER_PORT + int(name.rsplit('_', 1)[1])
+    return MetricsConfig.PROCESS_PORTS[name]
+
+
+def run_process(name, target, *args):
+    """
+    WatchDog 이 시작하는 child process 진입점, fork 로 물려받은 log queue 대신 process 의 log writer 를 새로 시작
+    """
+    setup_logging(name)
+    target(*args)
+
+
+def serve_metrics(metrics):
+    if MetricsConfig.ENABLED:
+        metrics.serve(MetricsConfig.HOST, metrics_port(metrics.process))
 
 
 class WatchDog():
@@ -18,69 +62,341 @@ class WatchDog():
     종료시 다시 사작하게 process를 관리하는 class
     """
     def __init__(self):
-        self.price_q = Queue() # price 정보를 담을 queue 생성
+        # PriceWatcher shard 별 price queue 생성
+        self.price_qs = [self.price_queue() for _ in range(PriceShardConfig.WORKERS)]
         self.get_price = GetPriceProc()
         self.new_order_proc = NewOrderProc()
         self.time_proc = TimeWatcher()
-        self.price_watcher = PriceWatcher()
+        self.price_watchers = [PriceWatcher(shard, PriceShardConfig.WORKERS) for shard in range(PriceShardConfig.WORKERS)]
         self.line_watcher = LineWatcher()
-        self.process_list = {'get_price': {'target': self.get_price.run, 'Q': [self.price_q]},
+        self.process_list = {'get_price': {'target': self.get_price.run, 'Q': self.price_qs},
                             'new_order_proc': {'target': self.new_order_proc.run, 'Q': []},
                             'time_proc': {'target': self.time_proc.run, 'Q': []},
-                            'price_watcher': {'target': self.price_watcher.run, 'Q': [self.price_q]},
                             'line_watcher': {'target': self.line_watcher.run, 'Q': []},
                             }
+        for shard, price_watcher in enumerate(self.price_watchers):
+            self.process_list['price_watcher_{}'.format(shard)] = {'target': price_watcher.run, 'Q': [self.price_qs[shard]]}
+        for _name, info in self.process_list.items():
+            # heartbeat: target 객체의 shared memory, failures: 연속 종료 횟수
+            info.update({'proc': None, 'heartbeat': info['target'].__self__.heartbeat, 'started_at': 0,
+                         'down_since': None, 'restart_at': None, 'failures': 0})
+        self.metrics = Metrics('watchdog')
+
+    @staticmethod
+    def price_queue():
+        """
+        price 정보를 담을 queue 생성, batch mode 에서는 병합된 batch 를 담고 크기를 제한
+        """
+        if RingBufferConfig.ENABLED:
+            price_q = TickRing(RingBufferConfig.CAPACITY, RingBufferConfig.MAX_SYMBOLS)
+            atexit.register(price_q.close)
+        elif TickBatchConfig.ENABLED:
+            price_q = Queue(TickBatchConfig.QUEUE_MAXSIZE)
+        else:
+            price_q = Queue()
+        return price_q
 
     def run(self):
-        print('WatchDog Start!')
-        ps_list =  list(self.process_list.keys())
-        for _name in ps_list:
-            self.process_list[_name]['proc'] = Process(target=self.process_list[_name]['target'], args=tuple(self.process_list[_name]['Q']))
-            print('{} strt!'.format(_name))
-            self.process_list[_name]['proc'].start()
+        log.info('WATCHDOG_START')
+        for _name in self.process_list:
+            self.start(_name)
+        if MetricsConfig.ENABLED:
+            start_server(MetricsConfig.HOST, MetricsConfig.PORT, self.collect_metrics)
 
         while True:
             try:
-                for _name in ps_list:
-                    if not self.process_list[_name]['proc'].is_alive():
-                        print('{} terminate!'.format(_name))
-                        self.process_list[_name]['proc'].join()
-                        self.process_list[_name]['proc'] = Process(target=self.process_list[_name]['target'],
-                                                                   args=tuple(self.process_list[_name]['Q']))
-                        self.process_list[_name]['proc'].start()
-                        print('{} start!'.format(_name))
-
+                self.supervise()
             except Exception as e:
-                print('RUN_LOOP_ERROR: ' + str(e))
-            sleep(3)
+                log.error('RUN_LOOP_ERROR', error=str(e))
+                sleep(1)
+
+    def start(self, _name):
+        info = self.process_list[_name]
+        info['heartbeat'].reset()
+        info['proc'] = Process(target=run_process, args=(_name, info['target']) + tuple(info['Q']), name=_name)
+        info['proc'].start()
+        info['started_at'] = time()
+        info['restart_at'] = None
+        if info['down_since'] is None:
+            log.info('PROCESS_START', target=_name)
+            return
+        downtime = info['started_at'] - info['down_since']
+        info['down_since'] = None
+        self.metrics.inc('watcher_process_restarts_total', target=_name)
+        self.metrics.inc('watcher_process_downtime_seconds_total', downtime, target=_name)
+        log.warning('PROCESS_RESTART', target=_name, downtime=round(downtime, 3), failures=info['failures'])
+
+    def supervise(self):
+        """
+        process sentinel 을 기다려 종료된 process 는 바로 재시작 (연속 종료시 backoff),
+        heartbeat 가 멈춘 process 는 종료 후 재시작
+        """
+        sentinels = {info['proc'].sentinel: _name for _name, info in self.process_list.items() if info['proc'] is not None}
+        for sentinel in connection.wait(list(sentinels), self.next_wait()):
+            self.exited(sentinels[sentinel], time())
+
+        _now = time()
+        for _name, info in self.process_list.items():
+            if info['proc'] is None:
+                continue
+            last = info['heartbeat'].last
+            if _now > (last + SupervisorConfig.HANG_SEC if last else info['started_at'] + SupervisorConfig.STARTUP_SEC):
+                log.warning('PROCESS_HUNG', target=_name, heartbeat_age=round(_now - (last or info['started_at']), 1))
+                self.metrics.inc('watcher_process_hangs_total', target=_name)
+                self.stop(_name)
+                self.exited(_name, last or info['started_at'])
+            else:
+                self.metrics.set('watcher_process_heartbeat_age_seconds', round(_now - last, 3) if last else -1, target=_name)
+
+        for _name, info in self.process_list.items():
+            if info['proc'] is None and info['restart_at'] <= time():
+                self.start(_name)
+
+    def next_wait(self):
+        """
+        다음 재시작 / heartbeat 확인까지 대기 시간
+        """
+        wait = SupervisorConfig.MAX_WAIT_SEC
+        for info in self.process_list.values():
+            if info['restart_at'] is not None:
+                wait = min(wait, info['restart_at'] - time())
+        return max(wait, 0)
+
+    def exited(self, _name, down_since):
+        """
+        종료된 process 정리 후 재시작 시간 결정
+        :param down_since: 동작을 멈춘 시간 (종료 시간 / 마지막 heartbeat)
+        """
+        info = self.process_list[_name]
+        info['proc'].join()
+        log.warning('PROCESS_TERMINATE', target=_name, exitcode=info['proc'].exitcode)
+        _now = time()
+        if _now - info['started_at'] >= SupervisorConfig.BACKOFF_RESET_SEC:
+            info['failures'] = 0
+        info['failures'] += 1
+        delay = 0 if info['failures'] == 1 else \
+            min(SupervisorConfig.BACKOFF_MIN * 2 ** (info['failures'] - 2), SupervisorConfig.BACKOFF_MAX)
+        info['proc'] = None
+        info['down_since'] = down_since
+        info['restart_at'] = _now + delay
+        self.metrics.set('watcher_process_failures', info['failures'], target=_name)
+        self.metrics.set('watcher_process_backoff_seconds', delay, target=_name)
+        if delay:
+            log.warning('PROCESS_BACKOFF', target=_name, delay=delay)
+
+    def stop(self, _name):
+        proc = self.process_list[_name]['proc']
+        proc.terminate()
+        proc.join(SupervisorConfig.TERMINATE_SEC)
+        if proc.is_alive():
+            proc.kill()
+
+    def collect_metrics(self):
+        """
+        각 process 의 metrics snapshot 을 모아 WatchDog endpoint 에서 한번에 제공
+        """
+        snapshots = []
+        for _name in list(self.process_list.keys()):
+            res = fetch_snapshot(MetricsConfig.HOST, metrics_port(_name))
+            self.metrics.set('watcher_process_up', 1 if res else 0, target=_name)
+            snapshots.extend(res or [])
+        return [self.metrics.snapshot()] + snapshots
 
 
 class GetPriceProc(BaseDb, MessageHandle):
     """
-    신규 price를 받아 price_queue에 전달
+    신규 price를 받아 symbol 을 담당하는 PriceWatcher shard 의 price_queue에 전달
+    batch mode 에서는 여러 tick 을 한번에 가져와 symbol 별로 병합 후 전달하고,
+    queue 가 가득 차면 다음 tick 과 계속 병합하여 memory 를 symbol 수로 제한
     """
     def __init__(self):
         super().__init__()
-        self.price_queue = None
+        self.price_queues = []
+        self.conflators = []
+        self.shard_map = {}
+        self.stats = {'ticks': 0, 'batches': 0, 'queue_full': 0, 'ring_dropped': 0}
+        self.stats_at = 0
+        self.metrics = Metrics('get_price')
+        self.heartbeat = Heartbeat()
+        self.tape = None
+        self.tape_flushed_at = 0
 
-    def run(self, price_q):
-        self.price_queue = price_q
+    def run(self, *price_qs):
+        serve_metrics(self.metrics)
+        if TapeConfig.RECORD_PATH:
+            self.tape = TickTapeWriter(TapeConfig.RECORD_PATH, TapeConfig.MAX_SYMBOLS)
+            atexit.register(self.tape.close)
+        self.price_queues = list(price_qs)
+        self.conflators = [TickConflator() for _ in self.price_queues]
         while True:
-            self.get_price()
+            self.heartbeat.beat()
+            if isinstance(self.price_queues[0], TickRing):
+                self.get_price_ring()
+            elif TickBatchConfig.ENABLED:
+                self.get_price_batch()
+            else:
+                self.get_price()
+
+    def shard(self, _symbol):
+        """
+        symbol 을 담당하는 shard 번호
+        """
+        shard = self.shard_map.get(_symbol)
+        if shard is None:
+            shard = self.shard_map[_symbol] = symbol_shard(_symbol, len(self.price_queues))
+        return shard
 
     @except_console
     def get_price(self):
-        price = self.db_get_price()
-        self.price_queue.put_nowait(price)
+        price = self.db_get_price(TickBatchConfig.POP_TIMEOUT)
+        if not price:
+            return
+        tick = json.loads(price)
+        _symbol = str(tick['symbol'])
+        self.metrics.inc('watcher_ticks_total', symbol=_symbol)
+        self.record(_symbol, float(tick['price']), time())
+        shard = self.shard(_symbol) if len(self.price_queues) > 1 else 0
+        self.price_queues[shard].put_nowait(price)
+
+    @except_console
+    def get_price_batch(self):
+        rows = self.db_get_price_batch(TickBatchConfig.BATCH_SIZE, TickBatchConfig.POP_TIMEOUT)
+        _now = time()
+        for row in rows or []:
+            tick = json.loads(row)
+            _symbol = str(tick['symbol'])
+            self.metrics.inc('watcher_ticks_total', symbol=_symbol)
+            self.record(_symbol, float(tick['price']), _now)
+            self.conflators[self.shard(_symbol)].add(_symbol, float(tick['price']), _now)
+        self.stats['ticks'] += len(rows or [])
+
+        for price_queue, conflator in zip(self.price_queues, self.conflators):
+            if conflator.pending:
+                try:
+                    price_queue.put_nowait(conflator.pending)
+                    conflator.take()
+                    self.stats['batches'] += 1
+                except Full:
+                    self.stats['queue_full'] += 1
+
+        self.set_stats(_now)
+
+    @except_console
+    def get_price_ring(self):
+        """
+        tick 을 ring buffer 에 binary record 로 기록, buffer 가 가득 차면 symbol 별로 병합해 두었다가
+        공간이 생기면 high, low, last 3건으로 기록
+        """
+        rows = self.db_get_price_batch(TickBatchConfig.BATCH_SIZE, TickBatchConfig.POP_TIMEOUT)
+        _now = time()
+        for shard in range(len(self.price_queues)):
+            self.flush_ring(shard)
+        for row in rows or []:
+            tick = json.loads(row)
+            _symbol, price = str(tick['symbol']), float(tick['price'])
+            self.metrics.inc('watcher_ticks_total', symbol=_symbol)
+            self.record(_symbol, price, _now)
+            shard = self.shard(_symbol)
+            if self.price_queues[shard].symbol_id(_symbol) is None:
+                self.ring_dropped(shard, _symbol)
+                continue
+            if self.conflators[shard].pending or not self.price_queues[shard].put(_symbol, price, _now):
+                self.conflators[shard].add(_symbol, price, _now)
+        self.stats['ticks'] += len(rows or [])
+        for shard, conflator in enumerate(self.conflators):
+            if conflator.pending:
+                self.stats['queue_full'] += 1
+                self.flush_ring(shard)
+        self.set_stats(_now)
+
+    def flush_ring(self, shard):
+        ring, conflator = self.price_queues[shard], self.conflators[shard]
+        if not conflator.pending or ring.free() < len(conflator) * 3:
+            return
+        for _symbol, (last, high, low, ts, count) in conflator.take().items():
+            # 공간은 확인했으므로 실패는 symbol table 이 가득 찬 경우, 병합된 tick 수는 last record 에 기록
+            if not (ring.put(_symbol, high, ts, 0) and ring.put(_symbol, low, ts, 0) and ring.put(_symbol, last, ts, count)):
+                self.ring_dropped(shard, _symbol)
+        self.stats['batches'] += 1
+
+    def ring_dropped(self, shard, _symbol):
+        """
+        ring 의 symbol table 에 넣지 못해 전달하지 못한 tick 기록
+        (table 이 RingBufferConfig.MAX_SYMBOLS 로 가득 찼거나 symbol 이름이 ring 의 SYMBOL 크기보다 김)
+        """
+        self.stats['ring_dropped'] += 1
+        self.metrics.inc('watcher_ring_dropped_total', shard=shard)
+        if len(_symbol.encode()) > RING_SYMBOL.size:
+            log.error('RING_SYMBOL_TOO_LONG', _key=_symbol, shard=shard, symbol=_symbol, max_bytes=RING_SYMBOL.size)
+            return
+        log.error('RING_SYMBOL_TABLE_FULL', _key=shard, shard=shard, symbol=_symbol,
+                  max_symbols=self.price_queues[shard].max_symbols)
+
+    def record(self, _symbol, price, ts):
+        """
+        TapeConfig.RECORD_PATH 가 지정되면 수신 tick 을 tape 에 기록
+        """
+        if self.tape is None:
+            return
+        if not self.tape.write(_symbol, price, ts):
+            self.metrics.inc('watcher_tape_dropped_total')
+            log.error('TAPE_SYMBOL_TABLE_FULL', symbol=_symbol, max_symbols=self.tape.max_symbols)
+        if ts - self.tape_flushed_at > TapeConfig.FLUSH_SEC:
+            self.tape_flushed_at = ts
+            self.tape.flush()
+
+    def set_stats(self, _now, p=None):
+        if _now - self.stats_at > TickBatchConfig.STATS_SEC:
+            self.stats_at = _now
+            stats = {'producer_ticks': self.stats['ticks'], 'producer_batches': self.stats['batches'],
+                     'queue_full': self.stats['queue_full'], 'ring_dropped': self.stats['ring_dropped']}
+            for shard, price_queue in enumerate(self.price_queues):
+                stats['pending_symbols_{}'.format(shard)] = len(self.conflators[shard])
+                stats['queue_depth_{}'.format(shard)] = price_queue.qsize()
+                self.metrics.set('watcher_price_queue_depth', stats['queue_depth_{}'.format(shard)], shard=shard)
+                self.metrics.set('watcher_pending_symbols', stats['pending_symbols_{}'.format(shard)], shard=shard)
+            self.metrics.set('watcher_queue_full', self.stats['queue_full'])
+            self.db_set_stats(WatcherKeys.INGEST_STATS, stats, p=p)
+
+
+def symbol_shard(_symbol, workers):
+    """
+    symbol 을 담당하는 PriceWatcher shard 번호, process 가 재시작 되어도 같은 값이 나오도록 crc32 사용
+    """
+    return zlib.crc32(_symbol.encode()) % workers
+
+
+def decode_orders(chunk):
+    """
+    warm start 용 주문정보 decode (Pool worker 에서 실행)
+    :param chunk: {id: order(json)}
+    :return: [(id, dict(order) / None), ...]
+    """
+    res = []
+    for _id, order in chunk.items():
+        try:
+            res.append((_id, json.loads(order)))
+        except ValueError:
+            log.warning('WARM_START_DECODE_ERROR', id=_id)
+            res.append((_id, None))
+    return res
 
 
 class NewOrderProc(BaseDb):
     """
     new 또는 change order 가 발생하면 해당주문정보를 watcher에 등록
+    시작시 MTS_ORDER_LIST 의 trigger 를 재등록하는 동안에도 신규 주문을 받으며,
+    재등록 중 신규 주문으로 처리된 id 는 재등록에서 제외
     """
     def __init__(self):
         BaseDb.__init__(self)
         self.ticksize = self.get_ticksize()
+        self.order_lock = Lock()
+        self.rebuilding = False
+        self.live_ids = set()  # 재등록 중 신규 주문으로 처리된 id
+        self.warm_stats = {}
+        self.metrics = Metrics('new_order_proc')
+        self.heartbeat = Heartbeat()
 
     @except_console
     def run(self):
@@ -88,18 +404,141 @@ class NewOrderProc(BaseDb):
         무한 loop를 통해 queue에 주문 id 수신대기
         :return:
         """
+        serve_metrics(self.metrics)
+        self.db_migrate_indicator_list()
+        if WarmStartConfig.ENABLED:
+            # 재등록 실패시 예외로 run 이 끝나 process 가 종료되고 WatchDog 이 재시작
+            intake = self.warm_start()
+            intake.join()
+            return
+
         all_list = self.db_order_list_getall()
         for _id, order in all_list.items():
+            self.heartbeat.beat()
             self.order_init(order)
+        self.intake()
 
+    def intake(self):
         while True:
+            self.heartbeat.beat()
             # 신규 주문 수신
             self.new_order_handle()
 
     @except_console
     def new_order_handle(self):
-        _id, order = self.db_get_order()
-        res = self.set_order(_id, order)
+        """
+        신규 주문을 최대 IntakeConfig.BATCH_SIZE 건 가져와 pipeline 한번으로 기록
+        """
+        orders = self.db_get_orders(IntakeConfig.BATCH_SIZE, IntakeConfig.POP_TIMEOUT)
+        if not orders:
+            return
+        started = time()
+        with self.order_lock:
+            if self.rebuilding:
+                self.live_ids.update(_id for _id, order in orders)
+            p = self.client.pipeline(transaction=False)
+            for _id, order in orders:
+                self.set_order(_id, order, p=p)
+            for res in p.execute(raise_on_error=False):
+                if isinstance(res, Exception):
+                    log.error('NEW_ORDER_ERROR', error=str(res))
+        self.metrics.inc('watcher_new_orders_total', len(orders))
+        self.metrics.observe('watcher_new_order_batch_seconds', time() - started)
+
+    def warm_start(self):
+        """
+        MTS_ORDER_LIST 를 hscan 으로 나누어 읽고, decode 는 Pool 에서, 기록은 chunk 별 pipeline 한번으로 처리
+        재등록 중에도 신규 주문 수신 thread 를 실행
+        재등록이 중간에 실패하면 빠진 trigger 가 남으므로 WARM_START_DONE 을 기록하지 않고 예외를 다시 발생
+        :return: 신규 주문 수신 thread
+        """
+        workers = WarmStartConfig.DECODE_WORKERS
+        # thread 시작 전에 fork, worker 는 부모의 writer thread 가 없으므로 자신의 logging 을 다시 설정
+        pool = Pool(workers, initializer=setup_logging) if workers else None
+        self.rebuilding = True
+        intake = Thread(target=self.intake, daemon=True)
+        intake.start()
+
+        started = time()
+        self.warm_stats = {'orders': 0, 'skipped': 0, 'expired': 0, 'elapsed': 0, 'done': 0}
+        progress_at = started
+        pending = deque()
+        try:
+            for chunk in self.db_scan_order_list(WarmStartConfig.SCAN_COUNT):
+                pending.append(pool.apply_async(decode_orders, (chunk,)) if pool else decode_orders(chunk))
+                # decode 결과를 worker 수의 2배까지만 쌓아 memory 를 chunk 단위로 제한
+                while len(pending) > workers * 2:
+                    orders = pending.popleft()
+                    self.rebuild_orders(orders.get() if pool else orders)
+                if time() - progress_at > WarmStartConfig.PROGRESS_SEC:
+                    progress_at = time()
+                    self.warm_progress(started)
+            while pending:
+                orders = pending.popleft()
+                self.rebuild_orders(orders.get() if pool else orders)
+        except Exception as e:
+            log.error('WARM_START_ERROR', error=str(e), **self.warm_stats)
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            with self.order_lock:
+                self.rebuilding = False
+                self.live_ids = set()
+
+        self.warm_stats['done'] = 1
+        self.warm_progress(started)
+        log.info('WARM_START_DONE', orders=self.warm_stats['orders'], elapsed=round(self.warm_stats['elapsed'], 2))
+        return intake
+
+    def warm_progress(self, started, p=None):
+        self.warm_stats['elapsed'] = round(time() - started, 3)
+        for _key, value in self.warm_stats.items():
+            self.metrics.set('watcher_warm_start_{}'.format(_key), value)
+        log.info('WARM_START', **self.warm_stats)
+        self.db_set_stats(WatcherKeys.WARM_START_STATS, self.warm_stats, p=p)
+
+    def rebuild_orders(self, orders):
+        """
+        decode 된 chunk 의 trigger 를 pipeline 한번으로 재등록, 실패는 warm_start 로 전달
+        :param orders: [(id, dict(order) / None), ...]
+        """
+        with self.order_lock:
+            orders = [(_id, order_info) for _id, order_info in orders if order_info is not None]
+            # 신규 주문으로 이미 처리된 주문, scan 이후 fire/삭제된 주문 제외
+            exists = self.db_exists_orders([_id for _id, order_info in orders]) or []
+            targets = [order_info for (_id, order_info), exist in zip(orders, exists) if exist and _id not in self.live_ids]
+            self.warm_stats['skipped'] += len(orders) - len(targets)
+
+            p = self.client.pipeline(transaction=False)
+            expired = self.write_rebuild(targets, p)
+            p.execute()
+            if expired:
+                self.db_post_orders(expired, once=False)
+
+    def write_rebuild(self, targets, p):
+        """
+        재등록할 주문을 pipeline 에 기록, 종료 시간이 지난 trendline 은 기록하지 않고 반환
+        :param targets: [dict(order), ...]
+        :return: [(id, symbol, 'END'), ...]
+        """
+        _now = get_unixtime()
+        expired = []
+        for order_info in targets:
+            start_waiting_time = None
+            if order_info['planType'] == 'trendLine' and order_info['indicatorType'] == 'OPEN':
+                if _now > order_info['endDate']:
+                    expired.append((order_info['id'], order_info['symbol'], 'END'))
+                    continue
+                if int(order_info['startDate']) < _now:
+                    self.db_activate_trendline(order_info, p=p)
+                else:
+                    start_waiting_time = int(order_info['startDate'])
+            self.db_set_order(order_info, start_waiting_time, p=p)
+        self.warm_stats['orders'] += len(targets) - len(expired)
+        self.warm_stats['expired'] += len(expired)
+        return expired
 
     @except_console
     def order_init(self, order):
@@ -110,59 +549,60 @@ class NewOrderProc(BaseDb):
         res = self.db_set_order(order_info)
 
     @except_console
-    def set_order(self, _id, order):
+    def set_order(self, _id, order, p=None):
         """
         new order가 들어오면 초기 실행
         :param _id:  '2as12-3asdfasdf-3-asdf-asdfaf'
         :param order: dict(order_detail 정보)
+        :param p: pipeline, 주어지면 execute 는 호출측에서 함
         :return: True / None
         """
-        if DEBUG: print(str(datetime.now()), 'SET_ORDER: {}'.format(str(order)))
+        log.debug('SET_ORDER', order=order)
 
         if order['active'] not in Mapping.active_code:
             # active 가 아니면 remove
-            if DEBUG: print(str(datetime.now()), 'IS_ACTIVE_FALSE: {}'.format(str(order)))
-            self.remove_order(_id, order)
+            log.debug('IS_ACTIVE_FALSE', order=order)
+            self.remove_order(_id, order, p=p)
             return None
 
         if order['planType'] in ['reserved', 'horizontal', 'trendLine']:
             if order['status'] in ['WAITING', 'PENDING']:
                 if order['indicatorType'] == 'TRAIL':
-                    self.set_trail(_id, order)
+                    self.set_trail(_id, order, p=p)
                 else:
                     if order['planType'] == 'trendLine':
                         if order['indicatorType'] == 'OPEN':
-                            self.set_trendline(_id, order)
+                            self.set_trendline(_id, order, p=p)
                         else:
-                            self.set_reserved(_id, order)
+                            self.set_reserved(_id, order, p=p)
                     else:
-                        self.set_reserved(_id, order)
+                        self.set_reserved(_id, order, p=p)
 
         elif order['planType'] == 'strategy':
             if (order['status'] in ['WAITING', 'PENDING']) and (order['indicatorType'] in ['OPEN', 'TAKE', 'LOSS']):
-                self.set_strategy(_id, order)
+                self.set_strategy(_id, order, p=p)
             else:
-                print('Unknown Type', order['planType'], order['status'])
+                log.warning('UNKNOWN_TYPE', plan_type=order['planType'], status=order['status'])
         else:
-            print('Unknown Type', order['planType'], order['status'])
+            log.warning('UNKNOWN_TYPE', plan_type=order['planType'], status=order['status'])
         return True
 
     @except_console
-    def remove_order(self, _id, order):
+    def remove_order(self, _id, order, p=None):
         if order['planType'] == 'strategy':
             order_info = self.db_get_order_info(_id)
             if order_info:
                 if 'candleSize' in order_info['indicators'][0]:
                     _symbol_kline = '{}_{}'.format(order_info['symbol'], order_info['indicators'][0]['candleSize'])
-                    res = self.set_indicator_order(_symbol_kline, _id, remove=True)
+                    res = self.set_indicator_order(_symbol_kline, _id, remove=True, p=p)
 
-        self.rm_order( _id, order['symbol'], order['indicators'])
+        self.db_remove_orders([(_id, order['symbol'], None, order['indicators'])], p=p)
 
     @except_console
-    def set_trail(self, _id, order):
+    def set_trail(self, _id, order, p=None):
         order_info = {}
         order_info['indicator'] = order['planType']
-        if DEBUG: print(str(datetime.now()), 'SET_TRAIL: {}'.format(str(order)))
+        log.debug('SET_TRAIL', order=order)
         for i in Mapping.item_root:
             order_info[i] = order[i]
         order_info['direction'] = -1 if order_info['side'] == 'BUY' else 1
@@ -170,19 +610,19 @@ class NewOrderProc(BaseDb):
         if order['status'] == 'WAITING':
             order_info['price'] = indicator['triggerPrice']
         elif order['status'] == 'PENDING':
-            print('Trailing status is pending', order)
+            log.warning('TRAIL_PENDING', id=_id)
             return
         else:
-            print('Unknown status', order)
+            log.warning('UNKNOWN_STATUS', _key=order['status'], id=_id, status=order['status'])
             return
-        res = self.db_set_order(order_info)
+        res = self.db_set_order(order_info, p=p)
         return res
 
     @except_console
-    def set_reserved(self, _id, order):
+    def set_reserved(self, _id, order, p=None):
         order_info = {}
         order_info['indicator'] = order['planType']
-        if DEBUG: print(str(datetime.now()), 'SET_RESERVED: {}'.format(str(order)))
+        log.debug('SET_RESERVED', order=order)
         for i in Mapping.item_root:
             order_info[i] = order[i]
         direction = 1 if order_info['side'] == 'BUY' else -1
@@ -201,53 +641,41 @@ class NewOrderProc(BaseDb):
             order_info['price'] = indicator['cancelPrice']  # PENDING
             order_info['direction'] = direction * -1
         else:
-            print('Unknown status', order)
+            log.warning('UNKNOWN_STATUS', _key=order['status'], id=_id, status=order['status'])
             return
 
-        res = self.db_set_order(order_info)
+        res = self.db_set_order(order_info, p=p)
         return res
 
     @except_console
-    def set_trendline_queue(self, order_info):
+    def set_trendline_queue(self, order_info, p=None):
         start_waiting_time = None
-        if DEBUG: print(str(datetime.now()), 'SET_TRENDLINE: {}'.format(str(order_info)))
+        log.debug('SET_TRENDLINE', order=order_info)
         if order_info['indicator'] == 'trendLine':
             _now = get_unixtime()
-            print('SETQ_func', order_info)
-
-            if order_info['indicatorType'] == 'TRAIL':
-                action = 'CLOSE'
-            else:
-                action = 'TRIGGER_CANCEL' if order_info['status'] == 'PENDING' else 'OPEN'
-            _key = '{}={}'.format(order_info['id'], action)
+            log.debug('SETQ_FUNC', order=order_info)
 
             if _now > order_info['endDate']:
-                print('now:', _now, order_info['endDate'])
-                self.db_post_order(order_info, 'END')
+                log.info('TRENDLINE_EXPIRED', id=order_info['id'], now=_now, end_date=order_info['endDate'])
+                self.db_post_order(order_info, 'END', p=p)
                 return None
 
             if int(order_info['startDate']) < _now:
-
-                _tmp_queue = {i: order_info[i] for i in Mapping.item_indicators['trendLine']}
-                _tmp_queue['symbol'] = order_info['symbol']
-                _tmp_queue['currentPrice'] = 0
-                _tmp_queue['direction'] = order_info['direction']
-                self.db_set_line_queue(_key, _tmp_queue)
-
+                self.db_activate_trendline(order_info, p=p)
             else:
                 start_waiting_time = int(order_info['startDate'])
 
         return start_waiting_time
 
     @except_console
-    def set_trendline(self, _id, order):
+    def set_trendline(self, _id, order, p=None):
         if (order['status'] == 'PENDING') and (order['tradeType'] == 'Market'):
             return
 
         order_info = {}
         order_info['indicator'] = order['planType']
         order_info['symbol'] = order['symbol']
-        if DEBUG: print(str(datetime.now()), 'SET_TRENDLINE: {}'.format(str(order)))
+        log.debug('SET_TRENDLINE', order=order)
 
         for i in Mapping.item_root:
             order_info[i] = order[i]
@@ -259,14 +687,14 @@ class NewOrderProc(BaseDb):
             elif 'Price' in i:
                 order_info[i] = float(indicator[i])
 
-        print('SET_Q:', order_info)
-        start_waiting_time = self.set_trendline_queue(order_info)
+        log.debug('SET_Q', order=order_info)
+        start_waiting_time = self.set_trendline_queue(order_info, p=p)
 
-        self.db_set_order(order_info, start_waiting_time)
+        self.db_set_order(order_info, start_waiting_time, p=p)
         return
 
     @except_console
-    def set_strategy(self, _id, order):
+    def set_strategy(self, _id, order, p=None):
 
         order_info = {i: order[i] for i in Mapping.item_root}
         order_info['direction'] = 1 if order_info['side'] == 'BUY' else -1
@@ -284,112 +712,751 @@ class NewOrderProc(BaseDb):
             elif order['status'] == 'PENDING':
                 order_info['price'] = indicator['cancelPrice']  # PENDING
                 order_info['direction'] = direction * -1
-        print('set_indicator')
-        res = self.db_set_order(order_info)
+        log.debug('SET_INDICATOR', id=_id)
+        res = self.db_set_order(order_info, p=p)
         return res
 
 
 class TimeWatcher(BaseDb):
     """
     trendline 주문의 start, endtime 모니터링
+    START_TIME_MON, END_TIME_MON 의 가장 빠른 deadline 을 heap 으로 유지하고 다음 deadline 까지 대기,
+    더 빠른 deadline 을 가진 주문이 등록되면 change feed 로 즉시 깨어남
     """
     def __init__(self):
         super().__init__()
+        self.deadlines = {'start': DeadlineHeap(), 'end': DeadlineHeap()}
+        self.horizon = {'start': float('inf'), 'end': float('inf')}  # window 밖 deadline 의 최소값
+        self.time_feed = None
+        self.reconciled_at = 0
+        self.metrics = Metrics('time_proc')
+        self.heartbeat = Heartbeat()
 
     def run(self):
+        serve_metrics(self.metrics)
+        self.time_feed = ChangeFeed(self.client, WatcherKeys.TIME_CHANNEL)
+        self.time_feed.subscribe()
         while True:
+            self.heartbeat.beat()
             self.set_price()
-            sleep(10)
+
+    def next_deadline(self):
+        due = [i for name in self.deadlines for i in (self.deadlines[name].peek(), self.horizon[name]) if i is not None]
+        return min(due) if due else float('inf')
+
+    @except_console
+    def sync_deadlines(self, timeout=0):
+        ops = self.time_feed.drain(TimeConfig.FEED_DRAIN_LIMIT, timeout)
+        if self.time_feed.stale or (time() - self.reconciled_at > TimeConfig.RECONCILE_SEC):
+            self.reconcile()
+        self.apply_ops(ops)
+
+    def apply_ops(self, ops):
+        for op in ops:
+            if op[0] == 'a':
+                if op[3] <= self.horizon[op[1]]:
+                    self.deadlines[op[1]].push(op[2], op[3])
+            elif op[0] == 'r':
+                for heap in self.deadlines.values():
+                    heap.discard(op[1])
+
+    def reconcile(self, names=('start', 'end')):
+        """
+        zset 의 가장 빠른 WINDOW 건을 다시 읽어 heap 구성
+        """
+        for name in names:
+            rows = self.db_get_time_window(name, TimeConfig.WINDOW)
+            if rows is not False:
+                self.load_window(name, rows)
+        self.time_feed.stale = False
+        self.reconciled_at = time()
+
+    def load_window(self, name, rows):
+        """
+        :param rows: [(id, deadline), ...] zset 의 가장 빠른 WINDOW 건
+        """
+        heap = self.deadlines[name]
+        heap.clear()
+        for _id, deadline in rows:
+            heap.push(_id, deadline)
+        self.horizon[name] = rows[-1][1] if len(rows) >= TimeConfig.WINDOW else float('inf')
+
+    def passed_windows(self, _now):
+        """
+        :return: window 를 모두 처리하여 다음 window 를 조회해야 하는 이름 목록
+        """
+        names = []
+        for name in self.deadlines:
+            if (self.horizon[name] <= _now) or (not self.deadlines[name] and self.horizon[name] != float('inf')):
+                names.append(name)
+            self.metrics.set('watcher_time_deadlines', len(self.deadlines[name]), name=name)
+        return names
 
     @except_console
     def set_price(self):
-        _now = get_unixtime()
-        end_res, end_ids = self.db_end_time_check(_now)
-        start_res, start_ids = self.db_start_time_check(_now)
-        if end_res:
-            print(str(datetime.now()), 'END_TIME:', end_ids)
-        if start_res:
-            print(_now, 'START_TIME:', start_ids, start_res)
+        wait = (self.next_deadline() - get_unixtime_ms()) / 1000
+        self.sync_deadlines(min(max(wait, 0), TimeConfig.MAX_WAIT_SEC))
+
+        _now = get_unixtime_ms()
+        if self.deadlines['end'].pop_due(_now):
+            end_res, end_ids = self.db_end_time_check(_now)
+            if end_res:
+                log.info('END_TIME', ids=end_ids)
+                self.metrics.inc('watcher_time_processed_total', len(end_res), name='end')
+        if self.deadlines['start'].pop_due(_now):
+            start_res, start_ids = self.db_start_time_check(_now)
+            if start_res:
+                log.info('START_TIME', ids=start_ids)
+                self.metrics.inc('watcher_time_processed_total', len(start_res), name='start')
+        names = self.passed_windows(_now)
+        if names:
+            self.reconcile(names)
 
 
 class PriceWatcher(BaseDb):
     """
     price_queue를 통해 들어오는 price를 기준으로 주문 check
+    WATCHER_LIST 를 local trigger book 으로 유지하고, best trigger 를 넘는 tick 만 redis 에서 scan
+    shard 별로 process 가 따로 실행되며 배정된 symbol 의 before_price, trigger book 만 가짐
+    같은 tick 으로 indicator 구독 symbol_kline 의 candle 을 집계해 마감된 candle 을 IndicatorWatcher 에 전달
+    TRAIL 주문은 TrailBook 에서 stop 을 옮기며 직접 판단하고, 움직인 stop 은 주기적으로 모아 redis 에 기록
     """
-    def __init__(self):
+    def __init__(self, shard=0, workers=1):
         super().__init__()
+        self.shard = shard
+        self.workers = workers
         self.before_price = {}
         self.price_q = None
-        self.cnt = 0
+        self.book = TriggerBook()
+        self.trails = TrailBook()
+        self.trails_flushed_at = 0
+        self.book_feed = None
+        self.book_synced_at = 0
+        self.stats = {'batches': 0, 'symbols': 0, 'lag': 0}
+        self.stats_at = 0
+        self.idle_sleep = RingBufferConfig.IDLE_SLEEP
+        self.metrics = Metrics('price_watcher_{}'.format(shard))
+        self.heartbeat = Heartbeat()
+        self.candles = None
+        self.indicator_watcher = None
+        self.candles_synced_at = 0
+        self.candles_checked_at = 0
 
     def run(self, price_q):
+        serve_metrics(self.metrics)
         self.price_q = price_q
+        self.start_candles()
+        self.book_feed = ChangeFeed(self.client, WatcherKeys.BOOK_CHANNEL)
+        self.book_feed.subscribe()
         while True:
-            self.scan_order()
+            self.heartbeat.beat()
+            if isinstance(self.price_q, TickRing):
+                self.scan_ring()
+            else:
+                self.scan_order()
+
+    @except_console
+    def sync_book(self):
+        """
+        change feed 를 trigger book 에 반영, feed 연결이 끊겼거나 주기가 지나면 load 된 symbol 전체 재조회
+        """
+        ops = self.book_feed.drain(PriceBookConfig.FEED_DRAIN_LIMIT)
+        if self.book_feed.stale or (time() - self.book_synced_at > PriceBookConfig.RESYNC_SEC):
+            symbols = list(self.book.loaded)
+            # 기록하지 않은 stop 을 먼저 기록해야 다시 load 한 trailing 상태가 뒤로 가지 않음
+            self.flush_trails(limit=None)
+            self.book.clear()
+            self.trails.clear()
+            self.book_feed.stale = False
+            self.book_synced_at = time()
+            if symbols:
+                self.load_book(symbols)
+        for op in ops:
+            self.book.apply(op)
+            self.trails.apply(op)
+
+    @except_console
+    def load_book(self, symbols):
+        rows = self.db_get_watcher_book(symbols)
+        if rows is False:
+            return False
+        for (symbol, direction), items in rows.items():
+            self.book.load(symbol, direction, items)
+        return self.load_trails(symbols)
+
+    @except_console
+    def load_trails(self, symbols):
+        if not TrailConfig.ENABLED:
+            return True
+        rows = self.db_get_trails(symbols)
+        if rows is False:
+            return False
+        self.set_trails(symbols, rows)
+        return True
+
+    def set_trails(self, symbols, rows):
+        """
+        :param rows: db_get_trails 결과 {symbol: [(member, direction, triggerPrice, state), ...]}
+        """
+        for symbol in symbols:
+            self.trails.load(symbol, rows.get(symbol, []))
 
     @except_console
     def scan_order(self):
-        _row = self.price_q.get()
+        try:
+            _row = self.price_q.get(timeout=TickBatchConfig.POP_TIMEOUT)
+        except Empty:
+            return
+        if isinstance(_row, dict):
+            self.scan_batch(_row)
+            return
         current_price = json.loads(_row)
-        start = datetime.now()
         _symbol = str(current_price['symbol'])
         current_price['price'] = float(current_price['price'])
 
-        if DEBUG and (_symbol == 'BTC-USDT'):
-            self.cnt += 1
-            if self.cnt > 100:
-                print(_symbol, current_price['price'])
-                self.cnt = 0
+        self.sync_book()
+        self.update_trails([(_symbol, [current_price['price']] * 3 + [time(), 1])])
+        self.fire_many(self.check_price(_symbol, current_price['price']))
+        self.update_candles([(_symbol, current_price['price'], current_price['price'], current_price['price'], time(), 1)])
+        self.metrics.inc('watcher_scanned_symbols_total')
+        _now = time()
+        if _now - self.stats_at > TickBatchConfig.STATS_SEC:
+            self.stats_at = _now
+            self.set_book_metrics()
+
+    def scan_batch(self, batch):
+        """
+        병합된 batch 처리, queue 에 쌓인 batch 가 있으면 모두 꺼내 한번 더 병합
+        :param batch: {symbol: [last, high, low, ts, count]}
+        """
+        merged = TickConflator()
+        merged.merge(batch)
+        while True:
+            try:
+                merged.merge(self.price_q.get_nowait())
+            except Empty:
+                break
+        self.scan_merged(merged)
+        self.update_candles((_symbol, last, high, low, ts, count)
+                            for _symbol, (last, high, low, ts, count) in merged.pending.items())
+
+    @except_console
+    def scan_ring(self):
+        rows = self.price_q.get_many(RingBufferConfig.READ_LIMIT)
+        if not rows:
+            sleep(self.idle_sleep)
+            self.idle_sleep = min(self.idle_sleep * 2, RingBufferConfig.IDLE_SLEEP_MAX)
+            return
+        self.idle_sleep = RingBufferConfig.IDLE_SLEEP
+        merged = TickConflator()
+        for _symbol, price, ts, count in rows:
+            merged.add(_symbol, price, ts, count)
+        self.scan_merged(merged)
+        # candle 은 병합 전 tick 으로 집계 (시가, tick 수)
+        self.update_candles((_symbol, price, price, price, ts, count) for _symbol, price, ts, count in rows)
+
+    def scan_merged(self, merged):
+        _now = time()
+        self.sync_book()
+        self.update_trails(merged.pending.items())
+        requests = []
+        for _symbol, (last, high, low, ts, count) in merged.pending.items():
+            requests.extend(self.check_price(_symbol, last, high, low) or [])
+            self.stats['lag'] = max(self.stats['lag'], _now - ts)
+        decided = time()
+        for last, high, low, ts, count in merged.pending.values():
+            # GetPriceProc 수신 시간부터 trigger 판단까지
+            self.metrics.observe('watcher_tick_to_decision_seconds', decided - ts)
+        self.fire_many(requests, decided)
+        self.stats['batches'] += 1
+        self.stats['symbols'] += len(merged)
+        self.metrics.inc('watcher_scanned_symbols_total', len(merged))
+
+        if _now - self.stats_at > TickBatchConfig.STATS_SEC:
+            self.stats_at = _now
+            self.set_book_metrics()
+            self.db_set_stats(WatcherKeys.INGEST_STATS, {
+                'consumer_batches_{}'.format(self.shard): self.stats['batches'],
+                'consumer_symbols_{}'.format(self.shard): self.stats['symbols'],
+                'max_lag_ms_{}'.format(self.shard): int(self.stats['lag'] * 1000),
+                'queue_depth_{}'.format(self.shard): self.price_q.qsize()})
+            self.stats['lag'] = 0
+
+    @except_console
+    def update_trails(self, items):
+        """
+        trailing stop 을 옮기고 trigger 된 TRAIL 주문을 POST_ORDER 에 등록, 주기가 지나면 움직인 stop 기록
+        :param items: [(symbol, [last, high, low, ts, count]), ...]
+        """
+        if not self.trails:
+            return
+        orders, sides = self.trail_orders(items)
+        if orders:
+            self.trail_posted(sides, self.db_post_orders(orders))
+        if time() - self.trails_flushed_at > TrailConfig.FLUSH_SEC:
+            self.flush_trails()
+
+    def trail_orders(self, items):
+        """
+        :return: (trigger 된 TRAIL 주문 [(id, symbol, action), ...], [(symbol, direction, member), ...])
+        """
+        orders, sides = [], []
+        for _symbol, (last, high, low, ts, count) in items:
+            if _symbol in self.trails.loaded:
+                for member, direction in self.trails.update(_symbol, last, high, low):
+                    _id, _, action = member.partition('=')
+                    orders.append((_id, _symbol, action))
+                    sides.append((_symbol, direction, member))
+        return orders, sides
+
+    def trail_posted(self, sides, res):
+        # 다른 경로에서 먼저 처리된 주문도 book 에서 제거
+        for _symbol, direction, member in sides:
+            self.book.remove(_symbol, direction, member)
+        self.metrics.inc('watcher_trail_fired_total', len(res or []))
+
+    @except_console
+    def flush_trails(self, limit=TrailConfig.MAX_WRITES):
+        """
+        움직인 stop 을 redis 와 local trigger book 에 기록
+        :param limit: 최대 주문 수, None 이면 전체
+        """
+        writes = self.trail_writes(limit)
+        if writes:
+            self.trail_written(writes, self.db_set_trail_stops(writes))
+
+    def trail_writes(self, limit):
+        """
+        :return: TrailBook.flush 결과, redis 에 기록할 stop
+        """
+        self.trails_flushed_at = time()
+        return self.trails.flush(limit or len(self.trails) or 1)
+
+    def trail_written(self, writes, updated):
+        for (_symbol, direction), rows in writes.items():
+            for member, stop, state in rows:
+                self.book.add(_symbol, direction, member, stop)
+        self.metrics.inc('watcher_trail_writes_total', updated or 0)
+        self.metrics.set('watcher_trail_orders', len(self.trails))
+
+    def start_candles(self):
+        """
+        shard 별 candle 저장소를 열고 (파일이 있으면 이전 history 그대로 사용) IndicatorWatcher 연결
+        파일 없이 memory 에만 보관하면 재시작할때마다 indicator 주문이 history 없이 다시 시작하므로 PATH 는 필수
+        """
+        if not CandleConfig.ENABLED:
+            return
+        if not CandleConfig.PATH:
+            raise ValueError('CandleConfig.PATH is required when CandleConfig.ENABLED')
+        path = CandleConfig.PATH.format(self.shard)
+        store = CandleStore(path, CandleConfig.CAPACITY, CandleConfig.MAX_SERIES)
+        atexit.register(store.flush)
+        self.candles = CandleAggregator(store, CandleConfig.SIZE_UNIT_SEC, CandleConfig.FILL_GAPS)
+        self.indicator_watcher = IndicatorWatcher(store, self.metrics)
+        self.candles_synced_at = 0
+        log.info('CANDLE_STORE', path=path, series=len(store))
+
+    @except_console
+    def update_candles(self, ticks):
+        """
+        tick 을 candle 로 집계하고 마감된 candle 을 symbol_kline 별로 모아 IndicatorWatcher 에 전달
+        :param ticks: [(symbol, last, high, low, ts, tick 수), ...]
+        """
+        if self.candles is None:
+            return
+        if time() - self.candles_synced_at > CandleConfig.SUBSCRIPTION_SEC:
+            self.subscribe_candles(self.db_get_indicator_klines())
+        for _symbol_kline, candles in self.close_candles(ticks).items():
+            self.indicator_watcher.on_candles(_symbol_kline, candles)
+
+    def subscribe_candles(self, klines):
+        """
+        :param klines: db_get_indicator_klines 결과, 조회 실패 (False) 면 다음 차례에 다시 조회
+        """
+        if klines is False:
+            return
+        self.candles_synced_at = time()
+        # 이 shard 로 tick 이 오는 symbol 만 집계
+        klines = [k for k in klines if symbol_shard(k.rpartition('_')[0], self.workers) == self.shard]
+        skipped = self.candles.subscribe(klines)
+        if skipped:
+            log.warning('CANDLE_SKIPPED', klines=skipped[:10], count=len(skipped))
+        self.metrics.set('watcher_candle_series', len(self.candles.store))
+
+    def close_candles(self, ticks):
+        """
+        :return: {symbol_kline: [Candle, ...]} 마감된 candle (오래된 순)
+        """
+        _now = time()
+        closed = []
+        for _symbol, last, high, low, ts, count in ticks:
+            if self.candles.sizes.get(_symbol):
+                closed.extend(self.candles.update(_symbol, last, high, low, ts, count))
+        if _now - self.candles_checked_at > CandleConfig.CLOSE_CHECK_SEC:
+            self.candles_checked_at = _now
+            closed.extend(self.candles.close_due(_now))
+        by_kline = {}
+        for _symbol_kline, candle in closed:
+            by_kline.setdefault(_symbol_kline, []).append(candle)
+        if closed:
+            self.metrics.inc('watcher_candles_closed_total', len(closed))
+        return by_kline
+
+    @except_console
+    def check_price(self, _symbol, price, high=None, low=None):
+        """
+        before_price 대비 하락/상승 구간의 trigger scan
+        :param _symbol: 'BTC-USDT'
+        :param price: 마지막 가격
+        :param high: 이전 scan 이후 최고가 (batch mode)
+        :param low: 이전 scan 이후 최저가 (batch mode)
+        :return: [(symbol, direction, price), ...] fire 할 구간
+        """
+        requests = []
+        high = price if high is None else high
+        low = price if low is None else low
+        if _symbol not in self.book.loaded:
+            self.load_book([_symbol])
+
         if _symbol not in self.before_price:
-            self.before_price[_symbol] = current_price['price']
-        else:
-            if self.before_price[_symbol] > current_price['price']:
-                res = self.db_scan_decrease(current_price['symbol'], current_price['price'])
-                self.before_price[_symbol] = current_price['price']
-            elif self.before_price[_symbol] <= current_price['price']:
-                res = self.db_scan_increase(current_price['symbol'], current_price['price'])
-                self.before_price[_symbol] = current_price['price']
+            self.before_price[_symbol] = price
+            return requests
+        if self.before_price[_symbol] > low:
+            if (_symbol not in self.book.loaded) or self.book.crossed(_symbol, 1, low):
+                requests.append((_symbol, 1, low))
+        if self.before_price[_symbol] <= high:
+            if (_symbol not in self.book.loaded) or self.book.crossed(_symbol, -1, high):
+                requests.append((_symbol, -1, high))
+        self.before_price[_symbol] = price
+        return requests
+
+    @except_console
+    def fire_many(self, requests, decided=None):
+        """
+        check_price 에서 모은 구간을 한번에 fire (server side 면 pipeline 한번)
+        :param requests: [(symbol, direction, price), ...]
+        :param decided: trigger 판단 시간 (time()), POST_ORDER 기록까지의 latency 측정용
+        """
+        if not requests:
+            return
+        decided = time() if decided is None else decided
+        if not FireConfig.SERVER_SIDE:
+            # load 된 symbol 은 local book 의 record 로 바로 post, 아니면 redis scan
+            orders, sides, unloaded = self.crossing_orders(requests)
+            for _symbol, direction, price in unloaded:
+                if direction == 1:
+                    self.metrics.inc('watcher_fired_total', len(self.db_scan_decrease(_symbol, price) or []))
+                else:
+                    self.metrics.inc('watcher_fired_total', len(self.db_scan_increase(_symbol, price) or []))
+            fired = self.db_post_orders(orders) if orders else []
+            self.metrics.observe('watcher_decision_to_post_seconds', time() - decided)
+            self.posted(sides, fired or [])
+            return
+
+        res = self.db_fire_triggers_many(requests) or []
+        self.metrics.observe('watcher_decision_to_post_seconds', time() - decided)
+        self.fired(requests, res)
+
+    def crossing_orders(self, requests):
+        """
+        load 된 symbol 의 구간을 넘은 trigger 를 local book 의 record 로 모음
+        :return: (orders [(id, symbol, action), ...], sides {'id=action': (symbol, direction)}, load 되지 않은 requests)
+        """
+        orders, sides, unloaded = [], {}, []
+        for _symbol, direction, price in requests:
+            if _symbol not in self.book.loaded:
+                unloaded.append((_symbol, direction, price))
+                continue
+            for record in self.book.crossing(_symbol, direction, price):
+                orders.append((record.id, _symbol, record.action))
+                sides['{}={}'.format(record.id, record.action)] = (_symbol, direction)
+        return orders, sides, unloaded
+
+    def posted(self, sides, fired):
+        """
+        db_post_orders 로 등록된 trigger 를 local book 에서 삭제
+        """
+        for _key in fired:
+            self.book.remove(sides[_key][0], sides[_key][1], _key)
+        self.metrics.inc('watcher_fired_total', len(fired))
+
+    def fired(self, requests, res):
+        """
+        fire script 로 등록된 trigger 를 local book 에서 삭제
+        :param res: [['id=action', ...], ...] request 순서대로
+        """
+        for (_symbol, direction, price), fired in zip(requests, res):
+            self.metrics.inc('watcher_fired_total', len(fired))
+            for _key in fired:
+                self.book.remove(_symbol, direction, _key)
+
+    def set_book_metrics(self):
+        sizes = {1: 0, -1: 0}
+        for (_symbol, direction), side in self.book.sides.items():
+            sizes[direction] += len(side)
+        for direction, size in sizes.items():
+            self.metrics.set('watcher_trigger_book_size', size, direction=direction)
+        self.metrics.set('watcher_trigger_book_symbols', len(self.book.loaded))
+        if self.price_q is not None:
+            self.metrics.set('watcher_price_queue_depth', self.price_q.qsize())
 
 
 class LineWatcher(BaseDb, MessageHandle):
+    """
+    trendline 주문의 현재 trigger 가격을 계산하여 WATCHER_LIST score 갱신
+    trendline 은 TrendlineEngine 의 column array 로 유지하고, TRENDLINE_QUEUE 변경은 change feed 로 반영
+    (주기적으로 hscan 재동기화), 마지막으로 기록한 score 와 달라진 line 만 key 별 zadd 한번으로 기록
+    line 별로 반올림 가격이 다음 tick 으로 바뀌는 시간을 priority queue 에 넣고, 가장 빠른 시간까지만 대기
+    """
     def __init__(self, ):
         super().__init__()
-        self.orders_dict = None
         self.ticksize = self.get_ticksize()
-        self.set_score_list = None
+        self.engine = TrendlineEngine()
+        self.schedule = DeadlineHeap()
+        self.line_feed = None
+        self.reconciled_at = 0
+        self.metrics = Metrics('line_watcher')
+        self.heartbeat = Heartbeat()
 
     def run(self):
+        serve_metrics(self.metrics)
+        self.line_feed = ChangeFeed(self.client, WatcherKeys.LINE_CHANNEL)
+        self.line_feed.subscribe()
         while True:
-            self.set_score_list = {i: defaultdict(dict) for i in self.ticksize}
+            self.heartbeat.beat()
             self.price_update()
-            sleep(10)
+
+    @except_console
+    def sync_lines(self, timeout=0):
+        """
+        change feed 반영, 이벤트가 없으면 최대 timeout 초 대기
+        """
+        ops = self.line_feed.drain(LineConfig.FEED_DRAIN_LIMIT, timeout)
+        if self.line_feed.stale or (time() - self.reconciled_at > LineConfig.RECONCILE_SEC):
+            self.reconcile()
+        self.seed_last_price(self.apply_ops(ops))
+
+    def apply_ops(self, ops):
+        """
+        :return: last price 를 모르는 신규 line key 목록
+        """
+        added = []
+        for op in ops:
+            if op[0] == 'a':
+                if self.set_line(op[1], op[2]):
+                    added.append(op[1])
+            elif op[0] == 'r':
+                self.remove_line(op[1])
+        return added
+
+    def reconcile(self):
+        """
+        TRENDLINE_QUEUE 전체를 hscan 으로 읽어 local cache 와 맞춤
+        """
+        queue = self.db_scan_trendline_queue(LineConfig.SCAN_COUNT)
+        if queue is False:
+            return
+        self.seed_last_price(self.load_queue(queue))
+        self.line_feed.stale = False
+
+    def load_queue(self, queue):
+        """
+        :param queue: {queue key: dict(trendline)} TRENDLINE_QUEUE 전체
+        :return: last price 를 모르는 신규 line key 목록
+        """
+        for _key in [i for i in self.engine.keys if i not in queue]:
+            self.remove_line(_key)
+        self.reconciled_at = time()
+        return [_key for _key, order in queue.items() if self.set_line(_key, order)]
+
+    def set_line(self, _key, order):
+        """
+        trendline 추가/갱신, 기존 line 과 조건이 같으면 마지막 기록 가격 유지
+        :return: True (last price 를 모르는 신규 line) / False
+        """
+        if order['symbol'] not in self.ticksize:
+            log.warning('LINE_UNKNOWN_SYMBOL', _key=order['symbol'], member=_key, symbol=order['symbol'])
+            self.remove_line(_key)
+            return False
+        row = self.engine.rows.get(_key)
+        if (row is not None) and (self.engine.symbols[row] == order['symbol']) and \
+                (self.engine.direction[row] == order['direction']) and \
+                ((self.engine.start_date[row], self.engine.end_date[row], self.engine.start_price[row], self.engine.end_price[row]) ==
+                 (order['startDate'], order['endDate'], order['tradingStartPrice'], order['tradingEndPrice'])):
+            return False
+        tick = self.ticksize[order['symbol']]
+        self.engine.add(_key, order, tick['tick'], tick['length'])
+        self.schedule.push(_key, 0)
+        return True
+
+    def remove_line(self, _key):
+        self.engine.remove(_key)
+        self.schedule.discard(_key)
+
+    def seed_items(self, keys):
+        """
+        :return: [(symbol, direction, member), ...] WATCHER_LIST score 조회 대상
+        """
+        rows = [self.engine.rows[_key] for _key in keys]
+        return [(self.engine.symbols[row], int(self.engine.direction[row]), self.engine.keys[row]) for row in rows]
+
+    def seed_last_price(self, keys, scores=None):
+        """
+        신규 line 의 마지막 기록 가격을 WATCHER_LIST score 로 채워 재시작 후 같은 값을 다시 쓰지 않도록 함
+        :param scores: 이미 조회한 keys 순서의 score, None 이면 조회
+        """
+        if not keys:
+            return
+        if scores is None:
+            scores = self.db_get_watcher_scores(self.seed_items(keys))
+        if scores is False:
+            return
+        for _key, score in zip(keys, scores):
+            row = self.engine.rows.get(_key)
+            if (row is not None) and (score is not None):
+                self.engine.last_price[row] = float(score)
 
     @except_console
     def price_update(self):
-        _now = get_unixtime()
-        for _id, order in self.db_get_trendline_queue().items():
-            order = json.loads(order)
-            calc_price = trendline_trigger_calc(_now, **order)
-            current_price = round_coin(calc_price, self.ticksize[order['symbol']]['tick'],
-                                       self.ticksize[order['symbol']]['length']) + order['direction'] * self.ticksize[order['symbol']]['tick']
-            if order['currentPrice'] != current_price:
+        """
+        다음 deadline 까지 (새 line 이 들어오면 즉시) 대기 후 deadline 이 지난 line 만 재계산
+        """
+        deadline = self.schedule.peek()
+        wait = LineConfig.MAX_WAIT_SEC if deadline is None else (deadline - get_unixtime_ms()) / 1000
+        self.sync_lines(min(max(wait, 0), LineConfig.MAX_WAIT_SEC))
+
+        _now = get_unixtime_ms()
+        started = time()
+        groups, schedule = self.line_changes(_now)
+        self.metrics.set('watcher_lines', len(self.engine))
+        if not schedule:
+            return
+        failed = set()
+        for symbol, direction, row, new in groups:
+            if self.db_change_score(symbol, direction, row, new) is not False:
+                self.commit_scores(row)
+            else:
+                failed.update(row)
+        self.reschedule(schedule, _now, failed)
+        self.metrics.inc('watcher_line_writes_total', sum(len(row) for _, _, row, _ in groups))
+        self.metrics.observe('watcher_line_cycle_seconds', time() - started)
+
+    def line_changes(self, _now):
+        """
+        deadline 이 지난 line 의 가격을 계산
+        :return: (groups [(symbol, direction, {key: price}, 신규 key 목록), ...], schedule [(key, 다음 변경 시간), ...])
+        """
+        due = [self.engine.rows[_key] for _key in self.schedule.pop_due(_now) if _key in self.engine]
+        if not due:
+            return [], []
+        rows, prices = self.engine.changed(_now, due)
+        groups = []
+        for (symbol, direction), row in self.engine.group(rows, prices).items():
+            new = [_key for _key in row if math.isnan(self.engine.last_price[self.engine.rows[_key]])]
+            groups.append((symbol, direction, row, new))
+        schedule = [(self.engine.keys[row], next_time)
+                    for row, next_time in zip(due, self.engine.next_change(_now, due).tolist())]
+        return groups, schedule
+
+    def commit_scores(self, row):
+        """
+        기록한 가격을 last price 로 반영 (기록 중 삭제된 line 은 제외)
+        :param row: {key: price}
+        """
+        keys = [_key for _key in row if _key in self.engine]
+        self.engine.commit([self.engine.rows[_key] for _key in keys], [row[_key] for _key in keys])
 
-                self.set_score_list[order['symbol']][order['direction']][_id] = current_price
-        for symbol, rows in self.set_score_list.items():
-            for direction, row in rows.items():
-                self.db_change_score(symbol, direction, row)
+    def reschedule(self, schedule, _now, failed):
+        for _key, next_time in schedule:
+            if _key not in self.engine:
+                continue
+            if _key in failed:
+                self.schedule.push(_key, _now + LineConfig.RETRY_MS)
+            elif next_time != float('inf'):
+                self.schedule.push(_key, next_time)
+
+
+class IndicatorWatcher(BaseDb):
+    """
+    strategy indicator 주문 판단
+    symbol_kline 의 candle 이 마감되면 구독중인 indicator key 를 한번씩만 갱신 (IndicatorEngine) 하고,
+    모든 indicator 의 signal 이 주문 방향으로 바뀐 주문을 POST_ORDER 에 등록
+    PriceWatcher 가 candle 을 집계하는 process 안에서 on_candles 를 호출하고, 새 indicator 는 같은 CandleStore 로 warm
+    """
+    def __init__(self, store, metrics=None):
+        super().__init__()
+        self.engine = IndicatorEngine()
+        self.metrics = metrics or Metrics('indicator_watcher')
+        self.store = store
+
+    def history(self, _symbol_kline, before=None):
+        """
+        새 indicator key 를 warm 할 이전 candle 목록 (오래된 순)
+        :param before: 이 시간 (candle ts) 이전의 candle 만, on_candles 로 전달될 candle 이 두번 반영되지 않도록
+        """
+        candles = self.store.candles(_symbol_kline)
+        if before is not None:
+            candles = [candle for candle in candles if candle.ts < before]
+        return candles
+
+    @except_console
+    def sync_orders(self, _symbol_kline, before=None):
+        """
+        INDICATOR_SET 구독 목록을 engine 에 반영, 새 주문만 MTS3_ORDER_LIST 에서 조회
+        새 indicator 는 before 이전 history 로 warm 하고, 새 주문의 마지막 판단을 warm 된 상태로 채움
+        """
+        members = self.db_get_indicator_members(_symbol_kline)
+        if members is False:
+            return False
+        known = self.engine.orders.get(_symbol_kline, {})
+        ids = {_id for members_of in members.values() for _id in members_of if _id not in known}
+        orders = self.db_get_indicator_orders(_symbol_kline, list(ids))
+        if orders is False:
+            return False
+        added = self.engine.subscribe(_symbol_kline, members, orders)
+        if added:
+            history = self.history(_symbol_kline, before)
+            for key in added:
+                self.engine.warm(_symbol_kline, key, history)
+        if orders:
+            self.engine.seed(_symbol_kline, list(orders))
+        self.metrics.set('watcher_indicator_keys', len(self.engine.indicators[_symbol_kline]), symbol_kline=_symbol_kline)
+        return True
+
+    @except_console
+    def on_candles(self, _symbol_kline, candles):
+        """
+        :param _symbol_kline: 'BTC-USDT_15'
+        :param candles: [Candle, ...] 새로 마감된 candle (오래된 순)
+        :return: POST_ORDER 에 등록된 ['id=action', ...]
+        """
+        if self.sync_orders(_symbol_kline, candles[0].ts) is False:
+            return []
+        fired = []
+        for candle in candles:
+            fired.extend(self.engine.update(_symbol_kline, candle))
+        self.metrics.inc('watcher_indicator_updates_total', len(candles) * len(self.engine.indicators[_symbol_kline]))
+        if not fired:
+            return []
+        symbol = _symbol_kline.rsplit('_', 1)[0]
+        res = self.db_post_orders([(order.id, symbol, order.action) for order in fired]) or []
+        self.engine.remove(_symbol_kline, [order.id for order in fired])
+        self.metrics.inc('watcher_fired_total', len(res))
+        return res
 
 
 if __name__ == "__main__":
-    logger = logging.getLogger('WatchDog')
-    logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=('process', 'asyncio'), default=RuntimeConfig.MODE)
+    args = parser.parse_args()
+    setup_logging('watchdog' if args.mode == 'process' else 'asyncio')
     while True:
-        o = WatchDog()
+        if args.mode == 'asyncio':
+            from async_watchdog import AsyncWatchDog
+            o = AsyncWatchDog()
+        else:
+            o = WatchDog()
         o.run()
         sleep(3)
-        print('Watchdog restart')
+        log.warning('WATCHDOG_RESTART')
 